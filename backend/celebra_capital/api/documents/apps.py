@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class DocumentsConfig(AppConfig):
+    name = 'celebra_capital.api.documents'
+    verbose_name = 'Documentos'
+
+    def ready(self):
+        from prometheus_client import REGISTRY
+        from celebra_capital.api.documents.metrics import OcrBacklogCollector
+
+        REGISTRY.register(OcrBacklogCollector())
@@ -0,0 +1,160 @@
+"""
+Arquivo frio de resultados OCR
+
+Resultados removidos pela política de retenção são gravados antes da
+exclusão em arquivos JSONL comprimidos com gzip no storage padrão (S3 em
+produção), um arquivo por lote, nomeados pela faixa de IDs:
+
+    <OCR_ARCHIVE_PREFIX>/AAAA/MM/DD/ocr_results_<primeiro_id>-<ultimo_id>.jsonl.gz
+
+Cada linha é um objeto no formato do serializador "python" do Django, o que
+permite restaurar os registros com a chave primária e as datas originais. As
+respostas completas dos motores (OcrRawPayload) dos mesmos documentos vão no
+arquivo do lote, depois dos resultados; o conteúdo binário é gravado em base64.
+"""
+import datetime
+import gzip
+import io
+import json
+import posixpath
+from django.conf import settings
+from django.core import serializers
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+ARCHIVE_SUFFIX = '.jsonl.gz'
+
+
+class ArchiveJSONEncoder(DjangoJSONEncoder):
+    """Preserva os microssegundos das datas (o DjangoJSONEncoder os trunca)"""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def is_archive_enabled():
+    """Indica se os resultados devem ser arquivados antes da exclusão"""
+    return getattr(settings, 'OCR_ARCHIVE_ENABLED', True)
+
+
+def get_prefix():
+    return getattr(settings, 'OCR_ARCHIVE_PREFIX', 'ocr_archive').strip('/')
+
+
+def write_archive(results, payloads=()):
+    """
+    Grava um lote de OcrResult em um arquivo JSONL comprimido
+
+    Args:
+        results: lista de OcrResult ordenada por id
+        payloads: OcrRawPayload dos documentos do lote
+
+    Returns:
+        Nome do arquivo no storage.
+    """
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb') as gz:
+        for record in serializers.serialize('python', list(results) + list(payloads)):
+            gz.write(json.dumps(record, cls=ArchiveJSONEncoder, ensure_ascii=False).encode('utf-8'))
+            gz.write(b'\n')
+
+    name = posixpath.join(
+        get_prefix(),
+        timezone.now().strftime('%Y/%m/%d'),
+        f'ocr_results_{results[0].pk}-{results[-1].pk}{ARCHIVE_SUFFIX}'
+    )
+    stored_name = default_storage.save(name, ContentFile(buffer.getvalue()))
+
+    logger.info(
+        "Lote de resultados OCR arquivado",
+        archive=stored_name,
+        records=len(results),
+        payloads=len(payloads),
+        compressed_bytes=buffer.tell()
+    )
+    return stored_name
+
+
+def read_archive(name):
+    """Gera os registros (formato do serializador "python") de um arquivo"""
+    with default_storage.open(name, 'rb') as f:
+        with gzip.GzipFile(fileobj=f, mode='rb') as gz:
+            for line in gz:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+
+def list_archives(path=None):
+    """Lista recursivamente os arquivos de um diretório do arquivo frio"""
+    path = path or get_prefix()
+    try:
+        directories, files = default_storage.listdir(path)
+    except (FileNotFoundError, OSError):
+        return []
+
+    names = [posixpath.join(path, name) for name in sorted(files) if name.endswith(ARCHIVE_SUFFIX)]
+    for directory in sorted(directories):
+        names.extend(list_archives(posixpath.join(path, directory)))
+    return names
+
+
+def _record_document_id(record):
+    # OcrRawPayload usa o documento como chave primária
+    if record['model'] == 'documents.ocrrawpayload':
+        return record['pk']
+    return record['fields']['document']
+
+
+def restore_records(records, document_ids=None, dry_run=False):
+    """
+    Restaura registros arquivados de OcrResult e OcrRawPayload
+
+    Registros cujo documento não existe mais, ou cujo documento já possui o
+    registro (resultado OCR ou resposta completa), são ignorados.
+
+    Args:
+        records: iterável de registros lidos por read_archive
+        document_ids: restringe a restauração a estes documentos
+        dry_run: apenas contabiliza, sem gravar
+
+    Returns:
+        Tupla (restored, skipped).
+    """
+    from .models import Document, OcrRawPayload, OcrResult
+
+    records = [
+        record for record in records
+        if document_ids is None or _record_document_id(record) in document_ids
+    ]
+    if not records:
+        return 0, 0
+
+    referenced = {_record_document_id(record) for record in records}
+    existing_documents = set(Document.objects.filter(id__in=referenced).values_list('id', flat=True))
+    already_present = {
+        model: set(model.objects.filter(document_id__in=referenced).values_list('document_id', flat=True))
+        for model in (OcrResult, OcrRawPayload)
+    }
+
+    restored = 0
+    skipped = 0
+    for deserialized in serializers.deserialize('python', records):
+        document_id = deserialized.object.document_id
+        present = already_present[type(deserialized.object)]
+        if document_id not in existing_documents or document_id in present:
+            skipped += 1
+            continue
+        if not dry_run:
+            deserialized.save()
+        present.add(document_id)
+        restored += 1
+
+    return restored, skipped
@@ -0,0 +1,226 @@
+"""
+Coletor de lotes para OCR com Google Vision (batch annotate)
+
+Documentos pendentes são acumulados em uma lista no Redis e enviados em uma
+única requisição batch_annotate_images quando o lote atinge OCR_BATCH_MAX_SIZE
+itens ou quando a janela de OCR_BATCH_WINDOW_MS milissegundos se encerra.
+
+O envio retira os documentos da lista pendente movendo-os para uma lista de
+processamento do próprio envio (ocr:batch:processing:<task_id>), de onde
+saem conforme cada resultado é gravado ou reenviado. Se o worker cair no
+meio do envio, a mensagem reentregue (acks_late, mesmo task_id) retoma a
+mesma lista; listas abandonadas há mais de PROCESSING_TIMEOUT_SECONDS voltam
+ao início da lista pendente no próximo envio.
+"""
+import time
+from django.conf import settings
+import structlog
+
+from .redis_client import get_redis
+
+logger = structlog.get_logger(__name__)
+
+PENDING_KEY = 'ocr:batch:pending'
+WINDOW_KEY = 'ocr:batch:window'
+PROCESSING_KEY_PREFIX = 'ocr:batch:processing:'
+# Envios com lista de processamento, por horário da retirada
+PROCESSING_INDEX_KEY = 'ocr:batch:processing_index'
+
+# Acima do time_limit de flush_ocr_batch: a lista só é retomada após a tarefa morrer
+PROCESSING_TIMEOUT_SECONDS = 600
+
+# Retoma a lista de processamento do envio (reentrega) ou move para ela até
+# ARGV[1] documentos do início da lista pendente
+POP_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[2], 0, -1)
+if #items == 0 then
+    for i = 1, tonumber(ARGV[1]) do
+        local item = redis.call('LPOP', KEYS[1])
+        if not item then
+            break
+        end
+        redis.call('RPUSH', KEYS[2], item)
+        items[#items + 1] = item
+    end
+end
+if #items > 0 then
+    redis.call('ZADD', KEYS[3], ARGV[3], ARGV[2])
+end
+return {items, redis.call('LLEN', KEYS[1])}
+"""
+
+# Devolve a lista de processamento ao início da lista pendente, preservando a ordem
+REQUEUE_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[2], 0, -1)
+for i = #items, 1, -1 do
+    redis.call('LPUSH', KEYS[1], items[i])
+end
+redis.call('DEL', KEYS[2])
+redis.call('ZREM', KEYS[3], ARGV[1])
+return #items
+"""
+
+# Limite da API síncrona do Google Vision por requisição
+VISION_MAX_BATCH_SIZE = 16
+
+
+def is_batch_enabled():
+    """Indica se o modo de envio em lote está ativo"""
+    return getattr(settings, 'OCR_BATCH_ENABLED', False) and getattr(settings, 'USE_GOOGLE_VISION', False)
+
+
+def get_max_batch_size():
+    return max(1, min(getattr(settings, 'OCR_BATCH_MAX_SIZE', VISION_MAX_BATCH_SIZE), VISION_MAX_BATCH_SIZE))
+
+
+def get_window_ms():
+    return max(1, getattr(settings, 'OCR_BATCH_WINDOW_MS', 500))
+
+
+def enqueue(document_id):
+    """
+    Adiciona um documento ao lote em formação
+
+    Agenda o envio imediato quando o lote está cheio, ou ao fim da janela de
+    coleta quando este é o primeiro documento da janela.
+    """
+    from .lanes import LANE_STANDARD
+    from .tasks import flush_ocr_batch
+
+    redis_conn = get_redis()
+    window_ms = get_window_ms()
+
+    pending = redis_conn.rpush(PENDING_KEY, document_id)
+
+    if pending >= get_max_batch_size():
+        flush_ocr_batch.apply_async(queue=LANE_STANDARD)
+    elif redis_conn.set(WINDOW_KEY, 1, nx=True, px=window_ms):
+        flush_ocr_batch.apply_async(countdown=window_ms / 1000.0, queue=LANE_STANDARD)
+
+    logger.debug("Documento adicionado ao lote OCR", document_id=document_id, pending=pending)
+    return pending
+
+
+def _processing_key(owner):
+    return f'{PROCESSING_KEY_PREFIX}{owner}'
+
+
+def pop_batch(owner):
+    """
+    Move atomicamente até OCR_BATCH_MAX_SIZE documentos do lote para a lista
+    de processamento do envio owner (task_id de flush_ocr_batch)
+
+    Se a lista do envio já existir (mensagem reentregue), ela é retomada.
+    Retorna a lista de IDs retirados e quantos documentos continuam pendentes.
+    """
+    redis_conn = get_redis()
+
+    # Encerrar a janela atual: novos documentos abrem uma nova janela
+    redis_conn.delete(WINDOW_KEY)
+
+    items, remaining = redis_conn.eval(
+        POP_SCRIPT, 3,
+        PENDING_KEY, _processing_key(owner), PROCESSING_INDEX_KEY,
+        get_max_batch_size(), owner, time.time()
+    )
+    return [int(item) for item in items], remaining
+
+
+def ack(owner, document_ids):
+    """Remove da lista de processamento documentos já gravados ou reenviados"""
+    if not document_ids:
+        return
+    pipe = get_redis().pipeline(transaction=False)
+    for document_id in document_ids:
+        pipe.lrem(_processing_key(owner), 0, document_id)
+    pipe.execute()
+
+
+def release(owner):
+    """Encerra o envio owner, descartando sua lista de processamento"""
+    pipe = get_redis().pipeline(transaction=True)
+    pipe.delete(_processing_key(owner))
+    pipe.zrem(PROCESSING_INDEX_KEY, owner)
+    pipe.execute()
+
+
+def push_back(owner):
+    """
+    Devolve os documentos do envio owner ao início do lote pendente,
+    preservando a ordem
+
+    Usado quando o lote não pôde ser enviado por limite de taxa.
+    """
+    return get_redis().eval(
+        REQUEUE_SCRIPT, 3, PENDING_KEY, _processing_key(owner), PROCESSING_INDEX_KEY, owner
+    )
+
+
+def recover_abandoned():
+    """
+    Devolve à lista pendente os documentos de envios interrompidos há mais de
+    PROCESSING_TIMEOUT_SECONDS
+
+    Returns:
+        Quantidade de documentos devolvidos.
+    """
+    redis_conn = get_redis()
+    owners = redis_conn.zrangebyscore(
+        PROCESSING_INDEX_KEY, '-inf', time.time() - PROCESSING_TIMEOUT_SECONDS
+    )
+
+    recovered = 0
+    for owner in owners:
+        owner = owner.decode() if isinstance(owner, bytes) else owner
+        recovered += push_back(owner)
+
+    if recovered:
+        logger.warning("Documentos de lotes OCR interrompidos devolvidos ao lote", documents=recovered, batches=len(owners))
+    return recovered
+
+
+def annotate_batch(client, contents):
+    """
+    Envia várias imagens em uma única requisição batch_annotate_images
+
+    Args:
+        client: cliente Google Vision (real ou FakeVisionClient)
+        contents: lista de bytes das imagens, na ordem do lote
+
+    Returns:
+        Lista, na mesma ordem, de tuplas (full_text, error_message, payload),
+        com a resposta completa de cada imagem em payload (ver payloads.py).
+    """
+    from google.cloud import vision
+    from . import payloads
+
+    requests = [
+        vision.AnnotateImageRequest(
+            image=vision.Image(content=content),
+            features=[vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)],
+        )
+        for content in contents
+    ]
+
+    response = client.batch_annotate_images(requests=requests)
+
+    store_payloads = payloads.is_enabled()
+    results = []
+    for image_response in response.responses:
+        if image_response.error.message:
+            results.append((None, image_response.error.message, None))
+            continue
+        payload = payloads.response_to_dict(image_response) if store_payloads else None
+        if image_response.text_annotations:
+            results.append((image_response.text_annotations[0].description, None, payload))
+        else:
+            results.append(('', None, payload))
+    return results
+
+
+def read_document_content(document):
+    """Lê o conteúdo pré-processado do arquivo de um documento"""
+    from .preprocessing import prepare_image
+
+    content, _ = prepare_image(document.file.path)
+    return content
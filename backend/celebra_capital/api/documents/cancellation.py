@@ -0,0 +1,69 @@
+"""
+Cancelamento cooperativo do OCR
+
+Excluir um documento não revoga a tarefa Celery (revoke com terminate faz
+broadcast a todos os workers e mata o processo no meio de uma gravação).
+A view apenas grava um token no Redis (ocr:cancel:<document_id>) e retorna;
+as tarefas o verificam nos pontos seguros do pipeline (início da tarefa,
+entre as etapas, entre as páginas de um PDF, nas continuações do OCR
+simulado e na montagem dos lotes) e encerram antes da chamada ao motor,
+limpando o progresso e liberando a vaga da faixa padrão.
+
+O token expira após CANCEL_TTL; documentos marcados como excluídos no banco
+também são tratados como cancelados, mesmo sem o token.
+"""
+import structlog
+
+from .redis_client import get_redis
+
+logger = structlog.get_logger(__name__)
+
+# Tempo de vida do token: cobre mensagens que ainda estejam na fila ou em espera
+CANCEL_TTL = 24 * 60 * 60
+
+
+class OcrCancelled(Exception):
+    """Interrompe o OCR de um documento cancelado no meio de uma etapa"""
+
+
+def _key(document_id):
+    return f'ocr:cancel:{document_id}'
+
+
+def request_cancel(document_id):
+    """
+    Grava o token de cancelamento do OCR do documento
+
+    Returns:
+        True se o token foi gravado. Em falha do Redis, as tarefas ainda
+        encerram ao encontrar o documento excluído no banco.
+    """
+    try:
+        get_redis().set(_key(document_id), 1, ex=CANCEL_TTL)
+        return True
+    except Exception as e:
+        logger.warning("Erro ao gravar cancelamento do OCR", error=str(e), document_id=document_id)
+        return False
+
+
+def is_cancelled(document_id, document=None):
+    """
+    Indica se o OCR do documento foi cancelado
+
+    Args:
+        document: instância já carregada, se houver (evita consultar o Redis
+            quando ela já está marcada como excluída)
+    """
+    if document is not None and document.is_deleted:
+        return True
+    try:
+        return bool(get_redis().exists(_key(document_id)))
+    except Exception as e:
+        logger.warning("Erro ao verificar cancelamento do OCR", error=str(e), document_id=document_id)
+        return False
+
+
+def check(document_id):
+    """Levanta OcrCancelled se o OCR do documento foi cancelado"""
+    if is_cancelled(document_id):
+        raise OcrCancelled(f"OCR do documento {document_id} cancelado")
@@ -5,8 +5,8 @@ from channels.db import database_sync_to_async
 from django.contrib.auth.models import User
 from django.shortcuts import get_object_or_404
 from .models import Document, OcrResult
-from celery.result import AsyncResult
-from django.utils import timezone
+from . import lanes, proposal_ocr
+from . import progress as ocr_progress
 
 logger = logging.getLogger(__name__)
 
@@ -108,96 +108,42 @@ class OcrConsumer(AsyncWebsocketConsumer):
     @database_sync_to_async
     def get_ocr_status(self):
         try:
-            document = Document.objects.get(id=self.document_id)
+            # Status em cache (ver progress.py): sem consultas ao banco nem ao Celery
+            state = ocr_progress.get_status(int(self.document_id), self.scope["user"].id)
             
-            try:
-                ocr_result = OcrResult.objects.get(document=document)
-                
-                if ocr_result.ocr_complete:
-                    return {
-                        'complete': True,
-                        'progress': 100,
-                        'task_status': 'SUCCESS',
-                        'message': 'Processamento OCR concluído'
-                    }
-                
-                # Verificar status da tarefa Celery se tiver task_id
-                if ocr_result.task_id:
-                    task_result = AsyncResult(ocr_result.task_id)
-                    task_status = task_result.state
-                    
-                    # Mapear estado da tarefa para progresso
-                    progress_mapping = {
-                        'PENDING': 10,
-                        'STARTED': 30,
-                        'RETRY': 40,
-                        'SUCCESS': 100,
-                        'FAILURE': 0,
-                        'REVOKED': 0
-                    }
-                    
-                    # Usar o progresso armazenado no banco ou o mapeado pelo status
-                    progress = ocr_result.current_progress or progress_mapping.get(task_status, 50)
-                    
-                    # Se a tarefa falhou, informar isso no status
-                    if task_status == 'FAILURE':
-                        return {
-                            'complete': False,
-                            'progress': 0,
-                            'task_status': 'FAILURE',
-                            'message': 'Falha no processamento OCR',
-                            'retry_count': ocr_result.retry_count
-                        }
-                        
-                    return {
-                        'complete': task_status == 'SUCCESS',
-                        'progress': progress,
-                        'task_status': task_status,
-                        'retry_count': ocr_result.retry_count
-                    }
+            if state is not None:
+                if state['complete'] and state['task_status'] != 'FAILURE':
+                    message = 'Processamento OCR concluído'
+                elif state['task_status'] == 'FAILURE':
+                    message = state['message'] or 'Falha no processamento OCR'
                 else:
-                    # Calcular progresso com base no tempo decorrido
-                    time_since_created = (timezone.now() - ocr_result.created_at).total_seconds()
-                    # Limite o progresso a 90% para tarefas sem task_id
-                    progress = min(int(time_since_created / 20 * 100), 90)
-                    
-                    return {
-                        'complete': False,
-                        'progress': progress,
-                        'message': 'Processamento em andamento'
-                    }
-                    
-            except OcrResult.DoesNotExist:
-                # Não existe resultado de OCR para este documento
-                from .tasks import process_document_ocr
-                
-                # Iniciar processamento automaticamente
-                task = process_document_ocr.apply_async(
-                    args=[document.id],
-                    queue='ocr'
-                )
-                
-                # Criar registro para acompanhamento
-                OcrResult.objects.create(
-                    document=document,
-                    ocr_complete=False,
-                    task_id=task.id,
-                    task_status='PENDING',
-                    current_progress=0
-                )
-                
-                logger.info(
-                    "Processamento OCR iniciado através do WebSocket",
-                    document_id=document.id,
-                    task_id=task.id
-                )
+                    message = state['message']
                 
                 return {
-                    'complete': False,
-                    'progress': 5,
-                    'task_status': 'PENDING',
-                    'message': 'Processamento OCR iniciado'
+                    'complete': state['complete'],
+                    'progress': state['progress'],
+                    'task_status': state['task_status'],
+                    'message': message,
+                    'retry_count': state['retry_count']
                 }
+            
+            # Não existe resultado de OCR para este documento
+            # Iniciar processamento automaticamente
+            document = Document.objects.get(id=self.document_id)
+            ocr_result = lanes.start_ocr(document, lanes.LANE_INTERACTIVE)
+            
+            logger.info(
+                "Processamento OCR iniciado através do WebSocket",
+                document_id=document.id,
+                task_id=ocr_result.task_id
+            )
+            
+            return {
+                'complete': False,
+                'progress': 5,
+                'task_status': 'PENDING',
+                'message': 'Processamento OCR iniciado'
+            }
                 
         except Exception as e:
             logger.error(f"Erro ao obter status OCR: {str(e)}")
@@ -226,26 +172,14 @@ class OcrConsumer(AsyncWebsocketConsumer):
                     }
                 
                 # Preparar para novo processamento
-                from .tasks import process_document_ocr
-                
-                task = process_document_ocr.apply_async(
-                    args=[document.id],
-                    queue='ocr',
-                    priority=1  # Alta prioridade por ser solicitação explícita
-                )
-                
-                # Atualizar resultado OCR
-                ocr_result.task_id = task.id
-                ocr_result.task_status = 'PENDING'
-                ocr_result.ocr_complete = False
+                # Faixa interativa: reprocessamento solicitado pelo usuário conectado
                 ocr_result.retry_count += 1
-                ocr_result.current_progress = 0
-                ocr_result.save()
+                ocr_result = lanes.start_ocr(document, lanes.LANE_INTERACTIVE, ocr_result)
                 
                 logger.info(
                     "Processamento OCR reiniciado manualmente",
                     document_id=document.id,
-                    task_id=task.id,
+                    task_id=ocr_result.task_id,
                     retry_count=ocr_result.retry_count
                 )
                 
@@ -256,26 +190,12 @@ class OcrConsumer(AsyncWebsocketConsumer):
                 
             except OcrResult.DoesNotExist:
                 # Não existe resultado, iniciar processamento
-                from .tasks import process_document_ocr
-                
-                task = process_document_ocr.apply_async(
-                    args=[document.id],
-                    queue='ocr'
-                )
-                
-                # Criar registro para acompanhamento
-                OcrResult.objects.create(
-                    document=document,
-                    ocr_complete=False,
-                    task_id=task.id,
-                    task_status='PENDING',
-                    current_progress=0
-                )
+                ocr_result = lanes.start_ocr(document, lanes.LANE_INTERACTIVE)
                 
                 logger.info(
                     "Primeiro processamento OCR iniciado manualmente",
                     document_id=document.id,
-                    task_id=task.id
+                    task_id=ocr_result.task_id
                 )
                 
                 return {
@@ -288,4 +208,60 @@ class OcrConsumer(AsyncWebsocketConsumer):
             return {
                 'success': False,
                 'message': f'Erro: {str(e)}'
-            } 
\ No newline at end of file
+            } 
+
+
+class ProposalOcrConsumer(AsyncWebsocketConsumer):
+    """
+    Evento único de documentos da proposta prontos (ver proposal_ocr.py)
+    
+    Ao conectar envia o estado atual; ao fim do chord da proposta recebe a
+    validação agregada do conjunto de documentos.
+    """
+    async def connect(self):
+        self.proposal_id = self.scope['url_route']['kwargs']['proposal_id']
+        self.room_group_name = f'proposal_ocr_{self.proposal_id}'
+        
+        if self.scope["user"].is_anonymous or not await self.check_proposal_access():
+            await self.close()
+            return
+        
+        await self.channel_layer.group_add(
+            self.room_group_name,
+            self.channel_name
+        )
+        
+        await self.accept()
+        
+        state = await database_sync_to_async(proposal_ocr.get_summary)(int(self.proposal_id))
+        await self.send(text_data=json.dumps({
+            'type': 'proposal_ocr_status',
+            'status': state['status'] if state else None,
+            'summary': state.get('summary') if state else None
+        }))
+    
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(
+            self.room_group_name,
+            self.channel_name
+        )
+    
+    async def proposal_documents_ready(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'proposal_documents_ready',
+            'summary': event['summary']
+        }))
+    
+    @database_sync_to_async
+    def check_proposal_access(self):
+        from celebra_capital.api.proposals.models import Proposal
+        
+        try:
+            user = self.scope["user"]
+            queryset = Proposal.objects.filter(id=self.proposal_id)
+            if not user.is_staff:
+                queryset = queryset.filter(user_id=user.id)
+            return queryset.exists()
+        except Exception as e:
+            logger.error(f"Erro ao verificar acesso à proposta: {str(e)}")
+            return False
@@ -0,0 +1,270 @@
+"""
+Upload direto de documentos para o storage de objetos (S3)
+
+Com o storage de mídia no S3 (USE_S3), o cliente pode enviar o arquivo
+diretamente ao bucket, sem que os bytes passem pelo processo Django:
+
+1. POST /documents/upload/direct/ com tipo, nome, tamanho, content-type e
+   SHA-256 do arquivo: a sessão de upload é gravada no Redis e a resposta
+   traz uma URL PUT pré-assinada. Tamanho, content-type e checksum fazem
+   parte da assinatura, e o S3 recusa um conteúdo com SHA-256 diferente.
+2. O cliente envia o arquivo com PUT para a URL, com os cabeçalhos indicados.
+3. POST /documents/upload/direct/<upload_id>/complete/: o objeto é conferido
+   (tamanho e checksum pelos metadados, tipo real pelos primeiros bytes) e o
+   Document é criado, com o OCR enviado como no upload comum.
+
+Sessões não concluídas expiram no Redis; objetos recusados na conclusão são
+removidos do bucket.
+"""
+import base64
+import binascii
+import hashlib
+import json
+import posixpath
+import uuid
+from django.conf import settings
+from django.utils.text import get_valid_filename
+from rest_framework import status
+import structlog
+
+from . import uploads
+from .redis_client import get_redis
+
+logger = structlog.get_logger(__name__)
+
+
+def _key(upload_id):
+    return f'upload:direct:{upload_id}'
+
+
+def get_storage():
+    from .models import Document
+
+    return Document._meta.get_field('file').storage
+
+
+def is_enabled():
+    # Requer um storage S3 (django-storages), que expõe o bucket e o cliente boto3
+    return getattr(settings, 'DOCUMENT_DIRECT_UPLOAD_ENABLED', True) and hasattr(get_storage(), 'bucket_name')
+
+
+def get_expiry():
+    """Validade da URL pré-assinada, em segundos"""
+    return getattr(settings, 'DOCUMENT_DIRECT_UPLOAD_EXPIRES_SECONDS', 900)
+
+
+def _client(storage):
+    return storage.connection.meta.client
+
+
+def _object_key(storage, name):
+    # Chave no bucket do nome do FileField (prefixo AWS_LOCATION, se houver)
+    location = getattr(storage, 'location', '')
+    return posixpath.join(location, name) if location else name
+
+
+def _checksum_b64(sha256_hex):
+    # O S3 recebe o SHA-256 em base64; o cliente informa em hexadecimal, como Document.file_hash
+    try:
+        digest = bytes.fromhex(sha256_hex)
+    except (TypeError, ValueError):
+        digest = b''
+    if len(digest) != 32:
+        raise uploads.UploadRejected("SHA-256 inválido", status.HTTP_400_BAD_REQUEST)
+    return base64.b64encode(digest).decode()
+
+
+def create_upload(user, document_type, file_name, file_size, content_type, sha256, proposal_id=None):
+    """
+    Abre uma sessão de upload direto e gera a URL PUT pré-assinada
+
+    Raises:
+        uploads.UploadRejected: tipo não aceito, tamanho acima do limite ou
+            checksum inválido.
+
+    Returns:
+        Dicionário com upload_id, url, method, headers e expires_in.
+    """
+    from .models import Document
+
+    storage = get_storage()
+    size_limit = uploads.get_size_limit(content_type or '')
+    if size_limit is None:
+        raise uploads.UploadRejected(
+            f"Tipo de arquivo não suportado: {content_type}",
+            status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+        )
+    if not 0 < file_size <= size_limit:
+        raise uploads.UploadRejected(
+            f"Tamanho inválido: o máximo para o tipo {content_type} é {size_limit / (1024 * 1024):g} MB",
+            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE if file_size > 0 else status.HTTP_400_BAD_REQUEST
+        )
+    checksum = _checksum_b64(sha256)
+
+    upload_id = uuid.uuid4().hex
+    name = Document._meta.get_field('file').generate_filename(
+        None, f"{upload_id}_{get_valid_filename(file_name) or 'documento'}"
+    )
+    expires_in = get_expiry()
+
+    url = _client(storage).generate_presigned_url(
+        'put_object',
+        Params={
+            'Bucket': storage.bucket_name,
+            'Key': _object_key(storage, name),
+            'ContentType': content_type,
+            'ContentLength': file_size,
+            'ChecksumSHA256': checksum,
+        },
+        ExpiresIn=expires_in
+    )
+
+    get_redis().set(_key(upload_id), json.dumps({
+        'user_id': user.id,
+        'proposal_id': proposal_id,
+        'document_type': document_type,
+        'name': name,
+        'file_name': file_name,
+        'file_size': file_size,
+        'content_type': content_type,
+        'sha256': sha256.lower(),
+    }), ex=expires_in + 3600)
+
+    logger.info(
+        "Upload direto iniciado",
+        upload_id=upload_id,
+        user_id=user.id,
+        document_type=document_type,
+        file_size=file_size
+    )
+    return {
+        'upload_id': upload_id,
+        'url': url,
+        'method': 'PUT',
+        # Cabeçalhos assinados: o PUT deve enviá-los com estes valores
+        'headers': {
+            'Content-Type': content_type,
+            'x-amz-checksum-sha256': checksum,
+        },
+        'expires_in': expires_in,
+    }
+
+
+def get_session(upload_id):
+    raw = get_redis().get(_key(upload_id))
+    return json.loads(raw) if raw else None
+
+
+def _delete_object(storage, name):
+    try:
+        storage.delete(name)
+    except Exception as e:
+        logger.warning("Erro ao remover objeto de upload direto recusado", error=str(e), name=name)
+
+
+def _stream_sha256(client, bucket, key):
+    # Storages compatíveis sem checksums (S3 local em testes): hash lido do objeto, em blocos
+    sha256 = hashlib.sha256()
+    for chunk in client.get_object(Bucket=bucket, Key=key)['Body'].iter_chunks(uploads.STREAM_CHUNK_SIZE):
+        sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def verify_object(session):
+    """
+    Confere o objeto enviado contra a sessão
+
+    Tamanho e checksum vêm dos metadados do objeto (HEAD); o tipo real é
+    detectado nos primeiros bytes (GET parcial), sem baixar o arquivo. Se o
+    storage não informar o checksum, o objeto é lido para calculá-lo.
+
+    Raises:
+        uploads.UploadRejected: objeto ausente ou diferente do anunciado
+            (objetos divergentes são removidos do bucket).
+
+    Returns:
+        Tipo MIME detectado.
+    """
+    from botocore.exceptions import ClientError
+
+    storage = get_storage()
+    client = _client(storage)
+    key = _object_key(storage, session['name'])
+
+    try:
+        head = client.head_object(Bucket=storage.bucket_name, Key=key, ChecksumMode='ENABLED')
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            raise uploads.UploadRejected("Arquivo ainda não enviado", status.HTTP_409_CONFLICT)
+        raise
+
+    checksum = head.get('ChecksumSHA256')
+    try:
+        checksum_hex = base64.b64decode(checksum).hex() if checksum else None
+    except (binascii.Error, ValueError):
+        checksum_hex = None
+    if checksum_hex is None and head.get('ContentLength') == session['file_size']:
+        logger.warning("Storage sem checksum do objeto, calculando pelo conteúdo", key=key)
+        checksum_hex = _stream_sha256(client, storage.bucket_name, key)
+
+    problem = None
+    if head.get('ContentLength') != session['file_size']:
+        problem = "Tamanho do arquivo enviado difere do informado"
+    elif checksum_hex != session['sha256']:
+        problem = "Checksum do arquivo enviado difere do informado"
+    else:
+        header = client.get_object(
+            Bucket=storage.bucket_name, Key=key, Range=f'bytes=0-{uploads.SNIFF_BYTES - 1}'
+        )['Body'].read()
+        mime_type = uploads.sniff_mime_type(header)
+        if uploads.get_size_limit(mime_type) is None:
+            problem = f"Tipo de arquivo não suportado: {mime_type}"
+
+    if problem:
+        _delete_object(storage, session['name'])
+        raise uploads.UploadRejected(problem, status.HTTP_400_BAD_REQUEST)
+    return mime_type
+
+
+def complete_upload(upload_id, user):
+    """
+    Conclui um upload direto: confere o objeto e cria o Document
+
+    Raises:
+        uploads.UploadRejected: sessão inexistente (ou de outro usuário),
+            objeto não enviado ou divergente, ou conclusão concorrente.
+
+    Returns:
+        Document criado (o OCR é enviado pela view, como no upload comum).
+    """
+    from .models import Document
+
+    session = get_session(upload_id)
+    if session is None or session['user_id'] != user.id:
+        raise uploads.UploadRejected("Upload não encontrado ou expirado", status.HTTP_404_NOT_FOUND)
+
+    mime_type = verify_object(session)
+
+    # A sessão é consumida uma única vez: outra conclusão simultânea não cria um segundo documento
+    if not get_redis().delete(_key(upload_id)):
+        raise uploads.UploadRejected("Upload já concluído", status.HTTP_409_CONFLICT)
+
+    document = Document.objects.create(
+        user=user,
+        proposal_id=session['proposal_id'],
+        document_type=session['document_type'],
+        file=session['name'],
+        file_name=session['file_name'],
+        mime_type=mime_type,
+        file_size=session['file_size'],
+        file_hash=session['sha256'],
+    )
+
+    logger.info(
+        "Upload direto concluído",
+        upload_id=upload_id,
+        document_id=document.id,
+        user_id=user.id,
+        file_size=document.file_size
+    )
+    return document
@@ -0,0 +1,359 @@
+"""
+Motores de OCR plugáveis
+
+Cada motor recebe os bytes de uma imagem e devolve o texto reconhecido. O motor
+usado é escolhido por tipo de documento (OCR_ENGINES_BY_DOCUMENT_TYPE) e os
+motores de OCR_ENGINE_FALLBACKS são tentados, em ordem, quando o principal falha
+(por exemplo, quando o Google Vision está limitando requisições).
+"""
+import functools
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from celery.signals import worker_process_shutdown
+from django.conf import settings
+import structlog
+
+from . import ratelimit
+
+logger = structlog.get_logger(__name__)
+
+# Espera (s) antes de reagendar um documento após um erro de quota do provedor
+QUOTA_RETRY_AFTER = 5.0
+
+
+class OcrEngineError(Exception):
+    """Falha de um motor de OCR ao reconhecer uma imagem"""
+
+
+class OcrQuotaError(OcrEngineError):
+    """O provedor recusou a chamada por quota ou limite de requisições"""
+
+
+class OcrThrottledError(OcrEngineError):
+    """
+    Nenhum motor pôde ser chamado agora por limite de taxa
+
+    A tarefa deve ser reagendada após retry_after segundos.
+    """
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class OcrEngine:
+    """
+    Interface comum dos motores de OCR
+    """
+    name = None
+
+    def recognize(self, content, document_type=None):
+        """
+        Reconhece o texto de uma imagem
+
+        Args:
+            content: bytes da imagem
+            document_type: tipo do documento (alguns motores ajustam o comportamento)
+
+        Returns:
+            Texto completo reconhecido (string vazia se nenhum texto foi encontrado).
+
+        Raises:
+            OcrEngineError: se o motor não conseguiu processar a imagem.
+        """
+        raise NotImplementedError
+
+    def recognize_many(self, contents, document_type=None):
+        """Reconhece várias imagens; os motores podem paralelizar esta chamada"""
+        return [self.recognize(content, document_type) for content in contents]
+
+    def recognize_detailed(self, content, document_type=None):
+        """
+        Reconhece o texto e devolve também a resposta completa do motor
+
+        Returns:
+            Tupla (texto, payload); payload é None nos motores sem resposta
+            detalhada (ver payloads.py).
+        """
+        return self.recognize(content, document_type), None
+
+    def get_version(self):
+        """Versão do motor gravada junto ao texto reconhecido, ou None"""
+        return None
+
+
+def _package_version(distribution):
+    from importlib import metadata
+
+    try:
+        return f"{distribution} {metadata.version(distribution)}"
+    except metadata.PackageNotFoundError:
+        return None
+
+
+# Código gRPC de quota esgotada em AnnotateImageResponse.error
+RESOURCE_EXHAUSTED = 8
+
+
+def is_quota_exception(exc):
+    """Indica se a exceção do cliente Google corresponde a quota/limite de requisições (429)"""
+    try:
+        from google.api_core import exceptions as google_exceptions
+    except ImportError:
+        return False
+    return isinstance(exc, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests))
+
+
+class VisionEngine(OcrEngine):
+    """Google Vision usando o cliente aquecido do processo do worker"""
+    name = 'vision'
+
+    def recognize(self, content, document_type=None):
+        return self._text(self._annotate(content))
+
+    def recognize_detailed(self, content, document_type=None):
+        from . import payloads
+
+        response = self._annotate(content)
+        payload = payloads.response_to_dict(response) if payloads.is_enabled() else None
+        return self._text(response), payload
+
+    def _annotate(self, content):
+        from google.cloud import vision
+        from .vision_client import get_vision_client
+
+        try:
+            response = get_vision_client().text_detection(image=vision.Image(content=content))
+        except Exception as e:
+            if is_quota_exception(e):
+                raise OcrQuotaError(f"Quota do Google Vision API excedida: {str(e)}") from e
+            raise OcrEngineError(f"Erro no Google Vision API: {str(e)}") from e
+
+        if response.error.message:
+            if response.error.code == RESOURCE_EXHAUSTED:
+                raise OcrQuotaError(f"Quota do Google Vision API excedida: {response.error.message}")
+            raise OcrEngineError(f"Erro no Google Vision API: {response.error.message}")
+        return response
+
+    @staticmethod
+    def _text(response):
+        texts = response.text_annotations
+        if not texts:
+            return ''
+        # O primeiro elemento contém todo o texto
+        return texts[0].description
+
+    def get_version(self):
+        return _package_version('google-cloud-vision')
+
+
+def _tesseract_image_to_string(content, lang, config, timeout):
+    """
+    Executado nas threads do pool: o pytesseract roda o binário tesseract em
+    um subprocesso, então as threads não disputam o GIL durante o OCR
+    """
+    import pytesseract
+    from PIL import Image
+
+    with Image.open(io.BytesIO(content)) as image:
+        return pytesseract.image_to_string(image, lang=lang, config=config, timeout=timeout)
+
+
+class TesseractEngine(OcrEngine):
+    """
+    Tesseract local executado em um ThreadPoolExecutor limitado
+
+    Os processos do pool prefork do Celery são daemônicos e não podem criar
+    processos filhos de multiprocessing; o paralelismo vem dos subprocessos
+    do binário tesseract, disparados pelas threads. O pool é criado sob
+    demanda em cada processo do worker e reutilizado entre tarefas;
+    OCR_TESSERACT_MAX_WORKERS limita as execuções simultâneas.
+    """
+    name = 'tesseract'
+
+    _executor = None
+    _executor_pid = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_executor(cls):
+        with cls._lock:
+            if cls._executor is None or cls._executor_pid != os.getpid():
+                max_workers = getattr(settings, 'OCR_TESSERACT_MAX_WORKERS', None) or os.cpu_count() or 1
+                # Threads não sobrevivem a um fork: um pool herdado do processo pai é recriado
+                cls._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tesseract')
+                cls._executor_pid = os.getpid()
+            return cls._executor
+
+    @classmethod
+    def shutdown(cls):
+        with cls._lock:
+            if cls._executor is not None and cls._executor_pid == os.getpid():
+                cls._executor.shutdown(wait=False, cancel_futures=True)
+            cls._executor = None
+            cls._executor_pid = None
+
+    def _options(self):
+        lang = getattr(settings, 'OCR_TESSERACT_LANG', 'por')
+        config = getattr(settings, 'OCR_TESSERACT_CONFIG', '')
+        return lang, config
+
+    def recognize(self, content, document_type=None):
+        return self.recognize_many([content], document_type)[0]
+
+    def get_version(self):
+        import pytesseract
+
+        lang, _ = self._options()
+        try:
+            return f"tesseract {pytesseract.get_tesseract_version()} ({lang})"
+        except Exception:
+            return None
+
+    def recognize_many(self, contents, document_type=None):
+        lang, config = self._options()
+        timeout = getattr(settings, 'OCR_TESSERACT_TIMEOUT', 120)
+        futures = []
+        try:
+            executor = self.get_executor()
+            futures = [
+                executor.submit(_tesseract_image_to_string, content, lang, config, timeout)
+                for content in contents
+            ]
+            return [future.result() for future in futures]
+        except Exception as e:
+            for future in futures:
+                future.cancel()
+            raise OcrEngineError(f"Erro no Tesseract: {str(e)}") from e
+
+
+# Textos devolvidos pelo motor falso, com os mesmos campos usados por simulate_ocr
+FAKE_TEXTS = {
+    'rg': "REGISTRO GERAL\nNome: Nome do Usuário\nRG 12.345.678-9\nNascimento 01/01/1980\nFiliação: José da Silva e Maria da Silva",
+    'cpf': "CADASTRO DE PESSOAS FÍSICAS\nNome: Nome do Usuário\nCPF 123.456.789-00",
+    'proof_income': "Empresa: Nome do Órgão\nSalário R$ 5.000,00\nData de pagamento 01/01/2023",
+    'address_proof': "Rua Exemplo, 123\nCEP 01234-567\nSão Paulo - SP",
+}
+
+
+class FakeEngine(OcrEngine):
+    """
+    Motor determinístico, sem rede, para desenvolvimento e CI
+    """
+    name = 'fake'
+
+    def recognize(self, content, document_type=None):
+        return FAKE_TEXTS.get(document_type, "Documento de teste")
+
+    def get_version(self):
+        return 'fake 1'
+
+
+ENGINES = {
+    VisionEngine.name: VisionEngine,
+    TesseractEngine.name: TesseractEngine,
+    FakeEngine.name: FakeEngine,
+}
+
+
+def get_engine(name):
+    """Instancia um motor pelo nome"""
+    try:
+        return ENGINES[name]()
+    except KeyError:
+        raise OcrEngineError(f"Motor de OCR desconhecido: {name}")
+
+
+@functools.lru_cache(maxsize=None)
+def get_engine_version(name):
+    """Versão de um motor, calculada uma vez por processo"""
+    try:
+        return get_engine(name).get_version()
+    except Exception as e:
+        logger.warning("Erro ao obter versão do motor de OCR", engine=name, error=str(e))
+        return None
+
+
+def get_engine_chain(document_type):
+    """
+    Retorna os nomes dos motores a tentar, em ordem, para um tipo de documento
+
+    Lista vazia indica que nenhum motor está configurado (OCR simulado).
+    """
+    by_type = getattr(settings, 'OCR_ENGINES_BY_DOCUMENT_TYPE', {}) or {}
+    primary = by_type.get(document_type) or getattr(settings, 'OCR_ENGINE_DEFAULT', None)
+
+    chain = [primary] if primary else []
+    for fallback in getattr(settings, 'OCR_ENGINE_FALLBACKS', []) or []:
+        if fallback and fallback not in chain:
+            chain.append(fallback)
+    return chain
+
+
+def recognize(content, document_type, chain=None):
+    """
+    Reconhece o texto tentando os motores da cadeia em ordem
+
+    Returns:
+        Tupla (full_text, engine_name) do primeiro motor que teve sucesso.
+
+    Raises:
+        OcrEngineError: se todos os motores falharem.
+    """
+    full_text, engine_name, _ = recognize_detailed(content, document_type, chain)
+    return full_text, engine_name
+
+
+def recognize_detailed(content, document_type, chain=None):
+    """
+    Como recognize, devolvendo também a resposta completa do motor
+
+    Returns:
+        Tupla (full_text, engine_name, payload).
+    """
+    if chain is None:
+        chain = get_engine_chain(document_type)
+
+    errors = []
+    retry_after = None
+    for name in chain:
+        limited = ratelimit.is_limited(name)
+        try:
+            engine = get_engine(name)
+            if limited:
+                ratelimit.acquire(name)
+            text, payload = engine.recognize_detailed(content, document_type)
+        except ratelimit.RateLimitExceeded as e:
+            errors.append(f"{name}: {str(e)}")
+            retry_after = min(retry_after or e.retry_after, e.retry_after)
+            logger.info("Motor de OCR no limite de taxa, tentando próximo", engine=name, retry_after=e.retry_after)
+            continue
+        except OcrEngineError as e:
+            if limited and isinstance(e, OcrQuotaError):
+                ratelimit.record_quota_error(name)
+                retry_after = min(retry_after or QUOTA_RETRY_AFTER, QUOTA_RETRY_AFTER)
+            errors.append(f"{name}: {str(e)}")
+            logger.warning(
+                "Motor de OCR falhou, tentando próximo",
+                engine=name,
+                error=str(e),
+                document_type=document_type
+            )
+            continue
+
+        if limited:
+            ratelimit.record_success(name)
+        return text, name, payload
+
+    if retry_after is not None:
+        # Limite de taxa ou quota: reagendar em vez de consumir retentativas
+        raise OcrThrottledError("Motores de OCR no limite de taxa: " + "; ".join(errors), retry_after)
+    raise OcrEngineError("Todos os motores de OCR falharam: " + "; ".join(errors))
+
+
+@worker_process_shutdown.connect
+def shutdown_tesseract_pool(**kwargs):
+    """Encerra o pool do Tesseract ao finalizar o processo do worker"""
+    TesseractEngine.shutdown()
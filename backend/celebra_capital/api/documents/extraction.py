@@ -0,0 +1,208 @@
+"""
+Motor de extração de campos por tabela de regras
+
+Cada tipo de documento tem um conjunto de regras em JSON (extraction_rules/).
+As regras são compiladas uma única vez e avaliadas em uma só passada sobre as
+linhas do texto reconhecido. Para cada linha vale a primeira regra cuja
+condição é satisfeita; valores encontrados em linhas posteriores substituem
+os anteriores.
+
+Formato de uma regra:
+    field: campo preenchido
+    when: lista de cláusulas alternativas; uma cláusula é satisfeita quando
+        todas as suas condições são verdadeiras:
+            keywords: alguma palavra ocorre na linha em minúsculas
+            keywords_case_sensitive: alguma palavra ocorre na linha original
+            min_length / max_length: limites do tamanho da linha
+    value: "line" (a linha, sem os trechos de remove) ou "match" (o trecho
+        encontrado por pattern; sem ocorrência o campo não é alterado)
+
+Cada conjunto de regras tem uma versão ("version"), gravada em
+OcrResult.extractor_version. Ao alterar as regras de um tipo, incremente a
+versão e execute o comando reextract_ocr para reaplicá-las ao texto bruto já
+armazenado, sem chamar o motor de OCR.
+"""
+import json
+import os
+import re
+from django.conf import settings
+
+# Diretório padrão com os conjuntos de regras
+RULES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'extraction_rules')
+
+
+def _compile_keywords(keywords):
+    if not keywords:
+        return None
+    return re.compile('|'.join(re.escape(keyword) for keyword in keywords))
+
+
+class Clause:
+    """Condição de ativação de uma regra"""
+
+    __slots__ = ('keywords', 'keywords_case_sensitive', 'min_length', 'max_length')
+
+    def __init__(self, data):
+        self.keywords = _compile_keywords(data.get('keywords'))
+        self.keywords_case_sensitive = _compile_keywords(data.get('keywords_case_sensitive'))
+        self.min_length = data.get('min_length')
+        self.max_length = data.get('max_length')
+
+    def matches(self, line, lowered, length):
+        if self.min_length is not None and length < self.min_length:
+            return False
+        if self.max_length is not None and length > self.max_length:
+            return False
+        if self.keywords is not None and self.keywords.search(lowered) is None:
+            return False
+        if self.keywords_case_sensitive is not None and self.keywords_case_sensitive.search(line) is None:
+            return False
+        return True
+
+
+class Rule:
+    """Regra compilada que preenche um campo"""
+
+    __slots__ = ('field', 'clauses', 'value', 'pattern', 'remove')
+
+    def __init__(self, data):
+        self.field = data['field']
+        self.clauses = [Clause(clause) for clause in data['when']]
+        self.value = data.get('value', 'line')
+        self.pattern = re.compile(data['pattern']) if data.get('pattern') else None
+        self.remove = tuple(data.get('remove', ()))
+
+        if self.value not in ('line', 'match'):
+            raise ValueError(f"Tipo de valor inválido na regra de '{self.field}': {self.value}")
+        if self.value == 'match' and self.pattern is None:
+            raise ValueError(f"Regra de '{self.field}' do tipo match exige pattern")
+
+    def applies(self, line, lowered, length):
+        for clause in self.clauses:
+            if clause.matches(line, lowered, length):
+                return True
+        return False
+
+    def extract(self, line):
+        if self.value == 'match':
+            match = self.pattern.search(line)
+            return match.group() if match else None
+
+        for fragment in self.remove:
+            line = line.replace(fragment, '')
+        return line.strip()
+
+
+class RuleSet:
+    """Conjunto de regras compilado de um tipo de documento"""
+
+    def __init__(self, data):
+        self.document_type = data['document_type']
+        self.version = data.get('version', 1)
+        self.confidence = data.get('confidence', 0.70)
+        self.fields = list(data['fields'])
+        self.rules = [Rule(rule) for rule in data['rules']]
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def extract(self, text):
+        """Extrai os campos do texto em uma única passada pelas linhas"""
+        data = dict.fromkeys(self.fields, '')
+        rules = self.rules
+
+        for line in text.split('\n'):
+            line = line.strip()
+            lowered = line.lower()
+            length = len(line)
+
+            for rule in rules:
+                if rule.applies(line, lowered, length):
+                    value = rule.extract(line)
+                    if value is not None:
+                        data[rule.field] = value
+                    break
+
+        return data
+
+
+_rule_sets = None
+
+
+def get_rules_dir():
+    return getattr(settings, 'OCR_EXTRACTION_RULES_DIR', None) or RULES_DIR
+
+
+def load_rule_sets(rules_dir=None):
+    """Carrega e compila todos os conjuntos de regras de um diretório"""
+    rules_dir = rules_dir or get_rules_dir()
+    rule_sets = {}
+    for file_name in sorted(os.listdir(rules_dir)):
+        if file_name.endswith('.json'):
+            rule_set = RuleSet.from_file(os.path.join(rules_dir, file_name))
+            rule_sets[rule_set.document_type] = rule_set
+    return rule_sets
+
+
+def get_rule_sets():
+    """Conjuntos de regras compilados, carregados uma vez por processo"""
+    global _rule_sets
+    if _rule_sets is None:
+        _rule_sets = load_rule_sets()
+    return _rule_sets
+
+
+def get_rule_set(document_type):
+    return get_rule_sets().get(document_type)
+
+
+def get_version(document_type, rule_sets=None):
+    """Versão das regras de um tipo de documento (0 para tipos sem regras)"""
+    rule_set = (rule_sets if rule_sets is not None else get_rule_sets()).get(document_type)
+    return rule_set.version if rule_set is not None else 0
+
+
+def extract_versioned(document_type, text, rule_sets=None):
+    """
+    Extrai os campos de um texto e informa a versão das regras aplicadas
+
+    Retorna uma tupla (extracted_data, confidence_score, version). Tipos sem
+    conjunto de regras recebem apenas o texto completo (versão 0).
+    """
+    rule_set = (rule_sets if rule_sets is not None else get_rule_sets()).get(document_type)
+    if rule_set is None:
+        return {"full_text": text}, 0.70, 0
+    return rule_set.extract(text), rule_set.confidence, rule_set.version
+
+
+def extract(document_type, text):
+    """
+    Extrai os campos de um texto conforme o tipo de documento
+
+    Retorna uma tupla (extracted_data, confidence_score).
+    """
+    extracted_data, confidence_score, _ = extract_versioned(document_type, text)
+    return extracted_data, confidence_score
+
+
+# Regras compiladas nos processos do pool de reextração (sem Django)
+_worker_rule_sets = None
+
+
+def init_worker(rules_dir):
+    """Inicializador dos processos do pool: compila as regras uma vez por processo"""
+    global _worker_rule_sets
+    _worker_rule_sets = load_rule_sets(rules_dir)
+
+
+def extract_item(item):
+    """
+    Executado nos processos do pool: extrai um item (result_id, document_type, text)
+
+    Returns:
+        Tupla (result_id, extracted_data, confidence_score, version).
+    """
+    result_id, document_type, text = item
+    return (result_id,) + extract_versioned(document_type, text, _worker_rule_sets)
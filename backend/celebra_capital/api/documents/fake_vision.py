@@ -0,0 +1,93 @@
+"""
+Cliente Google Vision falso para desenvolvimento e testes offline
+
+Imita a interface usada pelo pipeline (text_detection e batch_annotate_images)
+e devolve respostas com os mesmos tipos da biblioteca oficial, sem acesso à rede.
+Habilitado com GOOGLE_VISION_USE_FAKE=True.
+"""
+import threading
+from google.cloud import vision
+
+# Texto devolvido quando o conteúdo da imagem não é texto legível
+DEFAULT_TEXT = "DOCUMENTO DE TESTE\nNome: Fulano de Tal"
+
+
+def default_responder(content):
+    """
+    Resposta padrão: arquivos de texto (UTF-8) são devolvidos como o próprio
+    texto reconhecido, o que permite montar fixtures legíveis.
+    """
+    try:
+        return content.decode('utf-8')
+    except UnicodeDecodeError:
+        return DEFAULT_TEXT
+
+
+class FakeVisionError(Exception):
+    """Erro simulado por imagem, convertido em AnnotateImageResponse.error"""
+
+    def __init__(self, message, code=13):
+        super().__init__(message)
+        self.code = code
+
+
+class FakeVisionClient:
+    """
+    Substituto local de vision.ImageAnnotatorClient
+
+    Args:
+        responder: função que recebe os bytes da imagem e retorna o texto
+            reconhecido. Pode levantar FakeVisionError para simular falha
+            de uma imagem específica (falha parcial em lotes).
+        fail_requests: se True, as chamadas falham inteiras (erro de transporte).
+    """
+
+    def __init__(self, responder=None, fail_requests=False):
+        self.responder = responder or default_responder
+        self.fail_requests = fail_requests
+        self.request_count = 0
+        self.image_count = 0
+        self._lock = threading.Lock()
+
+    def _annotate(self, content):
+        try:
+            text = self.responder(content)
+        except FakeVisionError as e:
+            return vision.AnnotateImageResponse(error={'code': e.code, 'message': str(e)})
+
+        if not text:
+            return vision.AnnotateImageResponse()
+
+        return vision.AnnotateImageResponse(
+            text_annotations=[vision.EntityAnnotation(description=text)],
+            full_text_annotation=vision.TextAnnotation(text=text),
+        )
+
+    def _register_call(self, images):
+        with self._lock:
+            self.request_count += 1
+            self.image_count += images
+        if self.fail_requests:
+            raise ConnectionError("Falha simulada na chamada ao Google Vision")
+
+    def text_detection(self, image=None, **kwargs):
+        self._register_call(1)
+        return self._annotate(image.content)
+
+    def document_text_detection(self, image=None, **kwargs):
+        return self.text_detection(image=image, **kwargs)
+
+    def batch_annotate_images(self, requests=None, **kwargs):
+        requests = requests or []
+        self._register_call(len(requests))
+        return vision.BatchAnnotateImagesResponse(
+            responses=[self._annotate(request.image.content) for request in requests]
+        )
+
+    class _Transport:
+        def close(self):
+            pass
+
+    @property
+    def transport(self):
+        return self._Transport()
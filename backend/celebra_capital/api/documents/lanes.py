@@ -0,0 +1,307 @@
+"""
+Faixas de processamento OCR e admissão justa por cliente
+
+Cada faixa é uma fila Celery própria, consumida por um pool de workers
+dedicado (ver docker-compose.yml):
+
+- ocr_interactive: usuário aguardando o resultado (validação, reprocessamento
+  explícito); nunca espera atrás de backlog em massa.
+- ocr_standard: uploads e envios em lote.
+- ocr_retry: reprocessamentos (tarefas travadas, falhas, erros em lote).
+
+Na faixa padrão, cada usuário tem no máximo OCR_FAIR_MAX_IN_FLIGHT_PER_USER
+documentos na fila do broker ao mesmo tempo; os demais aguardam em uma
+lista própria no Redis e são liberados um a um, conforme os anteriores
+terminam. Assim a fila do broker intercala os clientes (round-robin) e um
+cliente enviando 40 arquivos não atrasa os demais. Os reenvios de tarefas
+travadas passam pela mesma admissão (com envio na faixa ocr_retry), e os
+documentos em espera ficam registrados em WAITING_KEY para que a varredura
+de tarefas travadas não os trate como perdidos.
+
+Arquivos acima de OCR_LARGE_FILE_THRESHOLD_MB têm as etapas que carregam o
+conteúdo (pré-processamento e reconhecimento) enviadas à fila ocr_large,
+consumida por um pool com pouca concorrência: alguns documentos grandes não
+disputam a memória dos workers das faixas.
+"""
+import time
+from celery import uuid
+from django.conf import settings
+import structlog
+
+from .redis_client import get_redis
+
+logger = structlog.get_logger(__name__)
+
+LANE_INTERACTIVE = 'ocr_interactive'
+LANE_STANDARD = 'ocr_standard'
+LANE_RETRY = 'ocr_retry'
+LANES = (LANE_INTERACTIVE, LANE_STANDARD, LANE_RETRY)
+
+# Fila das etapas que carregam o conteúdo de arquivos grandes (não é uma faixa de prioridade)
+LARGE_FILE_QUEUE = 'ocr_large'
+
+OWNER_KEY = 'ocr:fair:owner'
+USERS_KEY = 'ocr:fair:users'
+WAITING_KEY = 'ocr:fair:waiting_documents'
+
+# Admite o documento se o usuário tiver vaga (ou se o documento já ocupa uma,
+# caso de um reenvio); senão o coloca na lista de espera
+ADMIT_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[5])
+if redis.call('ZSCORE', KEYS[1], ARGV[1]) or redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[3]) then
+    redis.call('ZADD', KEYS[1], ARGV[4], ARGV[1])
+    redis.call('EXPIRE', KEYS[1], 86400)
+    redis.call('HSET', KEYS[3], ARGV[1], ARGV[6])
+    redis.call('HDEL', KEYS[5], ARGV[1])
+    return 1
+end
+redis.call('RPUSH', KEYS[2], ARGV[2])
+redis.call('SADD', KEYS[4], ARGV[6])
+redis.call('HSET', KEYS[5], ARGV[1], ARGV[6])
+return 0
+"""
+
+# Libera a vaga do documento e admite os próximos da lista de espera do usuário
+RELEASE_SCRIPT = """
+if ARGV[1] ~= '' then
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    redis.call('HDEL', KEYS[3], ARGV[1])
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[5])
+local admitted = {}
+while redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[4]) do
+    local item = redis.call('LPOP', KEYS[2])
+    if not item then
+        break
+    end
+    local document_id = string.match(item, '^([^:]+)')
+    redis.call('ZADD', KEYS[1], ARGV[3], document_id)
+    redis.call('HSET', KEYS[3], document_id, ARGV[2])
+    redis.call('HDEL', KEYS[5], document_id)
+    table.insert(admitted, item)
+end
+redis.call('EXPIRE', KEYS[1], 86400)
+if redis.call('LLEN', KEYS[2]) == 0 then
+    redis.call('SREM', KEYS[4], ARGV[2])
+end
+return admitted
+"""
+
+
+def _inflight_key(user_id):
+    return f'ocr:fair:inflight:{user_id}'
+
+
+def _waiting_key(user_id):
+    return f'ocr:fair:waiting:{user_id}'
+
+
+def get_max_in_flight():
+    return max(1, getattr(settings, 'OCR_FAIR_MAX_IN_FLIGHT_PER_USER', 2))
+
+
+def _stale_before(now):
+    # Vagas não liberadas (worker perdido) expiram após este tempo
+    return now - getattr(settings, 'OCR_FAIR_SLOT_TIMEOUT', 900)
+
+
+def get_large_file_threshold():
+    """Tamanho (em bytes) a partir do qual um documento é considerado grande"""
+    return int(getattr(settings, 'OCR_LARGE_FILE_THRESHOLD_MB', 10) * 1024 * 1024)
+
+
+def is_large_file(document):
+    return bool(document.file_size) and document.file_size >= get_large_file_threshold()
+
+
+def current_lane(task, default=LANE_STANDARD):
+    """Faixa da qual a tarefa em execução foi consumida"""
+    delivery_info = getattr(task.request, 'delivery_info', None) or {}
+    lane = delivery_info.get('routing_key')
+    return lane if lane in LANES else default
+
+
+def ocr_signature(document_id, lane, task_id=None, **kwargs):
+    """Assinatura de process_document_ocr na fila da faixa, para envio direto ou em chord"""
+    from .tasks import process_document_ocr
+
+    if lane == LANE_INTERACTIVE:
+        # Sem janela de coleta em lote: o usuário está aguardando
+        kwargs.setdefault('allow_batch', False)
+
+    return process_document_ocr.signature(
+        args=[document_id],
+        kwargs=kwargs,
+        task_id=task_id,
+        queue=lane,
+        immutable=True
+    )
+
+
+def dispatch(document_id, lane, task_id=None, **kwargs):
+    """Envia process_document_ocr diretamente para a fila da faixa"""
+    return ocr_signature(document_id, lane, task_id=task_id, **kwargs).apply_async()
+
+
+def submit_ocr(document, lane=LANE_STANDARD, task_id=None, fair=False):
+    """
+    Agenda o OCR de um documento na faixa indicada
+
+    Na faixa padrão (ou com fair=True, usado nos reenvios pela faixa de
+    retentativas) o envio passa pela admissão justa por usuário e pode
+    ficar aguardando vaga; o task_id é gerado antecipadamente e já pode ser
+    gravado em OcrResult.
+
+    Returns:
+        task_id da tarefa (enviada ou em espera).
+    """
+    task_id = task_id or uuid()
+    if lane != LANE_STANDARD and not fair:
+        return dispatch(document.id, lane, task_id=task_id).id
+
+    now = time.time()
+    try:
+        admitted = get_redis().eval(
+            ADMIT_SCRIPT, 5,
+            _inflight_key(document.user_id), _waiting_key(document.user_id), OWNER_KEY, USERS_KEY, WAITING_KEY,
+            document.id, f'{document.id}:{task_id}:{lane}', get_max_in_flight(), now, _stale_before(now),
+            document.user_id
+        )
+    except Exception as e:
+        logger.warning("Admissão justa indisponível, enviando diretamente", error=str(e), document_id=document.id)
+        admitted = 1
+
+    if admitted:
+        dispatch(document.id, lane, task_id=task_id)
+    else:
+        logger.info(
+            "Documento aguardando vaga na faixa OCR padrão",
+            document_id=document.id,
+            user_id=document.user_id,
+            task_id=task_id,
+            lane=lane
+        )
+    return task_id
+
+
+def prepare_ocr(document, ocr_result=None):
+    """
+    Cria (ou reinicia) o OcrResult do documento com um novo task_id, sem enviar a tarefa
+
+    O registro e o status em cache (ver progress.py) são gravados antes do
+    envio, pois a tarefa pode começar imediatamente. Quem reinicia um
+    resultado existente deve ajustar retry_count antes da chamada.
+
+    Returns:
+        OcrResult com o task_id da tarefa a enviar.
+    """
+    from .models import OcrResult
+    from . import progress as ocr_progress
+
+    task_id = uuid()
+    if ocr_result is None:
+        ocr_result = OcrResult.objects.create(
+            document=document,
+            ocr_complete=False,
+            task_id=task_id,
+            task_status='PENDING',
+            current_progress=0
+        )
+    else:
+        ocr_result.task_id = task_id
+        ocr_result.task_status = 'PENDING'
+        ocr_result.ocr_complete = False
+        ocr_result.current_progress = 0
+        # Reprocessamento explícito: refazer todas as etapas, sem retomar checkpoints
+        ocr_result.pipeline_stage = None
+        ocr_result.save(update_fields=[
+            'task_id', 'task_status', 'ocr_complete', 'current_progress', 'retry_count', 'pipeline_stage',
+            'updated_at'
+        ])
+
+    ocr_progress.store_status(ocr_result, document.user_id)
+    return ocr_result
+
+
+def start_ocr(document, lane=LANE_STANDARD, ocr_result=None):
+    """
+    Cria (ou reinicia) o OcrResult do documento e agenda o OCR na faixa indicada
+
+    Returns:
+        OcrResult com o task_id da nova tarefa.
+    """
+    ocr_result = prepare_ocr(document, ocr_result)
+    submit_ocr(document, lane, task_id=ocr_result.task_id)
+    return ocr_result
+
+
+def _admit_waiting(user_id, document_id=''):
+    from django.utils import timezone
+    from .models import OcrResult
+
+    now = time.time()
+    items = get_redis().eval(
+        RELEASE_SCRIPT, 5,
+        _inflight_key(user_id), _waiting_key(user_id), OWNER_KEY, USERS_KEY, WAITING_KEY,
+        document_id, user_id, now, get_max_in_flight(), _stale_before(now)
+    )
+    for item in items:
+        # "documento:task_id:faixa" (entradas sem faixa são da faixa padrão)
+        parts = (item.decode() if isinstance(item, bytes) else item).split(':')
+        waiting_document_id, task_id = int(parts[0]), parts[1]
+        lane = parts[2] if len(parts) > 2 else LANE_STANDARD
+        # O tempo em espera não conta para a varredura de tarefas travadas
+        OcrResult.objects.filter(document_id=waiting_document_id, task_id=task_id).update(updated_at=timezone.now())
+        dispatch(waiting_document_id, lane, task_id=task_id)
+    return len(items)
+
+
+def release(document_id):
+    """
+    Libera a vaga de um documento que terminou de ser processado e envia o
+    próximo documento em espera do mesmo usuário
+    """
+    try:
+        user_id = get_redis().hget(OWNER_KEY, document_id)
+        if user_id is None:
+            return 0
+        return _admit_waiting(int(user_id), str(document_id))
+    except Exception as e:
+        logger.warning("Erro ao liberar vaga da faixa OCR padrão", error=str(e), document_id=document_id)
+        return 0
+
+
+def pump():
+    """
+    Admite documentos em espera de todos os usuários com vagas livres
+
+    Recupera a fila de espera quando vagas expiram sem liberação (worker
+    perdido). Executado pela varredura periódica de tarefas OCR.
+    """
+    admitted = 0
+    try:
+        user_ids = get_redis().smembers(USERS_KEY)
+    except Exception as e:
+        logger.warning("Erro ao ler usuários em espera na faixa OCR padrão", error=str(e))
+        return 0
+
+    for user_id in user_ids:
+        try:
+            admitted += _admit_waiting(int(user_id))
+        except Exception as e:
+            logger.warning("Erro ao admitir documentos em espera", error=str(e), user_id=user_id)
+    return admitted
+
+
+def get_waiting_documents(document_ids):
+    """Subconjunto dos documentos indicados que aguardam vaga na admissão justa"""
+    document_ids = list(document_ids)
+    if not document_ids:
+        return set()
+    owners = get_redis().hmget(WAITING_KEY, document_ids)
+    return {document_id for document_id, owner in zip(document_ids, owners) if owner is not None}
+
+
+def get_waiting_count(user_id):
+    """Documentos do usuário aguardando vaga na faixa padrão"""
+    return get_redis().llen(_waiting_key(user_id))
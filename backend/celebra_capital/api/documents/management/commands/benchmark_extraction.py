@@ -0,0 +1,132 @@
+"""
+Benchmark do motor de extração de campos
+
+Executa os conjuntos de regras sobre um corpus rotulado de textos de OCR e
+reporta a vazão (linhas/s) e a acurácia por campo, permitindo avaliar
+mudanças nas regras tanto em velocidade quanto em qualidade.
+
+Uso:
+    python manage.py benchmark_extraction
+    python manage.py benchmark_extraction --corpus meu_corpus.jsonl --iterations 200 --output resultado.json
+"""
+import json
+import os
+import time
+from collections import defaultdict
+from django.core.management.base import BaseCommand, CommandError
+
+from celebra_capital.api.documents import extraction
+
+DEFAULT_CORPUS = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    'benchmarks',
+    'extraction_corpus.jsonl'
+)
+
+
+def _normalize(value):
+    return ' '.join(str(value or '').split()).casefold()
+
+
+class Command(BaseCommand):
+    help = 'Mede vazão e acurácia da extração de campos sobre um corpus rotulado de textos OCR'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', default=DEFAULT_CORPUS,
+                            help='Arquivo JSONL com document_type, text e expected')
+        parser.add_argument('--rules-dir', default=None,
+                            help='Diretório alternativo com conjuntos de regras')
+        parser.add_argument('--iterations', type=int, default=100,
+                            help='Repetições do corpus na medição de vazão')
+        parser.add_argument('--output', default=None,
+                            help='Salvar o resultado em JSON neste caminho')
+
+    def handle(self, *args, **options):
+        samples = self._load_corpus(options['corpus'])
+        rule_sets = extraction.load_rule_sets(options['rules_dir']) if options['rules_dir'] else extraction.get_rule_sets()
+
+        def run(sample):
+            rule_set = rule_sets.get(sample['document_type'])
+            if rule_set is None:
+                return {}
+            return rule_set.extract(sample['text'])
+
+        # Acurácia por campo
+        hits = defaultdict(int)
+        totals = defaultdict(int)
+        failures = []
+        for sample in samples:
+            extracted = run(sample)
+            for field, expected in sample['expected'].items():
+                key = f"{sample['document_type']}.{field}"
+                totals[key] += 1
+                if _normalize(extracted.get(field)) == _normalize(expected):
+                    hits[key] += 1
+                else:
+                    failures.append({
+                        'field': key,
+                        'expected': expected,
+                        'extracted': extracted.get(field),
+                    })
+
+        # Vazão
+        lines_per_pass = sum(sample['text'].count('\n') + 1 for sample in samples)
+        iterations = max(1, options['iterations'])
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for sample in samples:
+                run(sample)
+        elapsed = time.perf_counter() - start
+        total_lines = lines_per_pass * iterations
+
+        field_accuracy = {key: hits[key] / totals[key] for key in sorted(totals)}
+        overall = sum(hits.values()) / sum(totals.values()) if totals else 0.0
+
+        result = {
+            'corpus': options['corpus'],
+            'samples': len(samples),
+            'iterations': iterations,
+            'lines': total_lines,
+            'seconds': elapsed,
+            'lines_per_second': total_lines / elapsed if elapsed else None,
+            'documents_per_second': len(samples) * iterations / elapsed if elapsed else None,
+            'rule_versions': {name: rule_set.version for name, rule_set in rule_sets.items()},
+            'field_accuracy': field_accuracy,
+            'overall_accuracy': overall,
+            'failures': failures,
+        }
+
+        self._print_report(result)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Resultado salvo em {options['output']}")
+
+    def _load_corpus(self, path):
+        if not os.path.exists(path):
+            raise CommandError(f"Corpus não encontrado: {path}")
+
+        samples = []
+        with open(path, encoding='utf-8') as f:
+            for number, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    samples.append(json.loads(line))
+                except json.JSONDecodeError as e:
+                    raise CommandError(f"Linha {number} inválida no corpus: {e}")
+
+        if not samples:
+            raise CommandError("Corpus vazio")
+        return samples
+
+    def _print_report(self, result):
+        self.stdout.write(f"Amostras: {result['samples']} x {result['iterations']} iterações")
+        self.stdout.write(f"Linhas/s: {result['lines_per_second']:,.0f}")
+        self.stdout.write(f"Documentos/s: {result['documents_per_second']:,.0f}")
+        self.stdout.write("Acurácia por campo:")
+        for key, accuracy in result['field_accuracy'].items():
+            self.stdout.write(f"  {key:<30} {accuracy:6.1%}")
+        self.stdout.write(self.style.SUCCESS(f"Acurácia geral: {result['overall_accuracy']:.1%}"))
@@ -0,0 +1,264 @@
+"""
+Benchmark de vazão do pipeline de OCR
+
+Reexecuta um diretório de documentos de exemplo através de
+process_document_ocr, no próprio processo e contra o banco configurado
+(SQLite ou Postgres), usando por padrão o motor local sem rede (fake).
+As etapas do pipeline (chain Celery) também rodam no próprio processo.
+Reporta documentos/s, latência ponta a ponta (p50/p95/p99), consultas e
+escritas no banco por documento, bytes lidos e mensagens enviadas à channel
+layer. O resultado em JSON permite comparar execuções entre commits.
+
+Os arquivos em subdiretórios com o nome de um tipo de documento (rg/, cpf/,
+...) são processados com esse tipo; os demais usam --document-type.
+
+Uso:
+    python manage.py benchmark_ocr amostras/
+    python manage.py benchmark_ocr amostras/ --iterations 5 --engine tesseract --output resultado.json
+"""
+import json
+import os
+import platform
+import subprocess
+import time
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from celebra_capital.api.documents.models import Document
+
+BENCHMARK_USERNAME = 'benchmark-ocr'
+
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE')
+
+
+def _percentile(sorted_values, percentile):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(percentile / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def _read_bytes():
+    """Bytes lidos pelo processo até agora (Linux, /proc/self/io), ou None"""
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('rchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class _ChannelMessageCounter:
+    """Conta as mensagens enviadas pela channel layer durante o benchmark"""
+
+    def __init__(self):
+        self.count = 0
+        self._layer = None
+        self._original = None
+
+    def __enter__(self):
+        from channels.layers import get_channel_layer
+
+        self._layer = get_channel_layer()
+        if self._layer is not None:
+            self._original = self._layer.group_send
+
+            async def group_send(group, message):
+                self.count += 1
+                return await self._original(group, message)
+
+            self._layer.group_send = group_send
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._layer is not None:
+            self._layer.group_send = self._original
+
+
+class Command(BaseCommand):
+    help = 'Mede a vazão do pipeline de OCR reexecutando um diretório de documentos de exemplo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('samples_dir', help='Diretório com os documentos de exemplo')
+        parser.add_argument('--document-type', default='rg',
+                            help='Tipo dos documentos fora de subdiretórios de tipo')
+        parser.add_argument('--engine', default='fake',
+                            help='Motor de OCR usado no benchmark (fake, tesseract, vision)')
+        parser.add_argument('--iterations', type=int, default=1,
+                            help='Quantas vezes o diretório é reexecutado')
+        parser.add_argument('--use-cache', action='store_true',
+                            help='Manter o cache de resultados OCR ativo (desativado por padrão)')
+        parser.add_argument('--keep', action='store_true',
+                            help='Não remover os documentos criados pelo benchmark')
+        parser.add_argument('--output', default=None,
+                            help='Salvar o resultado em JSON neste caminho')
+
+    def handle(self, *args, **options):
+        from celery import current_app
+        from celebra_capital.api.documents.models import OcrResult
+        from celebra_capital.api.documents.tasks import process_document_ocr
+
+        samples = self._load_samples(options['samples_dir'], options['document_type'])
+        user, _ = User.objects.get_or_create(username=BENCHMARK_USERNAME)
+        iterations = max(1, options['iterations'])
+
+        benchmark_settings = {
+            'OCR_ENGINE_DEFAULT': options['engine'],
+            'OCR_ENGINES_BY_DOCUMENT_TYPE': {},
+            'OCR_ENGINE_FALLBACKS': [],
+            'OCR_BATCH_ENABLED': False,
+            'OCR_CACHE_ENABLED': options['use_cache'],
+            'OCR_NEAR_DUPLICATE_ENABLED': options['use_cache'],
+            # Sem latência simulada: o motor fake mede apenas o custo do pipeline
+            'OCR_FAKE_LATENCY_MS': 0,
+        }
+
+        latencies = []
+        queries = 0
+        writes = 0
+        statuses = {}
+        created = []
+
+        # Etapas do pipeline executadas em sequência no próprio processo
+        always_eager = current_app.conf.task_always_eager
+        current_app.conf.task_always_eager = True
+
+        with override_settings(**benchmark_settings), _ChannelMessageCounter() as channel_messages:
+            read_start = _read_bytes()
+            start = time.perf_counter()
+
+            for _ in range(iterations):
+                for path, document_type in samples:
+                    with CaptureQueriesContext(connection) as captured:
+                        document_start = time.perf_counter()
+                        document = self._create_document(user, path, document_type)
+                        result = process_document_ocr.apply(args=[document.id]).get()
+                        latencies.append(time.perf_counter() - document_start)
+
+                    created.append(document)
+                    status = result.get('status')
+                    if status == 'staged':
+                        ocr_result = OcrResult.objects.get(document=document)
+                        status = 'success' if ocr_result.ocr_complete and not ocr_result.error_message else 'failed'
+                    statuses[status] = statuses.get(status, 0) + 1
+                    queries += len(captured)
+                    writes += sum(
+                        1 for query in captured.captured_queries
+                        if query['sql'].lstrip().upper().startswith(WRITE_STATEMENTS)
+                    )
+
+            elapsed = time.perf_counter() - start
+            read_end = _read_bytes()
+
+        current_app.conf.task_always_eager = always_eager
+
+        documents = len(latencies)
+        latencies.sort()
+
+        result = {
+            'commit': _git_commit(),
+            'timestamp': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'engine': options['engine'],
+            'cache_enabled': options['use_cache'],
+            'samples': len(samples),
+            'iterations': iterations,
+            'documents': documents,
+            'seconds': elapsed,
+            'documents_per_second': documents / elapsed if elapsed else None,
+            'latency_seconds': {
+                'p50': _percentile(latencies, 50),
+                'p95': _percentile(latencies, 95),
+                'p99': _percentile(latencies, 99),
+                'max': latencies[-1] if latencies else None,
+            },
+            'queries_per_document': queries / documents if documents else None,
+            'writes_per_document': writes / documents if documents else None,
+            'input_bytes': sum(os.path.getsize(path) for path, _ in samples) * iterations,
+            'bytes_read': read_end - read_start if read_start is not None and read_end is not None else None,
+            'channel_messages': channel_messages.count,
+            'channel_messages_per_document': channel_messages.count / documents if documents else None,
+            'statuses': statuses,
+        }
+
+        if not options['keep']:
+            self._cleanup(created)
+
+        self._print_report(result)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Resultado salvo em {options['output']}")
+
+    def _load_samples(self, samples_dir, default_type):
+        if not os.path.isdir(samples_dir):
+            raise CommandError(f"Diretório de amostras não encontrado: {samples_dir}")
+
+        known_types = {code for code, _ in Document.DOCUMENT_TYPES}
+        if default_type not in known_types:
+            raise CommandError(f"Tipo de documento inválido: {default_type}")
+
+        samples = []
+        for root, _, files in os.walk(samples_dir):
+            folder = os.path.basename(root)
+            document_type = folder if folder in known_types else default_type
+            for name in sorted(files):
+                if name.startswith('.') or name.endswith('.ocr.jpg'):
+                    continue
+                samples.append((os.path.join(root, name), document_type))
+
+        if not samples:
+            raise CommandError("Nenhum documento de exemplo encontrado")
+        return sorted(samples)
+
+    def _create_document(self, user, path, document_type):
+        with open(path, 'rb') as f:
+            return Document.objects.create(
+                user=user,
+                document_type=document_type,
+                file=File(f, name=os.path.basename(path)),
+                file_name=os.path.basename(path),
+                file_size=os.path.getsize(path),
+            )
+
+    def _cleanup(self, documents):
+        for document in documents:
+            derivative = f'{document.file.path}.ocr.jpg'
+            if os.path.exists(derivative):
+                os.remove(derivative)
+            document.file.delete(save=False)
+        Document.objects.filter(id__in=[document.id for document in documents]).delete()
+
+    def _print_report(self, result):
+        latency = result['latency_seconds']
+        self.stdout.write(f"Documentos: {result['documents']} ({result['samples']} x {result['iterations']} iterações)")
+        self.stdout.write(f"Motor: {result['engine']} | Banco: {result['database']}")
+        self.stdout.write(f"Documentos/s: {result['documents_per_second']:,.1f}")
+        self.stdout.write(
+            f"Latência p50/p95/p99: {latency['p50'] * 1000:.1f} / "
+            f"{latency['p95'] * 1000:.1f} / {latency['p99'] * 1000:.1f} ms"
+        )
+        self.stdout.write(f"Consultas por documento: {result['queries_per_document']:.1f}")
+        self.stdout.write(f"Escritas por documento: {result['writes_per_document']:.1f}")
+        if result['bytes_read'] is not None:
+            self.stdout.write(f"Bytes lidos: {result['bytes_read']:,} (entrada: {result['input_bytes']:,})")
+        self.stdout.write(f"Mensagens na channel layer: {result['channel_messages']}")
+        self.stdout.write(self.style.SUCCESS(f"Status: {result['statuses']}"))
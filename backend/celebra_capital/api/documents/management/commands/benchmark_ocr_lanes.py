@@ -0,0 +1,195 @@
+"""
+Benchmark das faixas de OCR sob backlog em massa
+
+Mede a latência ponta a ponta (envio até ocr_complete) de documentos da faixa
+interativa em duas fases:
+
+1. linha de base: apenas os documentos interativos;
+2. sob carga: um cliente envia --bulk documentos de uma vez na faixa padrão,
+   outros --small-users clientes enviam um documento cada, e os documentos
+   interativos são enviados novamente.
+
+Com faixas e admissão justa funcionando, o p95 interativo sob carga fica
+próximo da linha de base e os clientes pequenos não esperam o backlog do
+cliente em massa terminar.
+
+Requer workers em execução para as filas ocr_interactive, ocr_standard e
+ocr_retry (ver docker-compose.yml). Para que o backlog ocupe de fato os
+workers, use um motor real (ex.: OCR_ENGINE_DEFAULT=tesseract) ou o motor
+fake com OCR_FAKE_LATENCY_MS=0.
+
+Uso:
+    python manage.py benchmark_ocr_lanes amostra.jpg
+    python manage.py benchmark_ocr_lanes amostra.jpg --bulk 200 --interactive 20 --output lanes.json
+"""
+import json
+import os
+import time
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from celebra_capital.api.documents import lanes
+from celebra_capital.api.documents.models import Document, OcrResult
+
+BENCHMARK_USER_PREFIX = 'benchmark-lanes'
+
+
+def _percentile(sorted_values, percentile):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(percentile / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def _summary(latencies):
+    values = sorted(latencies)
+    return {
+        'count': len(values),
+        'p50': _percentile(values, 50),
+        'p95': _percentile(values, 95),
+        'p99': _percentile(values, 99),
+        'max': values[-1] if values else None,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Mede a latência da faixa OCR interativa com e sem backlog em massa na faixa padrão'
+
+    def add_arguments(self, parser):
+        parser.add_argument('sample', help='Arquivo de documento usado em todos os envios')
+        parser.add_argument('--document-type', default='rg')
+        parser.add_argument('--bulk', type=int, default=100,
+                            help='Documentos enviados de uma vez pelo cliente em massa')
+        parser.add_argument('--small-users', type=int, default=5,
+                            help='Clientes que enviam um documento cada durante o backlog')
+        parser.add_argument('--interactive', type=int, default=10,
+                            help='Documentos interativos por fase')
+        parser.add_argument('--interval-ms', type=int, default=500,
+                            help='Intervalo entre os envios interativos')
+        parser.add_argument('--timeout', type=int, default=600,
+                            help='Tempo máximo de espera por fase (s)')
+        parser.add_argument('--keep', action='store_true',
+                            help='Não remover os documentos criados pelo benchmark')
+        parser.add_argument('--output', default=None,
+                            help='Salvar o resultado em JSON neste caminho')
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options['sample']):
+            raise CommandError(f"Arquivo não encontrado: {options['sample']}")
+
+        self.options = options
+        self.created = []
+
+        try:
+            self.stdout.write("Fase 1: linha de base (apenas interativos)")
+            baseline = self._run_interactive('baseline')
+
+            self.stdout.write(f"Fase 2: {options['bulk']} documentos em massa + {options['small_users']} clientes pequenos")
+            bulk_user = self._user('bulk')
+            bulk_submitted = self._submit_many(bulk_user, options['bulk'], lanes.LANE_STANDARD)
+
+            small_submitted = {}
+            for index in range(options['small_users']):
+                small_submitted.update(self._submit_many(self._user(f'small-{index}'), 1, lanes.LANE_STANDARD))
+
+            under_load = self._run_interactive('under-load')
+            small_latencies = self._wait(small_submitted)
+            bulk_latencies = self._wait(bulk_submitted)
+        finally:
+            if not options['keep']:
+                self._cleanup()
+
+        result = {
+            'timestamp': timezone.now().isoformat(),
+            'bulk_documents': options['bulk'],
+            'small_users': options['small_users'],
+            'interactive_per_phase': options['interactive'],
+            'fair_max_in_flight_per_user': lanes.get_max_in_flight(),
+            'interactive_baseline_seconds': _summary(baseline),
+            'interactive_under_load_seconds': _summary(under_load),
+            'small_users_under_load_seconds': _summary(small_latencies),
+            'bulk_seconds': _summary(bulk_latencies),
+        }
+
+        self._print_report(result)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Resultado salvo em {options['output']}")
+
+    def _user(self, suffix):
+        user, _ = User.objects.get_or_create(username=f'{BENCHMARK_USER_PREFIX}-{suffix}')
+        return user
+
+    def _create_document(self, user):
+        path = self.options['sample']
+        with open(path, 'rb') as f:
+            document = Document.objects.create(
+                user=user,
+                document_type=self.options['document_type'],
+                file=File(f, name=os.path.basename(path)),
+                file_name=os.path.basename(path),
+                file_size=os.path.getsize(path),
+            )
+        self.created.append(document)
+        return document
+
+    def _submit(self, document, lane):
+        submitted_at = time.time()
+        lanes.start_ocr(document, lane)
+        return submitted_at
+
+    def _submit_many(self, user, count, lane):
+        documents = [self._create_document(user) for _ in range(count)]
+        return {document.id: self._submit(document, lane) for document in documents}
+
+    def _run_interactive(self, label):
+        user = self._user(f'interactive-{label}')
+        submitted = {}
+        for _ in range(self.options['interactive']):
+            document = self._create_document(user)
+            submitted[document.id] = self._submit(document, lanes.LANE_INTERACTIVE)
+            time.sleep(self.options['interval_ms'] / 1000.0)
+        return self._wait(submitted)
+
+    def _wait(self, submitted):
+        """Aguarda a conclusão dos documentos e retorna as latências (s)"""
+        pending = dict(submitted)
+        latencies = []
+        deadline = time.time() + self.options['timeout']
+
+        while pending and time.time() < deadline:
+            done = OcrResult.objects.filter(
+                document_id__in=list(pending), ocr_complete=True
+            ).values_list('document_id', 'updated_at')
+            for document_id, updated_at in done:
+                latencies.append(max(0.0, updated_at.timestamp() - pending.pop(document_id)))
+            if pending:
+                time.sleep(0.05)
+
+        if pending:
+            self.stderr.write(f"{len(pending)} documentos não concluídos em {self.options['timeout']}s")
+        return latencies
+
+    def _cleanup(self):
+        for document in self.created:
+            derivative = f'{document.file.path}.ocr.jpg'
+            if os.path.exists(derivative):
+                os.remove(derivative)
+            document.file.delete(save=False)
+        Document.objects.filter(id__in=[document.id for document in self.created]).delete()
+
+    def _print_report(self, result):
+        def line(label, summary):
+            if not summary['count']:
+                return f"{label:<32} sem resultados"
+            return (f"{label:<32} n={summary['count']:<5} p50={summary['p50']:.2f}s "
+                    f"p95={summary['p95']:.2f}s max={summary['max']:.2f}s")
+
+        self.stdout.write(line("Interativo (linha de base)", result['interactive_baseline_seconds']))
+        self.stdout.write(line("Interativo (sob carga)", result['interactive_under_load_seconds']))
+        self.stdout.write(line("Clientes pequenos (sob carga)", result['small_users_under_load_seconds']))
+        self.stdout.write(line("Cliente em massa", result['bulk_seconds']))
@@ -0,0 +1,149 @@
+"""
+Reextração dos campos a partir do texto bruto armazenado
+
+Reaplica as regras de extração (extraction_rules/) ao texto já reconhecido
+de cada OcrResult, sem chamar o motor de OCR. Por padrão processa apenas os
+resultados extraídos com uma versão de regras diferente da atual.
+
+Os resultados são lidos em blocos por chave primária, extraídos em um pool
+de processos e gravados com um único bulk_update por bloco. As entradas do
+cache de OCR com o mesmo conteúdo são atualizadas junto.
+
+Uso:
+    python manage.py reextract_ocr
+    python manage.py reextract_ocr --document-type rg --workers 8
+    python manage.py reextract_ocr --all --dry-run
+"""
+import multiprocessing
+import os
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from celebra_capital.api.documents import extraction
+from celebra_capital.api.documents import progress as ocr_progress
+from celebra_capital.api.documents.models import OcrResult, OcrResultCache
+
+
+class Command(BaseCommand):
+    help = 'Reextrai os campos dos resultados OCR a partir do texto bruto, sem chamar o motor de OCR'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--document-type', action='append', dest='document_types',
+                            help='Restringir a este tipo de documento (pode ser repetido)')
+        parser.add_argument('--all', action='store_true',
+                            help='Reextrair também os resultados já na versão atual das regras')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Processos do pool de extração')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Resultados lidos e gravados por bloco')
+        parser.add_argument('--rules-dir', default=None,
+                            help='Diretório alternativo com conjuntos de regras')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Extrair e contabilizar as alterações, sem gravar')
+
+    def handle(self, *args, **options):
+        rules_dir = options['rules_dir'] or extraction.get_rules_dir()
+        if not os.path.isdir(rules_dir):
+            raise CommandError(f"Diretório de regras não encontrado: {rules_dir}")
+
+        rule_sets = extraction.load_rule_sets(rules_dir)
+        queryset = self._queryset(rule_sets, options)
+        chunk_size = max(1, options['chunk_size'])
+        workers = max(1, options['workers'])
+
+        start = time.monotonic()
+        processed = 0
+        changed = 0
+        last_id = 0
+
+        # spawn: os processos do pool não herdam conexões com o banco
+        with multiprocessing.get_context('spawn').Pool(
+            processes=workers, initializer=extraction.init_worker, initargs=(rules_dir,)
+        ) as pool:
+            while True:
+                rows = list(
+                    queryset.filter(id__gt=last_id)
+                    .order_by('id')
+                    .values_list('id', 'document_id', 'document__document_type', 'document__file_hash',
+                                 'raw_text', 'extracted_data')[:chunk_size]
+                )
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+
+                items = [(row[0], row[2], row[4]) for row in rows]
+                extracted = pool.map(extraction.extract_item, items, chunksize=max(1, len(items) // (workers * 4)))
+
+                chunk_changed = sum(
+                    1 for row, (_, data, _, _) in zip(rows, extracted) if data != row[5]
+                )
+                if not options['dry_run']:
+                    self._save(rows, extracted)
+
+                processed += len(rows)
+                changed += chunk_changed
+                self.stdout.write(f"  até id {last_id}: {len(rows)} resultados, {chunk_changed} alterados")
+
+                if len(rows) < chunk_size:
+                    break
+
+        elapsed = time.monotonic() - start
+        rate = processed / elapsed if elapsed else 0.0
+        action = "seriam alterados" if options['dry_run'] else "alterados"
+        self.stdout.write(self.style.SUCCESS(
+            f"{processed} resultados reextraídos em {elapsed:.1f}s ({rate:.0f}/s), {changed} {action}"
+        ))
+
+    def _queryset(self, rule_sets, options):
+        queryset = OcrResult.objects.filter(ocr_complete=True, raw_text__isnull=False)
+
+        document_types = options['document_types']
+        if document_types:
+            queryset = queryset.filter(document__document_type__in=document_types)
+
+        if not options['all']:
+            # Apenas resultados extraídos com outra versão das regras do seu tipo
+            current = Q()
+            for document_type, rule_set in rule_sets.items():
+                current |= Q(document__document_type=document_type, extractor_version=rule_set.version)
+            current |= (~Q(document__document_type__in=list(rule_sets)) & Q(extractor_version=0))
+            queryset = queryset.exclude(current)
+
+        return queryset
+
+    def _save(self, rows, extracted):
+        now = timezone.now()
+        results = []
+        cache_updates = {}
+        for row, (result_id, data, confidence_score, version) in zip(rows, extracted):
+            results.append(OcrResult(
+                id=result_id,
+                extracted_data=data,
+                confidence_score=confidence_score,
+                extractor_version=version,
+                updated_at=now
+            ))
+            if row[3]:
+                cache_updates[(row[2], row[3])] = (data, confidence_score)
+
+        with transaction.atomic():
+            OcrResult.objects.bulk_update(
+                results, ['extracted_data', 'confidence_score', 'extractor_version', 'updated_at']
+            )
+
+            if cache_updates:
+                cached = []
+                for entry in OcrResultCache.objects.filter(
+                    document_hash__in={document_hash for _, document_hash in cache_updates}
+                ):
+                    update = cache_updates.get((entry.document_type, entry.document_hash))
+                    if update is not None:
+                        entry.extracted_data, entry.confidence_score = update
+                        cached.append(entry)
+                OcrResultCache.objects.bulk_update(cached, ['extracted_data', 'confidence_score'])
+
+        # ETag do status muda com o novo updated_at (ver progress.py)
+        ocr_progress.invalidate([row[1] for row in rows])
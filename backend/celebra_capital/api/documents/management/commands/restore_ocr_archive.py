@@ -0,0 +1,70 @@
+"""
+Restaura resultados OCR do arquivo frio
+
+Lê os arquivos JSONL comprimidos gerados pela limpeza de retenção
+(cleanup_old_ocr_results) e recria os registros de OcrResult e das respostas
+completas dos motores (OcrRawPayload) com a chave primária e as datas
+originais. Registros de documentos removidos, ou de documentos que já possuem
+o registro, são ignorados.
+
+Uso:
+    python manage.py restore_ocr_archive --list
+    python manage.py restore_ocr_archive ocr_archive/2025/01/31/ocr_results_1-1000.jsonl.gz
+    python manage.py restore_ocr_archive --all --document 42 --document 43
+    python manage.py restore_ocr_archive --all --dry-run
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from celebra_capital.api.documents import archive
+
+
+class Command(BaseCommand):
+    help = 'Restaura resultados OCR arquivados pela política de retenção'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archives', nargs='*',
+                            help='Nomes dos arquivos no storage (ver --list)')
+        parser.add_argument('--all', action='store_true',
+                            help='Percorrer todos os arquivos do arquivo frio')
+        parser.add_argument('--document', type=int, action='append', dest='documents',
+                            help='Restaurar apenas os registros deste documento (pode ser repetido)')
+        parser.add_argument('--list', action='store_true',
+                            help='Apenas listar os arquivos disponíveis')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Contabilizar sem gravar no banco')
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for name in archive.list_archives():
+                self.stdout.write(name)
+            return
+
+        names = archive.list_archives() if options['all'] else options['archives']
+        if not names:
+            raise CommandError("Informe os arquivos a restaurar ou use --all")
+
+        document_ids = set(options['documents']) if options['documents'] else None
+        total_restored = 0
+        total_skipped = 0
+
+        for name in names:
+            try:
+                records = list(archive.read_archive(name))
+            except (FileNotFoundError, OSError) as e:
+                raise CommandError(f"Não foi possível ler o arquivo {name}: {e}")
+
+            with transaction.atomic():
+                restored, skipped = archive.restore_records(
+                    records, document_ids=document_ids, dry_run=options['dry_run']
+                )
+
+            total_restored += restored
+            total_skipped += skipped
+            if restored or skipped:
+                self.stdout.write(f"{name}: {restored} restaurados, {skipped} ignorados")
+
+        prefix = "[simulação] " if options['dry_run'] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}Registros restaurados: {total_restored} (ignorados: {total_skipped})"
+        ))
@@ -0,0 +1,66 @@
+"""
+Pico de memória (RSS) das tarefas OCR
+
+Nos workers prefork cada processo filho executa uma tarefa por vez, então o
+pico de memória residente do processo durante a tarefa é o pico da tarefa.
+No Linux o pico (VmHWM em /proc/self/status) é zerado antes de cada tarefa
+escrevendo em /proc/self/clear_refs; sem isso (outros sistemas, /proc
+somente leitura), o valor é o pico desde o início do processo (ru_maxrss).
+"""
+import sys
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+STATUS_PATH = '/proc/self/status'
+CLEAR_REFS_PATH = '/proc/self/clear_refs'
+
+
+def reset_peak_rss():
+    """
+    Zera o pico de RSS do processo (Linux)
+
+    Returns:
+        True se o pico foi zerado; False se o valor seguinte for o pico do processo.
+    """
+    try:
+        with open(CLEAR_REFS_PATH, 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _read_status(field):
+    with open(STATUS_PATH) as f:
+        for line in f:
+            if line.startswith(f'{field}:'):
+                # Ex.: "VmHWM:   123456 kB"
+                return int(line.split()[1]) * 1024
+    return None
+
+
+def get_peak_rss():
+    """Pico de RSS do processo em bytes, ou None se não disponível"""
+    try:
+        peak = _read_status('VmHWM')
+        if peak is not None:
+            return peak
+    except (OSError, ValueError):
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss é em KB no Linux e em bytes no macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def get_current_rss():
+    """RSS atual do processo em bytes, ou None se não disponível"""
+    try:
+        return _read_status('VmRSS')
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,131 @@
+"""
+Métricas Prometheus do pipeline de OCR
+
+Expostas junto das métricas do django_prometheus em /metrics. As
+incrementadas dentro das tarefas (cliente Google Vision, pré-processamento,
+pico de memória) são exportadas pelos próprios workers, na porta
+OCR_WORKER_METRICS_PORT (ver worker_metrics.py).
+"""
+from django.conf import settings
+from prometheus_client import Counter, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+# Tempo gasto para criar um cliente Google Vision (canal gRPC + handshake TLS)
+VISION_CLIENT_CONNECT_SECONDS = Histogram(
+    'ocr_vision_client_connect_seconds',
+    'Tempo para criar um novo cliente Google Vision',
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+
+# Tempo de conexão economizado ao reaproveitar um cliente já aquecido
+VISION_CLIENT_CONNECT_SAVED_SECONDS = Counter(
+    'ocr_vision_client_connect_saved_seconds_total',
+    'Tempo de conexão economizado ao reutilizar o cliente Google Vision do worker',
+)
+
+VISION_CLIENT_REUSED = Counter(
+    'ocr_vision_client_reused_total',
+    'Número de tarefas OCR que reutilizaram o cliente Google Vision do worker',
+)
+
+# Bytes deixados de enviar ao motor de OCR graças ao pré-processamento das imagens
+OCR_PREPROCESS_BYTES_SAVED = Counter(
+    'ocr_preprocess_bytes_saved_total',
+    'Bytes economizados no envio ao motor de OCR pelo pré-processamento de imagens',
+)
+
+# Pico de memória residente dos processos de worker durante cada tarefa OCR
+OCR_TASK_PEAK_RSS_BYTES = Histogram(
+    'ocr_task_peak_rss_bytes',
+    'Pico de memória residente (RSS) do worker durante a tarefa OCR',
+    ['task', 'queue'],
+    buckets=tuple(size * 1024 * 1024 for size in (64, 128, 256, 384, 512, 768, 1024, 1536, 2048, 4096)),
+)
+
+
+# Separador usado pelo transporte Redis do kombu nas filas com prioridade
+PRIORITY_SEPARATOR = '\x06\x16'
+PRIORITY_STEPS = (0, 3, 6, 9)
+
+
+class OcrBacklogCollector:
+    """
+    Backlog do OCR e estado do governador de taxa, lidos no momento da coleta
+
+    Os valores vêm do Redis (broker e governador) e do banco, e não de
+    contadores em memória: o /metrics de qualquer processo web reflete todo o
+    cluster e pode alimentar o autoscaling dos workers.
+    """
+
+    def describe(self):
+        # Evita que o registro chame collect() (Redis e banco) ao iniciar o processo
+        return []
+
+    def collect(self):
+        from . import batching, ratelimit
+        from .models import OcrResult
+        from .redis_client import get_redis
+
+        depth = GaugeMetricFamily(
+            'ocr_queue_depth', 'Mensagens aguardando na fila Celery', labels=['queue']
+        )
+        try:
+            broker = self._get_broker()
+            for queue in getattr(settings, 'OCR_BACKLOG_QUEUES', ['ocr_standard']):
+                names = [queue] + [f'{queue}{PRIORITY_SEPARATOR}{step}' for step in PRIORITY_STEPS if step]
+                depth.add_metric([queue], sum(broker.llen(name) for name in names))
+        except Exception as e:
+            logger.warning("Erro ao ler profundidade das filas OCR", error=str(e))
+        yield depth
+
+        batch = GaugeMetricFamily('ocr_batch_pending', 'Documentos aguardando envio em lote ao Google Vision')
+        try:
+            batch.add_metric([], get_redis().llen(batching.PENDING_KEY))
+        except Exception as e:
+            logger.warning("Erro ao ler lote OCR pendente", error=str(e))
+        yield batch
+
+        pending = GaugeMetricFamily('ocr_documents_pending', 'Documentos com OCR ainda não concluído')
+        try:
+            pending.add_metric([], OcrResult.objects.filter(ocr_complete=False).count())
+        except Exception as e:
+            logger.warning("Erro ao contar documentos com OCR pendente", error=str(e))
+        yield pending
+
+        rate = GaugeMetricFamily(
+            'ocr_rate_limit_rate', 'Taxa atual (req/s) do governador de chamadas OCR', labels=['engine']
+        )
+        ceiling = GaugeMetricFamily(
+            'ocr_rate_limit_ceiling', 'Taxa (req/s) do último erro de quota', labels=['engine']
+        )
+        throttled = CounterMetricFamily(
+            'ocr_rate_limit_throttled', 'Chamadas OCR adiadas pelo governador de taxa', labels=['engine']
+        )
+        quota_errors = CounterMetricFamily(
+            'ocr_quota_errors', 'Erros de quota devolvidos pelo provedor de OCR', labels=['engine']
+        )
+        for engine_name in getattr(settings, 'OCR_RATE_LIMITED_ENGINES', ['vision']) or []:
+            state = ratelimit.get_state(engine_name)
+            if state is None:
+                continue
+            rate.add_metric([engine_name], state['rate'])
+            if state['ceiling'] is not None:
+                ceiling.add_metric([engine_name], state['ceiling'])
+            throttled.add_metric([engine_name], state['throttled'])
+            quota_errors.add_metric([engine_name], state['quota_errors'])
+        yield rate
+        yield ceiling
+        yield throttled
+        yield quota_errors
+
+    def _get_broker(self):
+        import redis
+
+        broker = getattr(self, '_broker', None)
+        if broker is None:
+            broker_url = getattr(settings, 'CELERY_BROKER_URL', None) or getattr(settings, 'REDIS_URL', None)
+            broker = self._broker = redis.from_url(broker_url)
+        return broker
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0002_add_ocr_cache_and_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='file_hash',
+            field=models.CharField(blank=True, db_index=True, help_text='Hash SHA-256 do conteúdo do arquivo', max_length=64, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='ocrresultcache',
+            index=models.Index(fields=['last_used_at'], name='documents_ocrcache_lru_idx'),
+        ),
+    ]
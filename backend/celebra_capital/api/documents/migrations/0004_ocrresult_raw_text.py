@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0003_document_file_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ocrresult',
+            name='raw_text',
+            field=models.TextField(blank=True, help_text='Texto completo reconhecido pelo motor de OCR', null=True),
+        ),
+        migrations.AddField(
+            model_name='ocrresult',
+            name='engine_name',
+            field=models.CharField(blank=True, help_text='Motor de OCR que reconheceu o texto', max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='ocrresult',
+            name='engine_version',
+            field=models.CharField(blank=True, help_text='Versão do motor de OCR', max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='ocrresult',
+            name='extractor_version',
+            field=models.IntegerField(blank=True, help_text='Versão das regras de extração aplicadas', null=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0004_ocrresult_raw_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OcrRawPayload',
+            fields=[
+                ('document', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='ocr_raw_payload', serialize=False, to='documents.document')),
+                ('engine_name', models.CharField(blank=True, max_length=20, null=True)),
+                ('payload', models.BinaryField(help_text='JSON da resposta do motor comprimido com zlib')),
+                ('raw_size', models.IntegerField(help_text='Tamanho do JSON sem compressão em bytes')),
+                ('compressed_size', models.IntegerField(help_text='Tamanho comprimido em bytes')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Resposta completa do OCR',
+                'verbose_name_plural': 'Respostas completas do OCR',
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0005_ocrrawpayload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='perceptual_hash',
+            field=models.BigIntegerField(blank=True, help_text='dHash de 64 bits da imagem, para quase duplicatas', null=True),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='phash_band_0',
+            field=models.PositiveIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='phash_band_1',
+            field=models.PositiveIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='phash_band_2',
+            field=models.PositiveIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='phash_band_3',
+            field=models.PositiveIntegerField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0006_document_perceptual_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ocrresult',
+            name='pipeline_stage',
+            field=models.CharField(blank=True, help_text='Última etapa do pipeline OCR concluída', max_length=20, null=True),
+        ),
+    ]
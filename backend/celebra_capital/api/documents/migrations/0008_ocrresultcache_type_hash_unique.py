@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0007_ocrresult_pipeline_stage'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ocrresultcache',
+            name='document_hash',
+            field=models.CharField(db_index=True, help_text='Hash do conteúdo do documento', max_length=64),
+        ),
+        migrations.RemoveIndex(
+            model_name='ocrresultcache',
+            name='documents_o_documen_2e432f_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='ocrresultcache',
+            constraint=models.UniqueConstraint(fields=('document_type', 'document_hash'), name='documents_ocrcache_type_hash_uniq'),
+        ),
+    ]
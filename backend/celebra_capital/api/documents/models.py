@@ -32,6 +32,15 @@ class Document(models.Model):
     file_name = models.CharField(max_length=255)
     mime_type = models.CharField(max_length=100, blank=True, null=True)
     file_size = models.PositiveIntegerField(help_text="Tamanho em bytes")
+    file_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True,
+                                 help_text="Hash SHA-256 do conteúdo do arquivo")
+    # Hash perceptual (dHash) de imagens e faixas de 16 bits do índice de Hamming (ver similarity.py)
+    perceptual_hash = models.BigIntegerField(blank=True, null=True,
+                                             help_text="dHash de 64 bits da imagem, para quase duplicatas")
+    phash_band_0 = models.PositiveIntegerField(blank=True, null=True, db_index=True)
+    phash_band_1 = models.PositiveIntegerField(blank=True, null=True, db_index=True)
+    phash_band_2 = models.PositiveIntegerField(blank=True, null=True, db_index=True)
+    phash_band_3 = models.PositiveIntegerField(blank=True, null=True, db_index=True)
     verification_status = models.CharField(max_length=10, choices=VERIFICATION_STATUS, default='pending')
     verification_notes = models.TextField(blank=True, null=True)
     is_deleted = models.BooleanField(default=False)
@@ -68,6 +77,16 @@ class OcrResult(models.Model):
     retry_count = models.IntegerField(default=0, help_text="Número de tentativas de processamento")
     last_error_timestamp = models.DateTimeField(null=True, blank=True, help_text="Última vez que ocorreu erro")
     
+    # Texto bruto e versões, para reextrair os campos sem chamar o motor novamente
+    raw_text = models.TextField(blank=True, null=True, help_text="Texto completo reconhecido pelo motor de OCR")
+    engine_name = models.CharField(max_length=20, blank=True, null=True, help_text="Motor de OCR que reconheceu o texto")
+    engine_version = models.CharField(max_length=100, blank=True, null=True, help_text="Versão do motor de OCR")
+    extractor_version = models.IntegerField(blank=True, null=True, help_text="Versão das regras de extração aplicadas")
+    
+    # Última etapa concluída do pipeline em etapas (checkpoint para retomada, ver tasks.py)
+    pipeline_stage = models.CharField(max_length=20, blank=True, null=True,
+                                      help_text="Última etapa do pipeline OCR concluída")
+    
     def __str__(self):
         return f"OCR - {self.document.file_name}"
     
@@ -79,7 +98,7 @@ class OcrResult(models.Model):
             models.Index(fields=['ocr_complete']),
         ]
         
-    def update_progress(self, progress):
+    def update_progress(self, progress, message=None):
         """
         Atualiza o progresso do processamento OCR
         """
@@ -91,16 +110,17 @@ class OcrResult(models.Model):
             from asgiref.sync import async_to_sync
             from channels.layers import get_channel_layer
             
+            event = {
+                'type': 'ocr_status',
+                'complete': self.ocr_complete,
+                'progress': progress,
+                'task_status': self.task_status
+            }
+            if message:
+                event['message'] = message
+            
             channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                f'ocr_{self.document.id}',
-                {
-                    'type': 'ocr_status',
-                    'complete': self.ocr_complete,
-                    'progress': progress,
-                    'task_status': self.task_status
-                }
-            )
+            async_to_sync(channel_layer.group_send)(f'ocr_{self.document.id}', event)
         except Exception as e:
             import logging
             logger = logging.getLogger(__name__)
@@ -187,13 +207,34 @@ class OcrResult(models.Model):
         self.save(update_fields=['retry_count', 'task_status', 'updated_at'])
         return self.retry_count
 
+class OcrRawPayload(models.Model):
+    """
+    Resposta completa do motor de OCR de um documento, comprimida (ver payloads.py)
+    
+    Mantida fora de OcrResult para que a linha lida pelos serializadores e
+    listagens continue pequena; carregada apenas na auditoria.
+    """
+    document = models.OneToOneField(Document, on_delete=models.CASCADE, primary_key=True, related_name='ocr_raw_payload')
+    engine_name = models.CharField(max_length=20, blank=True, null=True)
+    payload = models.BinaryField(help_text="JSON da resposta do motor comprimido com zlib")
+    raw_size = models.IntegerField(help_text="Tamanho do JSON sem compressão em bytes")
+    compressed_size = models.IntegerField(help_text="Tamanho comprimido em bytes")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = "Resposta completa do OCR"
+        verbose_name_plural = "Respostas completas do OCR"
+    
+    def __str__(self):
+        return f"Resposta OCR - documento {self.document_id} ({self.compressed_size} bytes)"
+
 class OcrResultCache(models.Model):
     """
     Cache de resultados OCR para documentos similares
     Útil para reutilizar resultados de documentos parecidos e acelerar o processamento
     """
     document_type = models.CharField(max_length=50)
-    document_hash = models.CharField(max_length=64, unique=True, help_text="Hash do conteúdo do documento")
+    document_hash = models.CharField(max_length=64, db_index=True, help_text="Hash do conteúdo do documento")
     extracted_data = models.JSONField()
     confidence_score = models.FloatField()
     created_at = models.DateTimeField(auto_now_add=True)
@@ -204,7 +245,11 @@ class OcrResultCache(models.Model):
         verbose_name = "Cache de OCR"
         verbose_name_plural = "Caches de OCR"
         indexes = [
-            models.Index(fields=['document_type', 'document_hash']),
+            models.Index(fields=['last_used_at'], name='documents_ocrcache_lru_idx'),
+        ]
+        constraints = [
+            # O mesmo arquivo pode ser enviado como tipos diferentes, com extrações diferentes
+            models.UniqueConstraint(fields=['document_type', 'document_hash'], name='documents_ocrcache_type_hash_uniq'),
         ]
     
     def __str__(self):
@@ -0,0 +1,159 @@
+"""
+Deduplicação de OCR por hash de conteúdo
+
+Reaproveita resultados já extraídos (modelo OcrResultCache) quando o mesmo
+arquivo é reenviado, evitando uma nova chamada ao motor de OCR.
+"""
+import hashlib
+from django.conf import settings
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+# Tamanho dos blocos lidos ao calcular o hash (1 MB)
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def is_cache_enabled():
+    """Indica se o cache de resultados OCR está habilitado"""
+    return getattr(settings, 'OCR_CACHE_ENABLED', True)
+
+
+def compute_document_hash(file_obj, chunk_size=HASH_CHUNK_SIZE):
+    """
+    Calcula o hash SHA-256 do conteúdo de um arquivo sem carregá-lo inteiro em memória
+
+    Aceita um caminho no disco ou um objeto de arquivo (UploadedFile, FieldFile ou
+    arquivo aberto em modo binário). Objetos de arquivo são reposicionados no início
+    após a leitura.
+    """
+    sha256 = hashlib.sha256()
+
+    if isinstance(file_obj, (str, bytes)) or hasattr(file_obj, '__fspath__'):
+        with open(file_obj, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    if hasattr(file_obj, 'seek'):
+        file_obj.seek(0)
+
+    if hasattr(file_obj, 'chunks'):
+        for chunk in file_obj.chunks(chunk_size):
+            sha256.update(chunk)
+    else:
+        for chunk in iter(lambda: file_obj.read(chunk_size), b''):
+            sha256.update(chunk)
+
+    if hasattr(file_obj, 'seek'):
+        file_obj.seek(0)
+
+    return sha256.hexdigest()
+
+
+def get_cached_result(document_type, document_hash):
+    """
+    Busca um resultado OCR em cache para o hash informado
+
+    Retorna a instância de OcrResultCache (já com o uso registrado) ou None.
+    """
+    from .models import OcrResultCache
+
+    if not document_hash or not is_cache_enabled():
+        return None
+
+    cached = OcrResultCache.objects.filter(
+        document_type=document_type,
+        document_hash=document_hash
+    ).first()
+
+    if cached is None:
+        return None
+
+    cached.register_use()
+
+    logger.info(
+        "Resultado OCR reaproveitado do cache",
+        document_type=document_type,
+        document_hash=document_hash,
+        use_count=cached.use_count
+    )
+    return cached
+
+
+def store_result(document_type, document_hash, extracted_data, confidence_score):
+    """
+    Armazena (ou atualiza) o resultado OCR de um arquivo no cache
+
+    A entrada é identificada pelo tipo de documento e pelo hash: o mesmo
+    arquivo enviado como outro tipo tem campos extraídos diferentes.
+    """
+    from .models import OcrResultCache
+
+    if not document_hash or not is_cache_enabled():
+        return None
+
+    cached, _ = OcrResultCache.objects.update_or_create(
+        document_type=document_type,
+        document_hash=document_hash,
+        defaults={
+            'extracted_data': extracted_data,
+            'confidence_score': confidence_score,
+        }
+    )
+    return cached
+
+
+def get_raw_text(document_hash):
+    """
+    Texto bruto já reconhecido para um conteúdo, de outro documento com o
+    mesmo hash
+
+    Returns:
+        Tupla (raw_text, engine_name), ou (None, None) se não houver.
+    """
+    from .models import OcrResult
+
+    if not document_hash:
+        return None, None
+
+    found = (
+        OcrResult.objects
+        .filter(document__file_hash=document_hash, raw_text__isnull=False)
+        .values_list('raw_text', 'engine_name')
+        .first()
+    )
+    return found or (None, None)
+
+
+def evict_least_recently_used(max_entries=None):
+    """
+    Remove as entradas menos usadas recentemente (por last_used_at) até que o
+    cache caiba no orçamento configurado em OCR_CACHE_MAX_ENTRIES
+
+    Retorna o número de entradas removidas.
+    """
+    from .models import OcrResultCache
+
+    if max_entries is None:
+        max_entries = getattr(settings, 'OCR_CACHE_MAX_ENTRIES', 50000)
+
+    total = OcrResultCache.objects.count()
+    excess = total - max_entries
+    if excess <= 0:
+        return 0
+
+    # Selecionar os IDs mais antigos primeiro para evitar um DELETE com ORDER BY
+    stale_ids = list(
+        OcrResultCache.objects.order_by('last_used_at')
+        .values_list('id', flat=True)[:excess]
+    )
+    deleted, _ = OcrResultCache.objects.filter(id__in=stale_ids).delete()
+
+    logger.info(
+        "Entradas antigas removidas do cache OCR",
+        removed=deleted,
+        max_entries=max_entries,
+        total_before=total
+    )
+    return deleted
@@ -0,0 +1,86 @@
+"""
+Respostas completas dos motores de OCR, para auditoria
+
+A resposta integral do motor (ex.: Google Vision, com caixas das palavras e
+confiança por símbolo) é gravada como JSON comprimido com zlib na tabela
+OcrRawPayload, separada de OcrResult: a linha de OcrResult lida pelos
+serializadores e listagens continua pequena, e o payload só é carregado pela
+view de auditoria (OcrRawPayloadView).
+"""
+import json
+import zlib
+from django.conf import settings
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+# Nível de compressão do zlib (1-9): JSON de OCR comprime bem já nos níveis médios
+COMPRESSION_LEVEL = 6
+
+
+def is_enabled():
+    """Indica se as respostas completas dos motores devem ser armazenadas"""
+    return getattr(settings, 'OCR_STORE_RAW_PAYLOAD', True)
+
+
+def response_to_dict(response):
+    """Converte uma resposta do Google Vision (proto-plus) em dicionário, sem campos vazios"""
+    from google.protobuf.json_format import MessageToDict
+
+    return MessageToDict(type(response).pb(response), preserving_proto_field_name=True)
+
+
+def decompress(data):
+    return json.loads(zlib.decompress(bytes(data)).decode('utf-8'))
+
+
+def store_payload(document_id, engine_name, payload):
+    """
+    Grava (ou substitui) a resposta completa do motor para um documento
+
+    Falhas são registradas e não interrompem o pipeline de OCR.
+    """
+    from .models import OcrRawPayload
+
+    if payload is None or not is_enabled():
+        return None
+
+    try:
+        raw = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        data = zlib.compress(raw, COMPRESSION_LEVEL)
+        stored, _ = OcrRawPayload.objects.update_or_create(
+            document_id=document_id,
+            defaults={
+                'engine_name': engine_name,
+                'payload': data,
+                'raw_size': len(raw),
+                'compressed_size': len(data),
+            }
+        )
+    except Exception as e:
+        logger.error("Erro ao gravar resposta completa do motor de OCR", error=str(e), document_id=document_id)
+        return None
+
+    logger.debug(
+        "Resposta completa do motor de OCR armazenada",
+        document_id=document_id,
+        engine=engine_name,
+        raw_size=len(raw),
+        compressed_size=len(data)
+    )
+    return stored
+
+
+def load_payload(document_id):
+    """
+    Carrega a resposta completa do motor para um documento
+
+    Returns:
+        Tupla (OcrRawPayload, payload), ou (None, None) se não houver.
+    """
+    from .models import OcrRawPayload
+
+    stored = OcrRawPayload.objects.filter(document_id=document_id).first()
+    if stored is None:
+        return None, None
+    return stored, decompress(stored.payload)
@@ -0,0 +1,167 @@
+"""
+OCR de documentos PDF com várias páginas
+
+As páginas são rasterizadas sob demanda, uma por vez, e reconhecidas em
+paralelo com concorrência limitada (OCR_PDF_MAX_CONCURRENCY). No máximo esse
+número de páginas fica em memória ao mesmo tempo, independentemente do total
+de páginas do arquivo. O texto é reunido na ordem das páginas.
+"""
+import io
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from django.conf import settings
+import structlog
+
+from . import engines
+
+logger = structlog.get_logger(__name__)
+
+# Resolução usada na rasterização das páginas
+RENDER_DPI = 300
+
+# Separador entre os textos de páginas consecutivas
+PAGE_SEPARATOR = '\n\f\n'
+
+
+def is_pdf(file_path):
+    """Verifica pela assinatura do arquivo se ele é um PDF"""
+    try:
+        with io.open(file_path, 'rb') as f:
+            return f.read(5) == b'%PDF-'
+    except OSError:
+        return False
+
+
+def count_pages(file_path):
+    import pypdfium2 as pdfium
+
+    pdf = pdfium.PdfDocument(file_path)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def _render_scale(page, dpi, max_dimension):
+    # Páginas maiores que A4 (plantas, digitalizações em A0) seriam rasterizadas
+    # com centenas de megapixels: limitar a maior dimensão como nas imagens
+    scale = dpi / 72.0
+    longest = max(page.get_size())
+    if longest * scale > max_dimension:
+        scale = max_dimension / longest
+    return scale
+
+
+def iter_pages(file_path, dpi=RENDER_DPI):
+    """
+    Gera (page_number, jpeg_bytes) para cada página, rasterizando sob demanda
+
+    O pdfium não é thread-safe: o gerador deve ser consumido por uma única thread.
+    """
+    import pypdfium2 as pdfium
+
+    quality = getattr(settings, 'OCR_PREPROCESS_JPEG_QUALITY', 90)
+    max_dimension = getattr(settings, 'OCR_PREPROCESS_MAX_DIMENSION', 3500)
+    pdf = pdfium.PdfDocument(file_path)
+    try:
+        for index in range(len(pdf)):
+            page = pdf[index]
+            try:
+                bitmap = page.render(scale=_render_scale(page, dpi, max_dimension), grayscale=True)
+                image = bitmap.to_pil()
+                output = io.BytesIO()
+                image.save(output, format='JPEG', quality=quality, dpi=(dpi, dpi))
+                image.close()
+                bitmap.close()
+            finally:
+                page.close()
+            yield index + 1, output.getvalue()
+    finally:
+        pdf.close()
+
+
+def recognize_pdf(file_path, document_type, chain=None, on_page_done=None):
+    """
+    Reconhece o texto de todas as páginas de um PDF
+
+    Args:
+        file_path: caminho do PDF
+        document_type: tipo do documento (repassado aos motores)
+        chain: cadeia de motores (ver engines.get_engine_chain)
+        on_page_done: callback(page_number, pages_done, total_pages) chamado
+            a cada página concluída
+
+    Returns:
+        Tupla (full_text, engine_name, payload). engine_name é o motor da
+        primeira página (as demais podem ter usado fallbacks); payload reúne
+        as respostas completas dos motores por página ({"pages": [...]}), ou
+        None se nenhum motor as forneceu.
+
+    Raises:
+        engines.OcrEngineError: se alguma página falhar em todos os motores
+            (OcrThrottledError se a falha foi por limite de taxa).
+    """
+    max_concurrency = max(1, getattr(settings, 'OCR_PDF_MAX_CONCURRENCY', 4))
+    total_pages = count_pages(file_path)
+
+    texts = [None] * total_pages
+    engine_names = [None] * total_pages
+    page_payloads = [None] * total_pages
+    errors = []
+    pages_done = 0
+
+    def _recognize_page(page_number, content):
+        return page_number, engines.recognize_detailed(content, document_type, chain)
+
+    def _collect(futures):
+        # Executado na thread da tarefa: callbacks (que acessam o banco) não
+        # rodam nas threads do pool
+        nonlocal pages_done
+        for future in futures:
+            try:
+                page_number, (text, engine_name, payload) = future.result()
+            except engines.OcrEngineError as e:
+                errors.append(e)
+                continue
+            texts[page_number - 1] = text
+            engine_names[page_number - 1] = engine_name
+            page_payloads[page_number - 1] = payload
+            pages_done += 1
+            if on_page_done is not None:
+                on_page_done(page_number, pages_done, total_pages)
+
+    pages = iter_pages(file_path)
+    pending = set()
+    try:
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            for page_number, content in pages:
+                pending.add(executor.submit(_recognize_page, page_number, content))
+
+                # Limitar as páginas rasterizadas e ainda não reconhecidas (memória constante)
+                if len(pending) >= max_concurrency:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    _collect(done)
+                if errors:
+                    break
+
+            done, pending = wait(pending)
+            _collect(done)
+    finally:
+        pages.close()
+
+    if errors:
+        message = "Falha no OCR do PDF: " + "; ".join(str(e) for e in errors)
+        throttled = [e for e in errors if isinstance(e, engines.OcrThrottledError)]
+        if throttled:
+            raise engines.OcrThrottledError(message, max(e.retry_after for e in throttled))
+        raise engines.OcrEngineError(message)
+
+    logger.info(
+        "PDF reconhecido",
+        file_path=file_path,
+        pages=total_pages,
+        concurrency=max_concurrency
+    )
+
+    full_text = PAGE_SEPARATOR.join(text or '' for text in texts)
+    payload = {'pages': page_payloads} if any(page_payloads) else None
+    return full_text, next((name for name in engine_names if name), None), payload
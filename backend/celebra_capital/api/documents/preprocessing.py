@@ -0,0 +1,228 @@
+"""
+Pré-processamento de imagens antes do OCR
+
+Normaliza fotos de documentos (orientação EXIF, tons de cinza, resolução e
+bordas) para reduzir os bytes enviados ao motor de OCR. A imagem derivada é
+gravada ao lado do original e reutilizada em novas tentativas.
+"""
+import io
+import os
+from django.conf import settings
+import structlog
+
+from .metrics import OCR_PREPROCESS_BYTES_SAVED
+
+logger = structlog.get_logger(__name__)
+
+# Resolução considerada ideal pelos motores de OCR
+TARGET_DPI = 300
+
+# Maior dimensão usada quando a imagem não informa DPI (A4 a 300 DPI ≈ 3508 px)
+DEFAULT_MAX_DIMENSION = 3500
+
+# Diferença mínima de tom para considerar um pixel parte do conteúdo ao cortar bordas
+BORDER_THRESHOLD = 24
+
+# Sufixo da imagem derivada gravada ao lado do original
+DERIVATIVE_SUFFIX = '.ocr.jpg'
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff', '.heic')
+
+
+class ContentTooLargeError(OSError):
+    """Conteúdo grande demais para ser enviado inteiro ao motor de OCR"""
+
+
+def is_preprocessing_enabled():
+    return getattr(settings, 'OCR_PREPROCESS_ENABLED', True)
+
+
+def get_derivative_path(file_path):
+    """Caminho da imagem pré-processada correspondente ao arquivo original"""
+    return f"{file_path}{DERIVATIVE_SUFFIX}"
+
+
+def get_max_in_memory_bytes():
+    return int(getattr(settings, 'OCR_MAX_IN_MEMORY_MB', 20) * 1024 * 1024)
+
+
+def read_content(file_path):
+    """
+    Lê um arquivo inteiro para envio ao motor de OCR
+
+    Os motores recebem o conteúdo em memória; arquivos acima de
+    OCR_MAX_IN_MEMORY_MB não são carregados (erro permanente do documento).
+    """
+    size = os.path.getsize(file_path)
+    max_bytes = get_max_in_memory_bytes()
+    if size > max_bytes:
+        raise ContentTooLargeError(
+            f"Arquivo com {size} bytes excede o limite de {max_bytes} bytes para envio ao motor de OCR"
+        )
+    with io.open(file_path, 'rb') as f:
+        return f.read()
+
+
+def _target_size(image):
+    """
+    Calcula o tamanho de saída: reduz para TARGET_DPI quando a imagem informa
+    DPI e, em qualquer caso, limita a maior dimensão
+    """
+    width, height = image.size
+    scale = 1.0
+
+    dpi = image.info.get('dpi')
+    if dpi and dpi[0] and dpi[0] > TARGET_DPI:
+        scale = TARGET_DPI / float(dpi[0])
+
+    max_dimension = getattr(settings, 'OCR_PREPROCESS_MAX_DIMENSION', DEFAULT_MAX_DIMENSION)
+    longest = max(width, height) * scale
+    if longest > max_dimension:
+        scale *= max_dimension / longest
+
+    if scale >= 1.0:
+        return None
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def _trim_borders(image):
+    """
+    Remove bordas uniformes (mesa, fundo do scanner) ao redor do documento
+    """
+    from PIL import Image, ImageChops
+
+    # A cor de fundo é estimada pelo pixel do canto superior esquerdo
+    background = Image.new('L', image.size, image.getpixel((0, 0)))
+    diff = ImageChops.difference(image, background)
+    mask = diff.point(lambda value: 255 if value > BORDER_THRESHOLD else 0)
+    bbox = mask.getbbox()
+
+    if not bbox:
+        return image
+
+    # Evitar cortes agressivos: manter se o recorte remover quase toda a imagem
+    left, top, right, bottom = bbox
+    if (right - left) * (bottom - top) < 0.25 * image.size[0] * image.size[1]:
+        return image
+    return image.crop(bbox)
+
+
+def preprocess_image(source):
+    """
+    Aplica o pré-processamento a uma imagem (caminho ou objeto de arquivo)
+
+    Corrige a rotação EXIF, converte para tons de cinza, reduz a resolução e
+    corta bordas uniformes. Retorna os bytes JPEG resultantes ou None se o
+    conteúdo não for uma imagem suportada.
+    """
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        image = Image.open(source)
+    except (UnidentifiedImageError, OSError):
+        return None
+
+    with image:
+        target = _target_size(image)
+        if target and image.format == 'JPEG':
+            # Decodificar o JPEG já reduzido economiza memória do worker
+            image.draft('L', target)
+
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('L')
+
+        if target:
+            # O draft e a rotação EXIF podem alterar as dimensões: preservar a
+            # proporção ajustando pela maior dimensão calculada no original
+            scale = max(target) / float(max(image.size))
+            if scale < 1.0:
+                size = (max(1, int(image.size[0] * scale)), max(1, int(image.size[1] * scale)))
+                image = image.resize(size, Image.LANCZOS)
+
+        image = _trim_borders(image)
+
+        output = io.BytesIO()
+        image.save(
+            output,
+            format='JPEG',
+            quality=getattr(settings, 'OCR_PREPROCESS_JPEG_QUALITY', 90),
+            optimize=True,
+            dpi=(TARGET_DPI, TARGET_DPI)
+        )
+        return output.getvalue()
+
+
+def prepare_image(file_path, report=True):
+    """
+    Retorna o conteúdo a ser enviado ao motor de OCR para um arquivo
+
+    Usa a imagem derivada em cache quando ela existe; caso contrário, gera e
+    grava a derivada. Arquivos que não são imagens (ex.: PDF) ou que ficariam
+    maiores após o processamento são enviados como estão (ver read_content).
+
+    Args:
+        report: registrar a economia (métrica e log); False quando ela já foi
+            registrada para o documento, como na etapa de reconhecimento do
+            pipeline, que apenas lê a derivada gravada pela etapa anterior
+
+    Returns:
+        Tupla (content, stats) em que stats contém original_bytes,
+        processed_bytes, bytes_saved e cached.
+    """
+    original_bytes = os.path.getsize(file_path)
+    derivative_path = get_derivative_path(file_path)
+
+    def _stats(processed_bytes, cached):
+        return {
+            'original_bytes': original_bytes,
+            'processed_bytes': processed_bytes,
+            'bytes_saved': original_bytes - processed_bytes,
+            'cached': cached,
+        }
+
+    if not is_preprocessing_enabled() or not file_path.lower().endswith(IMAGE_EXTENSIONS):
+        return read_content(file_path), _stats(original_bytes, False)
+
+    # Reutilizar a derivada gerada em uma tentativa anterior
+    if os.path.exists(derivative_path) and os.path.getmtime(derivative_path) >= os.path.getmtime(file_path):
+        with io.open(derivative_path, 'rb') as f:
+            content = f.read()
+        stats = _stats(len(content), True)
+        return content, _report(file_path, stats) if report else stats
+
+    try:
+        # O Pillow lê o arquivo sob demanda, sem carregar o original inteiro
+        processed = preprocess_image(file_path)
+    except Exception as e:
+        logger.warning("Erro no pré-processamento da imagem, usando original", error=str(e), file_path=file_path)
+        processed = None
+
+    if processed is None or len(processed) >= original_bytes:
+        return read_content(file_path), _stats(original_bytes, False)
+
+    try:
+        # Gravar em arquivo temporário e renomear para não expor derivadas incompletas
+        temp_path = f"{derivative_path}.tmp"
+        with io.open(temp_path, 'wb') as f:
+            f.write(processed)
+        os.replace(temp_path, derivative_path)
+    except OSError as e:
+        logger.warning("Não foi possível gravar a imagem pré-processada", error=str(e), file_path=file_path)
+
+    stats = _stats(len(processed), False)
+    return processed, _report(file_path, stats) if report else stats
+
+
+def _report(file_path, stats):
+    """Registra os bytes economizados no envio ao motor de OCR"""
+    OCR_PREPROCESS_BYTES_SAVED.inc(max(stats['bytes_saved'], 0))
+
+    logger.info(
+        "Imagem pré-processada para OCR",
+        file_path=file_path,
+        original_bytes=stats['original_bytes'],
+        processed_bytes=stats['processed_bytes'],
+        bytes_saved=stats['bytes_saved'],
+        cached=stats['cached']
+    )
+    return stats
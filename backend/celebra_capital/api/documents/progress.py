@@ -0,0 +1,223 @@
+"""
+Canal de progresso e status do OCR
+
+O progresso intermediário fica em um hash no Redis (ocr:progress:<document_id>)
+e é publicado no grupo ocr_<document_id> com limitação de frequência. Apenas
+o estado final é persistido em OcrResult, pelo pipeline.
+
+O mesmo hash é o status compacto do documento (progresso, estado, tentativas,
+dono e instante da última alteração) servido às consultas de polling: as
+tarefas e as views que reiniciam o OCR gravam nele (write-through) e as
+consultas o leem sem acessar o banco nem o backend de resultados do Celery.
+Quando o registro não existe, é reconstruído a partir de OcrResult.
+"""
+import hashlib
+import time
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+import structlog
+
+from .redis_client import get_redis
+
+logger = structlog.get_logger(__name__)
+
+# Tempo de vida do estado de progresso no Redis
+PROGRESS_TTL = 24 * 60 * 60
+
+
+def _key(document_id):
+    return f'ocr:progress:{document_id}'
+
+
+def _throttle_key(document_id):
+    return f'ocr:progress:{document_id}:throttle'
+
+
+def _decode(raw):
+    return {
+        (key.decode() if isinstance(key, bytes) else key): (value.decode() if isinstance(value, bytes) else value)
+        for key, value in raw.items()
+    }
+
+
+def publish(document_id, progress, complete=False, task_status=None, message=None, force=False, retry_count=None):
+    """
+    Registra o progresso no Redis e notifica os assinantes do WebSocket
+
+    Atualizações intermediárias são publicadas no máximo uma vez a cada
+    OCR_PROGRESS_PUBLISH_INTERVAL_MS; estados finais (complete, SUCCESS,
+    FAILURE) e force=True são sempre publicados.
+    """
+    if task_status is None:
+        task_status = 'SUCCESS' if complete else 'STARTED'
+
+    state = {
+        'progress': progress,
+        'complete': int(bool(complete)),
+        'task_status': task_status,
+        'message': message or '',
+        'updated_at': time.time(),
+    }
+    if retry_count is not None:
+        state['retry_count'] = retry_count
+
+    terminal = force or complete or task_status in ('SUCCESS', 'FAILURE', 'REVOKED')
+    interval_ms = getattr(settings, 'OCR_PROGRESS_PUBLISH_INTERVAL_MS', 500)
+
+    try:
+        redis_conn = get_redis()
+        pipe = redis_conn.pipeline()
+        pipe.hset(_key(document_id), mapping=state)
+        pipe.expire(_key(document_id), PROGRESS_TTL)
+        if not terminal:
+            pipe.set(_throttle_key(document_id), 1, nx=True, px=interval_ms)
+        results = pipe.execute()
+        should_publish = terminal or bool(results[-1])
+    except Exception as e:
+        logger.error("Erro ao registrar progresso OCR no Redis", error=str(e), document_id=document_id)
+        should_publish = True
+
+    if not should_publish:
+        return False
+
+    event = {
+        'type': 'ocr_status',
+        'complete': bool(complete),
+        'progress': progress,
+        'task_status': task_status,
+    }
+    if message:
+        event['message'] = message
+
+    try:
+        async_to_sync(get_channel_layer().group_send)(f'ocr_{document_id}', event)
+    except Exception as e:
+        logger.error("Erro ao enviar atualização de progresso via WebSocket", error=str(e), document_id=document_id)
+        return False
+    return True
+
+
+def get_progress(document_id):
+    """
+    Retorna o último estado de progresso registrado ou None
+    """
+    try:
+        raw = get_redis().hgetall(_key(document_id))
+    except Exception as e:
+        logger.warning("Erro ao ler progresso OCR do Redis", error=str(e), document_id=document_id)
+        return None
+
+    if not raw:
+        return None
+
+    state = _decode(raw)
+    return {
+        'progress': int(float(state.get('progress', 0))),
+        'complete': state.get('complete') == '1',
+        'task_status': state.get('task_status') or None,
+        'message': state.get('message') or '',
+        'updated_at': float(state.get('updated_at', 0)),
+        'retry_count': int(state['retry_count']) if 'retry_count' in state else None,
+        'user_id': int(state['user_id']) if 'user_id' in state else None,
+    }
+
+
+def get_current_progress(document_id, default=0):
+    """Progresso atual (0-100) do documento, ou default se não houver registro"""
+    state = get_progress(document_id)
+    return state['progress'] if state else default
+
+
+def _status_from_result(ocr_result, user_id):
+    complete = ocr_result.ocr_complete
+    task_status = ocr_result.task_status or ('SUCCESS' if complete else 'PENDING')
+    return {
+        'progress': 100 if complete else ocr_result.current_progress,
+        'complete': complete,
+        'task_status': task_status,
+        'message': (ocr_result.error_message or '') if task_status == 'FAILURE' else '',
+        'updated_at': ocr_result.updated_at.timestamp() if ocr_result.updated_at else time.time(),
+        'retry_count': ocr_result.retry_count,
+        'user_id': user_id,
+    }
+
+
+def store_status(ocr_result, user_id, overwrite=True):
+    """
+    Grava o status do documento a partir de OcrResult
+
+    Args:
+        overwrite: False preserva os campos de progresso já presentes no
+            Redis (mais recentes que o banco enquanto a tarefa executa);
+            tentativas e dono são sempre gravados
+    """
+    state = _status_from_result(ocr_result, user_id)
+    key = _key(ocr_result.document_id)
+    try:
+        pipe = get_redis().pipeline()
+        for field in ('progress', 'complete', 'task_status', 'message', 'updated_at'):
+            value = int(state[field]) if field == 'complete' else state[field]
+            if overwrite:
+                pipe.hset(key, field, value)
+            else:
+                pipe.hsetnx(key, field, value)
+        pipe.hset(key, mapping={'retry_count': state['retry_count'], 'user_id': user_id})
+        pipe.expire(key, PROGRESS_TTL)
+        pipe.execute()
+    except Exception as e:
+        logger.warning("Erro ao gravar status OCR no Redis", error=str(e), document_id=ocr_result.document_id)
+    return state
+
+
+def get_status(document_id, user_id):
+    """
+    Status do documento para as consultas de polling (read-through)
+
+    Lê o registro do Redis; se ele não existir ou estiver incompleto, carrega
+    OcrResult do banco e o grava.
+
+    Returns:
+        Dicionário do status, ou None se o documento não pertence ao usuário
+        ou ainda não tem OcrResult.
+    """
+    state = get_progress(document_id)
+    if state and state['user_id'] is not None and state['retry_count'] is not None:
+        return state if state['user_id'] == user_id else None
+
+    from .models import OcrResult
+
+    ocr_result = OcrResult.objects.filter(document_id=document_id, document__user_id=user_id).first()
+    if ocr_result is None:
+        return None
+
+    state = store_status(ocr_result, user_id, overwrite=False)
+    return get_progress(document_id) or state
+
+
+def get_etag(state):
+    """ETag (entre aspas) de um status retornado por get_status"""
+    raw = '{progress}:{complete:d}:{task_status}:{retry_count}:{updated_at:.6f}'.format(**state)
+    return '"%s"' % hashlib.md5(raw.encode()).hexdigest()
+
+
+def invalidate(document_ids):
+    """
+    Descarta o status de documentos alterados diretamente no banco
+
+    A próxima consulta reconstrói o registro a partir de OcrResult.
+    """
+    if not document_ids:
+        return
+    try:
+        get_redis().delete(*[_key(document_id) for document_id in document_ids])
+    except Exception as e:
+        logger.warning("Erro ao invalidar status OCR no Redis", error=str(e), documents=len(document_ids))
+
+
+def clear(document_id):
+    """Remove o estado de progresso do documento"""
+    try:
+        get_redis().delete(_key(document_id), _throttle_key(document_id))
+    except Exception as e:
+        logger.warning("Erro ao remover progresso OCR do Redis", error=str(e), document_id=document_id)
@@ -0,0 +1,391 @@
+"""
+OCR do conjunto de documentos de uma proposta (fan-out/fan-in)
+
+Quando o conjunto (RG, CPF, comprovante de renda e de residência) de uma
+proposta está completo, o OCR de todos os documentos é enviado de uma vez
+como um chord Celery na faixa interativa: os documentos são processados em
+paralelo e o callback (finalize_proposal_ocr) executa uma única validação
+agregada, conferindo nome e CPF entre os documentos. O resultado é publicado
+uma vez no grupo proposal_ocr_<proposal_id> ("documentos da proposta
+prontos") e fica disponível em /documents/proposal/<id>/ocr/, sem que o
+analista consulte documento por documento. O tempo até a proposta ficar
+pronta é o do documento mais lento, não a soma.
+
+Documentos já concluídos entram direto na validação; os que já estão em
+processamento (na fila, aguardando vaga na faixa padrão ou em execução) não
+são reenviados, exceto se estiverem pendentes há mais tempo que o limite de
+tarefas travadas. Como o OCR pelo motor continua no pipeline
+em etapas depois que a tarefa do chord retorna, o resumo é publicado na
+conclusão do último documento pendente (on_document_complete); o callback do
+chord publica se todos já estiverem prontos e, senão, só volta a executar ao
+fim de OCR_PROPOSAL_MAX_WAIT_SECONDS, publicando o resumo com tempo esgotado.
+A trava da proposta garante uma única publicação por envio.
+"""
+import json
+import time
+import unicodedata
+from datetime import timedelta
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from celery import chord
+from django.conf import settings
+from django.utils import timezone
+import structlog
+
+from . import lanes
+from .redis_client import get_redis
+
+logger = structlog.get_logger(__name__)
+
+# Tipos de documento do conjunto processado por OCR
+OCR_DOCUMENT_TYPES = ('rg', 'cpf', 'proof_income', 'address_proof')
+
+# Tempo de vida do resumo da proposta no Redis
+SUMMARY_TTL = 24 * 60 * 60
+
+# Folga da trava além da espera máxima: o callback do chord pode atrasar na fila
+LOCK_GRACE_SECONDS = 300
+
+# Remove a trava apenas se ela ainda for do envio indicado (started_at)
+CLAIM_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def _key(proposal_id):
+    return f'ocr:proposal:{proposal_id}'
+
+
+def _lock_key(proposal_id):
+    return f'ocr:proposal:{proposal_id}:running'
+
+
+def get_max_wait():
+    return getattr(settings, 'OCR_PROPOSAL_MAX_WAIT_SECONDS', 900)
+
+
+def get_remaining_wait(started_at):
+    """Segundos até o fim da espera máxima do envio"""
+    return max(1, int(started_at + get_max_wait() - time.time()) + 1)
+
+
+def is_running(proposal_id, started_at):
+    """Indica se o envio (started_at) da proposta ainda aguarda a publicação do resumo"""
+    value = get_redis().get(_lock_key(proposal_id))
+    return value is not None and float(value) == started_at
+
+
+def get_documents(proposal_id):
+    """
+    Documento mais recente de cada tipo do conjunto, com o OcrResult carregado
+
+    Returns:
+        Dicionário {document_type: Document}.
+    """
+    from .models import Document
+
+    documents = {}
+    queryset = (
+        Document.objects.select_related('ocr_result')
+        .filter(proposal_id=proposal_id, is_deleted=False, document_type__in=OCR_DOCUMENT_TYPES)
+        .order_by('document_type', '-created_at')
+    )
+    for document in queryset:
+        documents.setdefault(document.document_type, document)
+    return documents
+
+
+def get_missing_types(documents):
+    return [document_type for document_type in OCR_DOCUMENT_TYPES if document_type not in documents]
+
+
+def _ocr_result(document):
+    # Acesso reverso ao OneToOne sem exceção quando não há resultado
+    return getattr(document, 'ocr_result', None)
+
+
+def _needs_dispatch(document, waiting, stuck_before):
+    # Sem resultado, ou pendente sem tarefa viva: nem aguardando vaga na faixa
+    # padrão nem enviado recentemente (ainda na fila do broker). Os demais
+    # seguem na própria tarefa e entram no resumo ao concluir.
+    ocr_result = _ocr_result(document)
+    if ocr_result is None:
+        return True
+    if ocr_result.ocr_complete or ocr_result.task_status != 'PENDING' or document.id in waiting:
+        return False
+    return ocr_result.updated_at < stuck_before
+
+
+def start(proposal_id, lane=lanes.LANE_INTERACTIVE):
+    """
+    Envia o OCR do conjunto de documentos da proposta como um chord
+
+    Não faz nada se o conjunto estiver incompleto ou se já houver um
+    processamento da proposta em andamento.
+
+    Returns:
+        Dicionário com o estado do envio: 'started', 'running' ou 'incomplete'.
+    """
+    from .tasks import finalize_proposal_ocr, STUCK_TASK_MINUTES
+
+    documents = get_documents(proposal_id)
+    missing = get_missing_types(documents)
+    if missing:
+        return {'status': 'incomplete', 'missing_types': missing}
+
+    started_at = time.time()
+    if not get_redis().set(_lock_key(proposal_id), started_at, nx=True, ex=get_max_wait() + LOCK_GRACE_SECONDS):
+        return {'status': 'running'}
+
+    # Gravado antes do envio: o callback pode terminar antes do retorno do chord
+    get_redis().hset(_key(proposal_id), mapping={'status': 'processing', 'started_at': started_at})
+    get_redis().hdel(_key(proposal_id), 'summary', 'completed_at')
+    get_redis().expire(_key(proposal_id), SUMMARY_TTL)
+
+    try:
+        waiting = lanes.get_waiting_documents(document.id for document in documents.values())
+    except Exception as e:
+        logger.warning("Erro ao consultar documentos em espera na faixa OCR padrão", error=str(e))
+        waiting = set(document.id for document in documents.values())
+    stuck_before = timezone.now() - timedelta(minutes=STUCK_TASK_MINUTES)
+
+    header = []
+    for document in documents.values():
+        if _needs_dispatch(document, waiting, stuck_before):
+            ocr_result = lanes.prepare_ocr(document, _ocr_result(document))
+            header.append(lanes.ocr_signature(document.id, lane, task_id=ocr_result.task_id))
+
+    callback = finalize_proposal_ocr.signature(args=[proposal_id, started_at], queue=lane)
+    if header:
+        result = chord(header)(callback)
+    else:
+        # Nada a enviar: apenas aguardar os documentos em andamento e validar
+        result = callback.clone(args=([],)).apply_async()
+
+    get_redis().hset(_key(proposal_id), 'task_id', result.id)
+
+    logger.info(
+        "OCR da proposta enviado",
+        proposal_id=proposal_id,
+        dispatched=len(header),
+        documents=len(documents),
+        task_id=result.id
+    )
+    return {
+        'status': 'started',
+        'task_id': result.id,
+        'dispatched': [signature.args[0] for signature in header],
+        'documents': {document_type: document.id for document_type, document in documents.items()},
+    }
+
+
+def start_if_complete(document):
+    """
+    Inicia o OCR da proposta do documento se ele completou o conjunto
+
+    Returns:
+        True se o chord da proposta foi enviado (o documento está nele).
+    """
+    if not document.proposal_id or document.document_type not in OCR_DOCUMENT_TYPES:
+        return False
+    try:
+        return start(document.proposal_id)['status'] == 'started'
+    except Exception as e:
+        logger.warning("Erro ao iniciar OCR da proposta", error=str(e), proposal_id=document.proposal_id)
+        return False
+
+
+def is_ready(documents):
+    return all(
+        _ocr_result(document) is not None and _ocr_result(document).ocr_complete
+        for document in documents.values()
+    )
+
+
+def _normalize_name(value):
+    value = unicodedata.normalize('NFKD', value)
+    value = ''.join(char for char in value if not unicodedata.combining(char))
+    return ' '.join(value.upper().split())
+
+
+def _normalize_cpf(value):
+    return ''.join(char for char in value if char.isdigit())
+
+
+def _profile_cpf(user_id):
+    from celebra_capital.api.users.models import UserProfile
+
+    cpf = UserProfile.objects.filter(user_id=user_id).values_list('cpf', flat=True).first()
+    return _normalize_cpf(cpf) if cpf else None
+
+
+def cross_check(documents, user_id=None):
+    """
+    Validação agregada: nome e CPF devem coincidir entre os documentos
+
+    O CPF também é comparado ao do cadastro do usuário, quando houver.
+
+    Returns:
+        Dicionário com nome, CPF, documentos e divergências encontradas.
+    """
+    names = {}
+    cpfs = {}
+    summary_documents = []
+    issues = []
+
+    for document_type, document in documents.items():
+        ocr_result = _ocr_result(document)
+        extracted_data = (ocr_result.extracted_data if ocr_result else None) or {}
+        failed = ocr_result is None or not ocr_result.ocr_complete or bool(ocr_result.error_message)
+
+        summary_documents.append({
+            'document_id': document.id,
+            'document_type': document_type,
+            'ocr_complete': bool(ocr_result and ocr_result.ocr_complete),
+            'confidence_score': ocr_result.confidence_score if ocr_result else None,
+            'error': ocr_result.error_message if ocr_result else None,
+        })
+        if failed:
+            issues.append(f"OCR não concluído com sucesso: {document.get_document_type_display()}")
+
+        if extracted_data.get('nome'):
+            names[document_type] = _normalize_name(extracted_data['nome'])
+        if extracted_data.get('cpf'):
+            cpfs[document_type] = _normalize_cpf(extracted_data['cpf'])
+
+    if len(set(names.values())) > 1:
+        issues.append("Nome divergente entre documentos: " + ", ".join(
+            f"{document_type}={name}" for document_type, name in names.items()
+        ))
+
+    profile_cpf = _profile_cpf(user_id) if user_id else None
+    if profile_cpf and cpfs:
+        cpfs['cadastro'] = profile_cpf
+    if len(set(cpfs.values())) > 1:
+        issues.append("CPF divergente: " + ", ".join(
+            f"{source}={cpf}" for source, cpf in cpfs.items()
+        ))
+
+    if not names:
+        issues.append("Nome não detectado nos documentos")
+    if not cpfs:
+        issues.append("CPF não detectado nos documentos")
+
+    return {
+        'name': next(iter(names.values()), None),
+        'cpf': next(iter(cpfs.values()), None),
+        'is_consistent': not issues,
+        'issues': issues,
+        'documents': summary_documents,
+    }
+
+
+def publish_ready(proposal_id, summary):
+    """
+    Grava o resumo da proposta e publica o evento único de documentos prontos
+    """
+    get_redis().hset(_key(proposal_id), mapping={
+        'status': 'ready' if summary['ready'] else 'timeout',
+        'summary': json.dumps(summary),
+        'completed_at': time.time(),
+    })
+    get_redis().expire(_key(proposal_id), SUMMARY_TTL)
+
+    try:
+        async_to_sync(get_channel_layer().group_send)(
+            f'proposal_ocr_{proposal_id}',
+            {'type': 'proposal_documents_ready', 'summary': summary}
+        )
+    except Exception as e:
+        logger.error("Erro ao publicar conclusão do OCR da proposta", error=str(e), proposal_id=proposal_id)
+
+
+def finalize(proposal_id, started_at):
+    """
+    Monta o resumo da proposta após o OCR de todos os documentos
+
+    Returns:
+        Resumo da validação agregada (ver cross_check), ou None se ainda houver
+        documentos em processamento dentro do tempo máximo de espera ou se o
+        resumo do envio já foi publicado.
+    """
+    from celebra_capital.api.proposals.models import Proposal
+
+    documents = get_documents(proposal_id)
+    ready = is_ready(documents)
+    elapsed = time.time() - started_at
+    if not ready and elapsed < get_max_wait():
+        return None
+
+    # Conclusão do último documento e callback do chord podem chegar juntos: só um publica
+    if not get_redis().eval(CLAIM_SCRIPT, 1, _lock_key(proposal_id), started_at):
+        return None
+
+    user_id = Proposal.objects.filter(id=proposal_id).values_list('user_id', flat=True).first()
+    summary = cross_check(documents, user_id)
+    summary.update({
+        'proposal_id': proposal_id,
+        'ready': ready,
+        'elapsed': round(elapsed, 3),
+        'completed_at': timezone.now().isoformat(),
+    })
+    publish_ready(proposal_id, summary)
+
+    logger.info(
+        "Documentos da proposta prontos" if ready else "Tempo esgotado aguardando OCR da proposta",
+        proposal_id=proposal_id,
+        is_consistent=summary['is_consistent'],
+        issues=len(summary['issues']),
+        elapsed=f"{elapsed:.2f}s"
+    )
+    return summary
+
+
+def on_document_complete(document_id, document=None):
+    """
+    Publica o resumo da proposta se o documento concluído era o último pendente
+
+    Chamado ao fim do OCR de cada documento (sucesso ou falha definitiva);
+    não faz nada se o documento não pertence a uma proposta em processamento.
+
+    Returns:
+        Resumo publicado, ou None.
+    """
+    from .models import Document
+
+    try:
+        if document is None:
+            document = Document.objects.filter(id=document_id).only('id', 'proposal_id', 'document_type').first()
+        if document is None or not document.proposal_id or document.document_type not in OCR_DOCUMENT_TYPES:
+            return None
+        started_at = get_redis().get(_lock_key(document.proposal_id))
+        if started_at is None:
+            return None
+        return finalize(document.proposal_id, float(started_at))
+    except Exception as e:
+        logger.warning("Erro ao concluir OCR da proposta", error=str(e), document_id=document_id)
+        return None
+
+
+def get_summary(proposal_id):
+    """
+    Estado do OCR da proposta
+
+    Returns:
+        Dicionário com 'status' ('processing', 'ready' ou 'timeout') e, quando
+        concluído, 'summary'; ou None se o OCR da proposta nunca foi enviado.
+    """
+    raw = get_redis().hgetall(_key(proposal_id))
+    if not raw:
+        return None
+    state = {
+        (key.decode() if isinstance(key, bytes) else key): (value.decode() if isinstance(value, bytes) else value)
+        for key, value in raw.items()
+    }
+    result = {'status': state.get('status'), 'task_id': state.get('task_id')}
+    if state.get('summary'):
+        result['summary'] = json.loads(state['summary'])
+    return result
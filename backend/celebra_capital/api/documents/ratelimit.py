@@ -0,0 +1,197 @@
+"""
+Governador de taxa compartilhado para chamadas aos provedores de OCR
+
+Todos os workers consultam um token bucket no Redis (ocr:ratelimit:<motor>)
+antes de chamar um motor remoto. A taxa de reposição se ajusta por AIMD:
+
+- cada chamada bem-sucedida aumenta a taxa de forma aditiva
+  (OCR_RATE_LIMIT_INCREASE req/s a cada segundo de sucesso contínuo);
+- um erro de quota reduz a taxa de forma multiplicativa
+  (OCR_RATE_LIMIT_DECREASE), no máximo uma vez por OCR_RATE_LIMIT_COOLDOWN_MS,
+  para que uma rajada de erros simultâneos conte como um único sinal.
+
+A taxa em que ocorreu o último erro de quota é guardada como teto; acima de
+90% dele o aumento é dez vezes mais lento, mantendo a vazão logo abaixo do
+limite do provedor em vez de oscilar em dente de serra.
+"""
+import time
+from django.conf import settings
+import structlog
+
+from .redis_client import get_redis
+
+logger = structlog.get_logger(__name__)
+
+# Tempo de vida do estado do governador sem uso
+STATE_TTL_MS = 24 * 60 * 60 * 1000
+
+# Reserva tokens do bucket; retorna 0 ou os milissegundos até haver tokens suficientes
+ACQUIRE_SCRIPT = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+local cost = tonumber(ARGV[1])
+local rate = tonumber(redis.call('HGET', KEYS[1], 'rate')) or tonumber(ARGV[2])
+local burst = math.max(tonumber(ARGV[3]), cost)
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+local ts = tonumber(redis.call('HGET', KEYS[1], 'ts'))
+if tokens == nil or ts == nil then
+    tokens = burst
+    ts = now
+end
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate / 1000)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    redis.call('HINCRBY', KEYS[1], 'granted', cost)
+else
+    wait = math.ceil((cost - tokens) * 1000 / rate)
+    redis.call('HINCRBY', KEYS[1], 'throttled', 1)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now, 'rate', rate)
+redis.call('PEXPIRE', KEYS[1], ARGV[4])
+return wait
+"""
+
+# Aumento aditivo da taxa após uma chamada bem-sucedida
+SUCCESS_SCRIPT = """
+local rate = tonumber(redis.call('HGET', KEYS[1], 'rate')) or tonumber(ARGV[1])
+local ceiling = tonumber(redis.call('HGET', KEYS[1], 'ceiling'))
+local step = tonumber(ARGV[2]) / rate
+if ceiling and rate >= ceiling * 0.9 then
+    step = step / 10
+end
+rate = math.min(tonumber(ARGV[3]), rate + step)
+redis.call('HSET', KEYS[1], 'rate', rate)
+redis.call('PEXPIRE', KEYS[1], ARGV[4])
+return tostring(rate)
+"""
+
+# Redução multiplicativa da taxa após um erro de quota (uma vez por janela de cooldown)
+QUOTA_ERROR_SCRIPT = """
+local rate = tonumber(redis.call('HGET', KEYS[1], 'rate')) or tonumber(ARGV[1])
+redis.call('HINCRBY', KEYS[1], 'quota_errors', 1)
+if redis.call('SET', KEYS[2], 1, 'NX', 'PX', ARGV[4]) then
+    redis.call('HSET', KEYS[1], 'ceiling', rate)
+    rate = math.max(tonumber(ARGV[3]), rate * tonumber(ARGV[2]))
+    redis.call('HSET', KEYS[1], 'rate', rate, 'tokens', 0)
+end
+redis.call('PEXPIRE', KEYS[1], ARGV[5])
+return tostring(rate)
+"""
+
+
+class RateLimitExceeded(Exception):
+    """O bucket não terá tokens dentro do tempo máximo de espera"""
+
+    def __init__(self, engine_name, retry_after):
+        super().__init__(f"Limite de taxa do motor {engine_name} atingido, tentar em {retry_after:.1f}s")
+        self.engine_name = engine_name
+        self.retry_after = retry_after
+
+
+def _key(engine_name):
+    return f'ocr:ratelimit:{engine_name}'
+
+
+def _cooldown_key(engine_name):
+    return f'ocr:ratelimit:{engine_name}:cooldown'
+
+
+def _initial_rate():
+    return float(getattr(settings, 'OCR_RATE_LIMIT_INITIAL_RATE', 10.0))
+
+
+def is_limited(engine_name):
+    """Indica se as chamadas a este motor passam pelo governador"""
+    return (getattr(settings, 'OCR_RATE_LIMIT_ENABLED', True)
+            and engine_name in (getattr(settings, 'OCR_RATE_LIMITED_ENGINES', ['vision']) or []))
+
+
+def acquire(engine_name, cost=1, max_wait_ms=None):
+    """
+    Aguarda tokens suficientes para uma chamada ao motor
+
+    Espera no próprio worker apenas por até OCR_RATE_LIMIT_MAX_WAIT_MS;
+    esperas maiores levantam RateLimitExceeded para que a tarefa seja
+    reagendada sem ocupar o worker. Falhas do Redis liberam a chamada.
+
+    Args:
+        cost: número de imagens da chamada (lotes consomem um token por imagem)
+    """
+    if max_wait_ms is None:
+        max_wait_ms = getattr(settings, 'OCR_RATE_LIMIT_MAX_WAIT_MS', 2000)
+    burst = getattr(settings, 'OCR_RATE_LIMIT_BURST', 10)
+
+    waited_ms = 0
+    while True:
+        try:
+            wait_ms = int(get_redis().eval(
+                ACQUIRE_SCRIPT, 1, _key(engine_name), cost, _initial_rate(), burst, STATE_TTL_MS
+            ))
+        except Exception as e:
+            logger.warning("Governador de taxa indisponível, liberando chamada", error=str(e), engine=engine_name)
+            return waited_ms
+
+        if wait_ms <= 0:
+            return waited_ms
+
+        if waited_ms + wait_ms > max_wait_ms:
+            raise RateLimitExceeded(engine_name, wait_ms / 1000.0)
+
+        time.sleep(wait_ms / 1000.0)
+        waited_ms += wait_ms
+
+
+def record_success(engine_name):
+    """Aumento aditivo da taxa após uma chamada bem-sucedida"""
+    try:
+        get_redis().eval(
+            SUCCESS_SCRIPT, 1, _key(engine_name),
+            _initial_rate(),
+            getattr(settings, 'OCR_RATE_LIMIT_INCREASE', 0.5),
+            getattr(settings, 'OCR_RATE_LIMIT_MAX_RATE', 30.0),
+            STATE_TTL_MS
+        )
+    except Exception as e:
+        logger.warning("Erro ao atualizar governador de taxa", error=str(e), engine=engine_name)
+
+
+def record_quota_error(engine_name):
+    """Redução multiplicativa da taxa após um erro de quota do provedor"""
+    try:
+        rate = float(get_redis().eval(
+            QUOTA_ERROR_SCRIPT, 2, _key(engine_name), _cooldown_key(engine_name),
+            _initial_rate(),
+            getattr(settings, 'OCR_RATE_LIMIT_DECREASE', 0.5),
+            getattr(settings, 'OCR_RATE_LIMIT_MIN_RATE', 1.0),
+            getattr(settings, 'OCR_RATE_LIMIT_COOLDOWN_MS', 2000),
+            STATE_TTL_MS
+        ))
+    except Exception as e:
+        logger.warning("Erro ao atualizar governador de taxa", error=str(e), engine=engine_name)
+        return None
+
+    logger.warning("Erro de quota do provedor de OCR", engine=engine_name, rate=rate)
+    return rate
+
+
+def get_state(engine_name):
+    """Estado atual do governador de um motor (taxa, teto e contadores)"""
+    try:
+        raw = get_redis().hgetall(_key(engine_name))
+    except Exception as e:
+        logger.warning("Erro ao ler governador de taxa", error=str(e), engine=engine_name)
+        return None
+
+    state = {
+        (key.decode() if isinstance(key, bytes) else key): float(value)
+        for key, value in raw.items()
+    }
+    return {
+        'rate': state.get('rate', _initial_rate()),
+        'ceiling': state.get('ceiling'),
+        'tokens': state.get('tokens'),
+        'granted': int(state.get('granted', 0)),
+        'throttled': int(state.get('throttled', 0)),
+        'quota_errors': int(state.get('quota_errors', 0)),
+    }
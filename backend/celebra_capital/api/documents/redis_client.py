@@ -0,0 +1,26 @@
+"""
+Conexão Redis compartilhada pelos componentes do pipeline de OCR
+"""
+import os
+import redis
+from django.conf import settings
+
+_connection = None
+_connection_pid = None
+
+
+def get_redis():
+    """
+    Retorna uma conexão Redis do processo atual
+
+    A conexão é recriada após um fork para não compartilhar sockets entre
+    processos do worker.
+    """
+    global _connection, _connection_pid
+
+    if _connection is None or _connection_pid != os.getpid():
+        redis_url = getattr(settings, 'REDIS_URL', 'redis://localhost:6379/0')
+        _connection = redis.from_url(redis_url)
+        _connection_pid = os.getpid()
+
+    return _connection
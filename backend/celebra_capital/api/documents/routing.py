@@ -1,6 +1,13 @@
 from django.urls import re_path
-from . import consumers
+from . import consumers, streams
 
 websocket_urlpatterns = [
     re_path(r'ws/ocr/(?P<document_id>\w+)/$', consumers.OcrConsumer.as_asgi()),
-] 
\ No newline at end of file
+    re_path(r'ws/proposals/(?P<proposal_id>\d+)/ocr/$', consumers.ProposalOcrConsumer.as_asgi()),
+]
+
+# Rotas HTTP atendidas diretamente pelo ASGI (conexões mantidas abertas)
+http_urlpatterns = [
+    re_path(r'api/v1/documents/(?P<document_id>\d+)/ocr/stream/$', streams.OcrStatusStreamConsumer.as_asgi()),
+    re_path(r'api/v1/documents/(?P<document_id>\d+)/ocr/wait/$', streams.OcrStatusLongPollConsumer.as_asgi()),
+]
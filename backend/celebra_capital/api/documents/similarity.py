@@ -0,0 +1,232 @@
+"""
+Detecção de quase duplicatas por hash perceptual
+
+O hash SHA-256 (ocr_cache.py) só encontra o mesmo arquivo byte a byte; um RG
+fotografado de novo gera outro arquivo. Para imagens, o upload também grava
+um dHash de 64 bits (gradientes horizontais de uma miniatura 9x8 em tons de
+cinza), que muda pouco com reenquadramento leve, compressão e iluminação.
+
+Índice por distância de Hamming: o hash é dividido em 4 faixas de 16 bits,
+cada uma em uma coluna indexada de Document. Dois hashes a até 3 bits de
+distância têm ao menos uma faixa idêntica, então a busca consulta as faixas
+iguais e calcula a distância exata só nesses candidatos. Distâncias maiores
+também são encontradas quando alguma faixa coincide, o que é o caso comum.
+
+Usos:
+- Reaproveitamento do OCR: um documento quase idêntico a outro do mesmo
+  usuário, do mesmo tipo e já processado, reutiliza o resultado após uma
+  confirmação barata (dHash de 256 bits das duas imagens). Apenas para
+  documentos de identidade (OCR_NEAR_DUPLICATE_REUSE_TYPES): o hash não
+  enxerga dígitos, e dois holerites ou contas do mesmo modelo, de meses
+  diferentes, seriam confundidos com valores e datas errados.
+- Revisão de fraude: a equipe consulta documentos parecidos de outros
+  usuários (/documents/<id>/duplicates/).
+"""
+import os
+from django.conf import settings
+from django.db.models import Q
+import structlog
+
+from .preprocessing import IMAGE_EXTENSIONS
+
+logger = structlog.get_logger(__name__)
+
+# Lado da miniatura do dHash indexado (64 bits)
+HASH_SIZE = 8
+
+# Lado da miniatura do dHash de confirmação (256 bits)
+CONFIRM_HASH_SIZE = 16
+
+# Faixas do índice de Hamming
+BAND_BITS = 16
+BANDS = 64 // BAND_BITS
+BAND_FIELDS = tuple(f'phash_band_{index}' for index in range(BANDS))
+
+
+def is_enabled():
+    return getattr(settings, 'OCR_NEAR_DUPLICATE_ENABLED', True)
+
+
+def get_max_distance():
+    """Distância de Hamming máxima (em bits) para considerar duas imagens quase iguais"""
+    return getattr(settings, 'OCR_NEAR_DUPLICATE_MAX_DISTANCE', 6)
+
+
+def get_reuse_types():
+    """Tipos de documento cujo resultado OCR pode ser reaproveitado de uma quase duplicata"""
+    return getattr(settings, 'OCR_NEAR_DUPLICATE_REUSE_TYPES', ('rg', 'cpf'))
+
+
+def is_image(file_name):
+    return os.path.splitext(file_name or '')[1].lower() in IMAGE_EXTENSIONS
+
+
+def _open_image(file_obj):
+    from PIL import Image, ImageOps
+
+    image = Image.open(file_obj)
+    image.draft('L', (256, 256))  # JPEG: decodificar já reduzido
+    return ImageOps.exif_transpose(image).convert('L')
+
+
+def dhash(image, hash_size=HASH_SIZE):
+    """dHash de uma imagem em tons de cinza, como inteiro de hash_size² bits"""
+    from PIL import Image
+
+    pixels = list(image.resize((hash_size + 1, hash_size), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for column in range(hash_size):
+            value = (value << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+    return value
+
+
+def compute_hash(file_obj, hash_size=HASH_SIZE):
+    """
+    Calcula o dHash de uma imagem
+
+    Aceita um caminho no disco ou um objeto de arquivo (reposicionado no
+    início após a leitura).
+    """
+    if hasattr(file_obj, 'seek'):
+        file_obj.seek(0)
+    try:
+        return dhash(_open_image(file_obj), hash_size)
+    finally:
+        if hasattr(file_obj, 'seek'):
+            file_obj.seek(0)
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def _to_signed(value):
+    # BigIntegerField é com sinal: os 64 bits são gravados em complemento de dois
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+def _bands(value):
+    return [(value >> (BAND_BITS * index)) & ((1 << BAND_BITS) - 1) for index in range(BANDS)]
+
+
+def hash_fields(file_obj, file_name):
+    """
+    Campos do hash perceptual para gravar em Document
+
+    Returns:
+        Dicionário com perceptual_hash e as faixas do índice, ou vazio se o
+        arquivo não for uma imagem (ou não puder ser lido).
+    """
+    if not is_enabled() or not is_image(file_name):
+        return {}
+    try:
+        value = compute_hash(file_obj)
+    except Exception as e:
+        logger.warning("Erro ao calcular hash perceptual", error=str(e), file_name=file_name)
+        return {}
+
+    fields = {'perceptual_hash': _to_signed(value)}
+    fields.update(zip(BAND_FIELDS, _bands(value)))
+    return fields
+
+
+def ensure_hash(document):
+    """Calcula e grava o hash perceptual de um documento antigo, se ainda não houver"""
+    if document.perceptual_hash is not None:
+        return True
+    fields = hash_fields(document.file.path, document.file.name)
+    if not fields:
+        return False
+    for field, value in fields.items():
+        setattr(document, field, value)
+    document.save(update_fields=list(fields))
+    return True
+
+
+def find_near_duplicates(document, max_distance=None, queryset=None):
+    """
+    Documentos com imagem quase igual à do documento
+
+    Returns:
+        Lista de tuplas (Document, distância), da mais próxima para a mais distante.
+    """
+    from .models import Document
+
+    if document.perceptual_hash is None:
+        return []
+    if max_distance is None:
+        max_distance = get_max_distance()
+    if queryset is None:
+        queryset = Document.objects.filter(is_deleted=False)
+
+    value = _to_unsigned(document.perceptual_hash)
+    same_band = Q()
+    for field, band in zip(BAND_FIELDS, _bands(value)):
+        same_band |= Q(**{field: band})
+
+    matches = []
+    for candidate in queryset.filter(same_band).exclude(id=document.id):
+        distance = hamming(value, _to_unsigned(candidate.perceptual_hash))
+        if distance <= max_distance:
+            matches.append((candidate, distance))
+    matches.sort(key=lambda match: match[1])
+    return matches
+
+
+def confirm(file_a, file_b):
+    """
+    Confirmação barata de que duas imagens são o mesmo documento
+
+    Compara dHashes de 256 bits (mais detalhados que o do índice), sem OCR.
+    Imagens sem relação ficam perto de metade dos bits diferentes; novas
+    fotos do mesmo documento, bem abaixo de OCR_NEAR_DUPLICATE_CONFIRM_RATIO.
+    """
+    max_ratio = getattr(settings, 'OCR_NEAR_DUPLICATE_CONFIRM_RATIO', 0.25)
+    try:
+        distance = hamming(compute_hash(file_a, CONFIRM_HASH_SIZE), compute_hash(file_b, CONFIRM_HASH_SIZE))
+    except Exception as e:
+        logger.warning("Erro ao confirmar quase duplicata", error=str(e))
+        return False
+    return distance <= max_ratio * CONFIRM_HASH_SIZE * CONFIRM_HASH_SIZE
+
+
+def find_reusable_result(document):
+    """
+    Resultado OCR reaproveitável de uma quase duplicata do documento
+
+    Considera apenas documentos de identidade (get_reuse_types) do mesmo
+    usuário e tipo, com OCR concluído sem erro, e confirma a semelhança antes
+    de reaproveitar.
+
+    Returns:
+        Tupla (OcrResult, distância), ou (None, None).
+    """
+    from .models import Document
+
+    if not is_enabled() or document.document_type not in get_reuse_types() or not ensure_hash(document):
+        return None, None
+
+    queryset = Document.objects.select_related('ocr_result').filter(
+        user_id=document.user_id,
+        document_type=document.document_type,
+        is_deleted=False,
+        ocr_result__ocr_complete=True,
+        ocr_result__error_message__isnull=True,
+        ocr_result__extracted_data__isnull=False,
+    )
+    for candidate, distance in find_near_duplicates(document, queryset=queryset):
+        if confirm(document.file.path, candidate.file.path):
+            logger.info(
+                "Quase duplicata confirmada",
+                document_id=document.id,
+                source_document_id=candidate.id,
+                distance=distance
+            )
+            return candidate.ocr_result, distance
+    return None, None
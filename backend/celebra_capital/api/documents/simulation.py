@@ -0,0 +1,76 @@
+"""
+OCR simulado sem bloqueio do worker
+
+Em desenvolvimento e testes de carga, a latência de um motor de OCR é
+simulada com continuações agendadas (countdown) em vez de time.sleep: cada
+etapa de progresso é uma tarefa curta e o worker fica livre entre elas. Assim
+um pool pequeno de workers sustenta milhares de OCRs simulados concorrentes.
+
+A latência total de cada documento é sorteada de uma distribuição
+configurável (OCR_FAKE_LATENCY_DISTRIBUTION) e dividida igualmente entre as
+OCR_FAKE_PROGRESS_STEPS etapas.
+"""
+import random
+from django.conf import settings
+
+DISTRIBUTIONS = ('fixed', 'uniform', 'exponential', 'lognormal')
+
+# Progresso publicado ao longo das etapas (entre 30% e 90%)
+PROGRESS_START = 30
+PROGRESS_END = 90
+
+
+def get_latency_ms():
+    return max(0, getattr(settings, 'OCR_FAKE_LATENCY_MS', 2000))
+
+
+def get_steps():
+    return max(1, getattr(settings, 'OCR_FAKE_PROGRESS_STEPS', 4))
+
+
+def is_deferred():
+    """Indica se a latência simulada deve ser cumprida com continuações agendadas"""
+    return get_latency_ms() > 0
+
+
+def sample_latency_ms(rng=random):
+    """
+    Sorteia a latência total (ms) de um documento
+
+    - fixed: sempre OCR_FAKE_LATENCY_MS
+    - uniform: entre latência * (1 - jitter) e latência * (1 + jitter)
+    - exponential: média OCR_FAKE_LATENCY_MS (cauda longa, chegadas independentes)
+    - lognormal: mediana OCR_FAKE_LATENCY_MS, sigma = jitter (cauda p99 realista)
+    """
+    latency = get_latency_ms()
+    distribution = getattr(settings, 'OCR_FAKE_LATENCY_DISTRIBUTION', 'fixed')
+    jitter = max(0.0, getattr(settings, 'OCR_FAKE_LATENCY_JITTER', 0.5))
+
+    if latency == 0 or distribution == 'fixed':
+        value = latency
+    elif distribution == 'uniform':
+        value = rng.uniform(latency * max(0.0, 1 - jitter), latency * (1 + jitter))
+    elif distribution == 'exponential':
+        value = rng.expovariate(1.0 / latency)
+    elif distribution == 'lognormal':
+        value = latency * rng.lognormvariate(0.0, jitter)
+    else:
+        raise ValueError(f"Distribuição de latência desconhecida: {distribution}")
+
+    # Limitar a cauda para não ultrapassar o limite de tempo das tarefas OCR
+    return min(value, getattr(settings, 'OCR_FAKE_LATENCY_MAX_MS', 60000))
+
+
+def plan(rng=random):
+    """
+    Gera o plano de etapas de um documento
+
+    Returns:
+        Tupla (step_delay_seconds, progress_steps), onde progress_steps é a
+        lista de percentuais publicados ao fim de cada etapa.
+    """
+    steps = get_steps()
+    delay = sample_latency_ms(rng) / 1000.0 / steps
+    span = PROGRESS_END - PROGRESS_START
+    progress_steps = [PROGRESS_START + int(span * (index + 1) / steps) for index in range(steps)]
+    return delay, progress_steps
@@ -0,0 +1,249 @@
+"""
+Acompanhamento do OCR por HTTP no ASGI: Server-Sent Events e long-poll
+
+Alternativa ao WebSocket para clientes que não conseguem mantê-lo aberto.
+As duas rotas assinam o mesmo grupo ocr_<document_id> do channel layer e
+mantêm a conexão ociosa até o status mudar, em vez de consultas repetidas a
+/documents/<id>/ocr/status/:
+
+- ocr/stream/: fluxo text/event-stream com um evento ocr_status a cada
+  mudança; termina no estado final ou após OCR_STATUS_STREAM_MAX_SECONDS
+  (o EventSource reconecta sozinho, enviando Last-Event-ID).
+- ocr/wait/: responde assim que o status difere do ETag informado
+  (If-None-Match ou ?etag=), ou 304 após o timeout (máximo
+  OCR_STATUS_LONGPOLL_TIMEOUT segundos).
+
+O status vem do registro em cache (ver progress.py); o ETag é o mesmo de
+OcrStatusView. A autenticação usa o JWT da API, no cabeçalho Authorization ou
+em ?token= (o EventSource do navegador não envia cabeçalhos). Se o cliente
+desconectar durante a espera, a conexão é encerrada e a assinatura do grupo
+desfeita na hora, sem aguardar o timeout.
+"""
+import asyncio
+import json
+import time
+from urllib.parse import parse_qs
+from channels.db import database_sync_to_async
+from channels.generic.http import AsyncHttpConsumer
+from django.conf import settings
+import structlog
+
+from . import progress as ocr_progress
+
+logger = structlog.get_logger(__name__)
+
+
+class ClientDisconnected(Exception):
+    """O cliente fechou a conexão enquanto aguardava uma atualização"""
+
+
+def _status_payload(state):
+    data = {
+        'complete': state['complete'],
+        'progress': state['progress'],
+        'task_status': state['task_status'],
+        'retry_count': state['retry_count'],
+    }
+    if state['message']:
+        data['message'] = state['message']
+    return data
+
+
+class OcrStatusHttpConsumer(AsyncHttpConsumer):
+    """
+    Base das rotas HTTP de acompanhamento do OCR
+
+    O AsyncHttpConsumer só processa mensagens do próprio canal depois que
+    handle() retorna; por isso as atualizações do grupo chegam em um canal
+    separado, lido diretamente dentro de handle(). Pelo mesmo motivo, o
+    http.disconnect do cliente não seria visto até o fim da espera: a
+    mensagem é lida da conexão ASGI por uma tarefa paralela, que interrompe
+    a espera (ClientDisconnected).
+    """
+
+    async def __call__(self, scope, receive, send):
+        # Conexão ASGI, acompanhada durante handle() (ver _watch_disconnect)
+        self.asgi_receive = receive
+        return await super().__call__(scope, receive, send)
+
+    async def _watch_disconnect(self):
+        while True:
+            message = await self.asgi_receive()
+            if message['type'] == 'http.disconnect':
+                self.disconnected.set()
+                return
+
+    async def handle(self, body):
+        self.document_id = int(self.scope['url_route']['kwargs']['document_id'])
+        self.query = parse_qs(self.scope.get('query_string', b'').decode())
+        self.headers = dict(self.scope.get('headers', []))
+        self.group_name = f'ocr_{self.document_id}'
+        self.updates_channel = None
+
+        user = await self._authenticate()
+        if user is None:
+            return await self._send_json(401, {'error': 'Autenticação necessária'})
+
+        # Assinar antes de ler o status: nenhuma mudança entre os dois se perde
+        self.updates_channel = await self.channel_layer.new_channel()
+        await self.channel_layer.group_add(self.group_name, self.updates_channel)
+        self.disconnected = asyncio.Event()
+        watcher = asyncio.ensure_future(self._watch_disconnect())
+        try:
+            state = await database_sync_to_async(ocr_progress.get_status)(self.document_id, user.id)
+            if state is None:
+                return await self._send_json(404, {'error': 'Documento sem processamento OCR'})
+            self.user_id = user.id
+            await self.respond(state)
+        except ClientDisconnected:
+            logger.debug("Cliente desconectado do acompanhamento OCR", document_id=self.document_id)
+        finally:
+            watcher.cancel()
+            await self.channel_layer.group_discard(self.group_name, self.updates_channel)
+
+    async def respond(self, state):
+        raise NotImplementedError
+
+    async def wait_for_update(self, timeout):
+        """
+        Aguarda uma mensagem do grupo por até timeout segundos
+
+        Raises:
+            ClientDisconnected: o cliente fechou a conexão durante a espera.
+
+        Returns:
+            Status atual após a mudança, ou None se o tempo se esgotar.
+        """
+        update = asyncio.ensure_future(self.channel_layer.receive(self.updates_channel))
+        disconnect = asyncio.ensure_future(self.disconnected.wait())
+        done, pending = await asyncio.wait(
+            {update, disconnect}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+        )
+        for task in pending:
+            task.cancel()
+
+        if disconnect in done:
+            raise ClientDisconnected()
+        if update not in done:
+            return None
+        return await database_sync_to_async(ocr_progress.get_status)(self.document_id, self.user_id)
+
+    @database_sync_to_async
+    def _authenticate(self):
+        from rest_framework.exceptions import AuthenticationFailed
+        from rest_framework_simplejwt.authentication import JWTAuthentication
+        from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+        parts = self.headers.get(b'authorization', b'').split()
+        if len(parts) == 2 and parts[0].lower() == b'bearer':
+            raw_token = parts[1].decode()
+        else:
+            raw_token = (self.query.get('token') or [None])[0]
+        if not raw_token:
+            return None
+
+        authentication = JWTAuthentication()
+        try:
+            return authentication.get_user(authentication.get_validated_token(raw_token))
+        except (InvalidToken, TokenError, AuthenticationFailed):
+            return None
+
+    async def _send_json(self, status, data, headers=None):
+        await self.send_response(
+            status,
+            json.dumps(data).encode('utf-8'),
+            headers=[(b'Content-Type', b'application/json')] + (headers or [])
+        )
+
+
+class OcrStatusStreamConsumer(OcrStatusHttpConsumer):
+    """Fluxo Server-Sent Events do status OCR de um documento"""
+
+    async def respond(self, state):
+        max_seconds = getattr(settings, 'OCR_STATUS_STREAM_MAX_SECONDS', 300)
+        keepalive = getattr(settings, 'OCR_STATUS_STREAM_KEEPALIVE_SECONDS', 15)
+        deadline = time.monotonic() + max_seconds
+
+        await self.send_headers(headers=[
+            (b'Content-Type', b'text/event-stream'),
+            (b'Cache-Control', b'no-cache'),
+            # Sem buffer no proxy reverso (nginx), para que cada evento chegue na hora
+            (b'X-Accel-Buffering', b'no'),
+        ])
+        await self.send_body(b'retry: 3000\n\n', more_body=True)
+
+        # Na reconexão, não repetir o evento que o cliente já recebeu
+        last_sent = self.headers.get(b'last-event-id', b'').decode() or None
+        events = 0
+
+        try:
+            while True:
+                etag = ocr_progress.get_etag(state)
+                if etag != last_sent:
+                    payload = json.dumps(_status_payload(state))
+                    await self.send_body(
+                        f'id: {etag}\nevent: ocr_status\ndata: {payload}\n\n'.encode('utf-8'),
+                        more_body=True
+                    )
+                    last_sent = etag
+                    events += 1
+
+                if state['complete']:
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+
+                updated = await self.wait_for_update(min(keepalive, remaining))
+                if updated is None:
+                    # Comentário SSE: mantém a conexão viva através de proxies
+                    await self.send_body(b': keepalive\n\n', more_body=True)
+                else:
+                    state = updated
+        except ClientDisconnected:
+            raise
+        except Exception as e:
+            # Falha no envio ou no channel layer: encerrar o fluxo
+            logger.info("Fluxo de status OCR interrompido", error=str(e), document_id=self.document_id)
+        finally:
+            if not self.disconnected.is_set():
+                try:
+                    await self.send_body(b'')
+                except Exception:
+                    pass
+
+        logger.debug("Fluxo de status OCR encerrado", document_id=self.document_id, events=events)
+
+
+class OcrStatusLongPollConsumer(OcrStatusHttpConsumer):
+    """Long-poll do status OCR: responde na próxima mudança ou com 304 no timeout"""
+
+    async def respond(self, state):
+        max_timeout = getattr(settings, 'OCR_STATUS_LONGPOLL_TIMEOUT', 25)
+        try:
+            timeout = min(max_timeout, max(0.0, float((self.query.get('timeout') or [max_timeout])[0])))
+        except ValueError:
+            timeout = max_timeout
+
+        known_etag = (
+            self.headers.get(b'if-none-match', b'').decode()
+            or (self.query.get('etag') or [''])[0]
+        )
+        deadline = time.monotonic() + timeout
+
+        while ocr_progress.get_etag(state) == known_etag and not state['complete']:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            updated = await self.wait_for_update(remaining)
+            if updated is None:
+                break
+            state = updated
+
+        etag = ocr_progress.get_etag(state)
+        headers = [(b'ETag', etag.encode()), (b'Cache-Control', b'private, no-cache')]
+        if etag == known_etag:
+            await self.send_response(304, b'', headers=headers)
+        else:
+            await self._send_json(200, _status_payload(state), headers=headers)
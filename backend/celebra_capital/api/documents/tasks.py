@@ -2,16 +2,19 @@ import time
 import logging
 import traceback
 import os
-import io
+import random
 from celery import shared_task
-from celery.signals import task_failure, task_success, task_retry
+from celery.signals import task_failure, task_success, task_retry, task_prerun, task_postrun
 from django.conf import settings
+from django.utils import timezone
 import json
-from google.cloud import vision
-from google.oauth2 import service_account
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 import structlog
+from . import ocr_cache, batching, engines, preprocessing, pdf, extraction, simulation, ratelimit, lanes, payloads, proposal_ocr, similarity
+from . import memory, cancellation
+from . import progress as ocr_progress
+from .vision_client import get_vision_client
 
 # Configurar logger estruturado
 logger = structlog.get_logger(__name__)
@@ -49,22 +52,101 @@ def task_retry_handler(sender=None, request=None, reason=None, einfo=None, **kwa
         max_retries=sender.max_retries if sender else 0,
     )
 
-def update_ocr_progress(document_id, progress, complete=False, error=None):
+@task_postrun.connect
+def release_fair_slot_handler(sender=None, task_id=None, args=None, retval=None, state=None, **kwargs):
     """
-    Atualiza o progresso do OCR via WebSocket e no banco de dados
+    Libera a vaga do usuário na faixa OCR padrão quando process_document_ocr
+    termina (exceto em retentativa, quando o documento continua na fila)
+    
+    Quando o OCR segue no pipeline em etapas, a vaga é liberada pela última
+    etapa (ou por uma etapa que falhe de vez); em uma execução substituída,
+    pela execução mais recente do documento.
+    """
+    if sender is None or state == 'RETRY' or not args:
+        return
+    if sender.name in {stage_task.name for stage_task in STAGE_TASKS.values()}:
+        # Exceção não tratada em uma etapa: o pipeline não continua
+        if state == 'FAILURE':
+            lanes.release(args[0])
+        return
+    if sender.name != process_document_ocr.name:
+        return
+    if isinstance(retval, dict) and retval.get('status') in ('staged', 'superseded'):
+        return
+    lanes.release(args[0])
+
+def _tracks_memory(sender):
+    return sender is not None and (
+        sender.name == process_document_ocr.name
+        or sender.name in {stage_task.name for stage_task in STAGE_TASKS.values()}
+    )
+
+@task_prerun.connect
+def reset_peak_rss_handler(sender=None, **kwargs):
+    """Zera o pico de memória do processo antes de uma tarefa OCR (ver memory.py)"""
+    if _tracks_memory(sender):
+        sender.request.peak_rss_reset = memory.reset_peak_rss()
+
+@task_postrun.connect
+def report_peak_rss_handler(sender=None, task_id=None, args=None, state=None, **kwargs):
+    """Registra o pico de memória residente do worker durante a tarefa OCR"""
+    from .metrics import OCR_TASK_PEAK_RSS_BYTES
+    
+    if not _tracks_memory(sender):
+        return
+    peak_rss = memory.get_peak_rss()
+    if peak_rss is None:
+        return
+    
+    queue = (getattr(sender.request, 'delivery_info', None) or {}).get('routing_key') or 'unknown'
+    OCR_TASK_PEAK_RSS_BYTES.labels(task=sender.name.rsplit('.', 1)[-1], queue=queue).observe(peak_rss)
+    logger.info(
+        "Pico de memória da tarefa OCR",
+        task_name=sender.name,
+        task_id=task_id,
+        document_id=args[0] if args else None,
+        queue=queue,
+        state=state,
+        peak_rss_mb=round(peak_rss / (1024 * 1024), 1),
+        # Sem reinício do pico, o valor é o do processo desde que iniciou
+        per_task=bool(getattr(sender.request, 'peak_rss_reset', False))
+    )
+
+def update_ocr_progress(document_id, progress, complete=False, error=None, message=None):
+    """
+    Atualiza o progresso do OCR via WebSocket
+    
+    O progresso intermediário fica apenas no Redis (ver progress.py); somente
+    os estados finais (conclusão ou erro) são gravados em OcrResult.
     """
+    from .models import OcrResult
+    
     try:
-        # Atualizar o progresso no banco de dados
-        ocr_result = OcrResult.objects.get(document_id=document_id)
-        
         if error:
-            ocr_result.mark_failed(error)
+            OcrResult.objects.filter(document_id=document_id).update(
+                error_message=error,
+                task_status='FAILURE',
+                last_error_timestamp=timezone.now()
+            )
+            ocr_progress.publish(
+                document_id,
+                progress,
+                complete=complete,
+                task_status='FAILURE',
+                message=f'Falha no processamento: {error}'
+            )
         elif complete:
-            ocr_result.update_progress(100)
-            ocr_result.ocr_complete = True
-            ocr_result.save(update_fields=['ocr_complete'])
+            OcrResult.objects.filter(document_id=document_id).update(
+                ocr_complete=True,
+                current_progress=100
+            )
+            ocr_progress.publish(document_id, 100, complete=True, message=message or 'Processamento OCR concluído')
         else:
-            ocr_result.update_progress(progress)
+            ocr_progress.publish(document_id, progress, message=message)
+        
+        if complete:
+            # Último documento pendente de uma proposta: publicar o resumo dela
+            proposal_ocr.on_document_complete(document_id)
             
         logger.debug(
             "Progresso OCR atualizado", 
@@ -92,9 +174,17 @@ def update_ocr_progress(document_id, progress, complete=False, error=None):
     soft_time_limit=240,  # Limite soft de 4 minutos (gera exceção que pode ser tratada)
     track_started=True,  # Rastrear quando a tarefa começou
 )
-def process_document_ocr(self, document_id):
+def process_document_ocr(self, document_id, allow_batch=True):
     """
     Processa o OCR para um documento de forma assíncrona e resiliente
+    
+    Com OCR_BATCH_ENABLED, o envio ao Google Vision é delegado ao coletor de
+    lotes; allow_batch=False força o processamento individual (usado quando
+    um documento falha dentro de um lote).
+    
+    Resolvidos aqui os atalhos (cache, quase duplicata, lote, simulação), o
+    OCR pelo motor segue no pipeline em etapas (start_ocr_pipeline); uma nova
+    execução para um documento com checkpoint retoma o pipeline.
     """
     # Importações dentro da tarefa para evitar problemas de importação circular
     from .models import Document, OcrResult
@@ -112,6 +202,10 @@ def process_document_ocr(self, document_id):
         # Obter documento
         document = Document.objects.select_related('user').get(id=document_id)
         
+        # Documento excluído enquanto aguardava na fila
+        if cancellation.is_cancelled(document_id, document):
+            return cancel_ocr(document_id, self.request.id)
+        
         # Verificar se já existe resultado OCR
         ocr_result, created = OcrResult.objects.get_or_create(
             document=document,
@@ -134,14 +228,54 @@ def process_document_ocr(self, document_id):
                 "ocr_complete": True
             }
         
-        # Atualizar task_id para rastreabilidade mesmo se não for uma criação nova
-        if not created:
+        # Execução substituída: o documento foi reenviado com outro task_id
+        # (reprocessamento, varredura de tarefas travadas, OCR da proposta)
+        # depois que esta mensagem entrou na fila. Só a execução mais recente
+        # chama o motor; a vaga da faixa padrão é liberada por ela.
+        if not created and ocr_result.task_id and ocr_result.task_id != self.request.id:
+            logger.info(
+                "Execução OCR substituída",
+                document_id=document_id,
+                task_id=self.request.id,
+                current_task_id=ocr_result.task_id
+            )
+            return {
+                "document_id": document_id,
+                "ocr_complete": False,
+                "status": "superseded"
+            }
+        
+        # Registros antigos sem task_id: adotar esta execução
+        if not created and not ocr_result.task_id:
             ocr_result.task_id = self.request.id
             ocr_result.save(update_fields=['task_id'])
         
         # Atualizar progresso inicial
         update_ocr_progress(document_id, 10)
         
+        # Checkpoint da última etapa: o resultado final já foi gravado pela
+        # etapa persist, falta apenas marcar a execução como concluída
+        if ocr_result.pipeline_stage == PIPELINE_STAGES[-1]:
+            ocr_result.ocr_complete = True
+            ocr_result.task_status = 'SUCCESS'
+            ocr_result.current_progress = 100
+            ocr_result.save(update_fields=['ocr_complete', 'task_status', 'current_progress', 'updated_at'])
+            ocr_progress.publish(document_id, 100, complete=True, message='Processamento OCR concluído')
+            return {
+                "document_id": document_id,
+                "ocr_complete": True,
+                "status": "success"
+            }
+        
+        # Pipeline em etapas interrompido (retentativa, tarefa travada, limite de
+        # taxa): retomar após a última etapa concluída, sem refazer as anteriores
+        if ocr_result.pipeline_stage in PIPELINE_STAGES:
+            return start_ocr_pipeline(
+                self, document_id, start_time,
+                resume_after=ocr_result.pipeline_stage,
+                large=lanes.is_large_file(document)
+            )
+        
         # Obter caminho do arquivo
         file_path = document.file.path
         
@@ -153,124 +287,87 @@ def process_document_ocr(self, document_id):
         document_type = document.document_type
         extracted_data = {}
         confidence_score = 0.0
+        full_text = None
+        engine_name = None
+        
+        # Calcular hash do conteúdo (reaproveita o hash gerado no upload, se houver)
+        document_hash = document.file_hash
+        if not document_hash:
+            document_hash = ocr_cache.compute_document_hash(file_path)
+            document.file_hash = document_hash
+            document.save(update_fields=['file_hash'])
+        
+        # Verificar se o mesmo arquivo já foi processado antes de chamar o motor de OCR
+        cached_result = ocr_cache.get_cached_result(document_type, document_hash)
+        
+        # Nova foto do mesmo documento (quase duplicata já processada do mesmo usuário)
+        near_duplicate = None
+        if cached_result is None and similarity.is_image(file_path):
+            near_duplicate, distance = similarity.find_reusable_result(document)
+        
+        # Motores de OCR a tentar para este tipo de documento
+        engine_chain = engines.get_engine_chain(document_type)
         
         # Atualizar progresso - preparando para OCR
         update_ocr_progress(document_id, 20)
         
-        # Implementação real de OCR com Google Vision API
-        if settings.USE_GOOGLE_VISION:
-            try:
-                # Configurar credenciais
-                if settings.GOOGLE_CREDENTIALS_JSON:
-                    credentials = service_account.Credentials.from_service_account_file(
-                        settings.GOOGLE_CREDENTIALS_JSON
-                    )
-                else:
-                    credentials = None
-                
-                # Inicializar cliente Vision
-                client = vision.ImageAnnotatorClient(credentials=credentials)
-                
-                # Atualizar progresso - carregando imagem
-                update_ocr_progress(document_id, 30)
-                
-                # Ler o conteúdo do arquivo
-                with io.open(file_path, 'rb') as image_file:
-                    content = image_file.read()
-                
-                # Configurar imagem
-                image = vision.Image(content=content)
-                
-                # Atualizar progresso - enviando para API
-                update_ocr_progress(document_id, 40)
-                
-                # Realizar reconhecimento de texto
-                response = client.text_detection(image=image)
-                texts = response.text_annotations
-                
-                # Atualizar progresso - processando resultados
-                update_ocr_progress(document_id, 60)
-                
-                if texts:
-                    # O primeiro elemento contém todo o texto
-                    full_text = texts[0].description
-                    
-                    # Atualizar progresso - analisando texto
-                    update_ocr_progress(document_id, 70)
-                    
-                    # Processamento específico por tipo de documento
-                    if document_type == 'rg':
-                        extracted_data = extract_rg_data(full_text)
-                        confidence_score = 0.85
-                    elif document_type == 'cpf':
-                        extracted_data = extract_cpf_data(full_text)
-                        confidence_score = 0.90
-                    elif document_type == 'proof_income':
-                        extracted_data = extract_proof_income_data(full_text)
-                        confidence_score = 0.75
-                    elif document_type == 'address_proof':
-                        extracted_data = extract_address_proof_data(full_text)
-                        confidence_score = 0.80
-                    else:
-                        # Para outros tipos, apenas salvar o texto completo
-                        extracted_data = {"full_text": full_text}
-                        confidence_score = 0.70
-                
-                # Verificar erros da API
-                if response.error.message:
-                    error_message = f"Erro no Google Vision API: {response.error.message}"
-                    logger.error(
-                        "Erro em API externa", 
-                        api="Google Vision",
-                        error=response.error.message,
-                        document_id=document_id
-                    )
-                    # Tratamento de erro retornável
-                    raise Exception(error_message)
-                
-                # Atualizar progresso - finalizando análise
-                update_ocr_progress(document_id, 85)
-                
-            except Exception as vision_error:
-                logger.warning(
-                    "Erro ao usar Google Vision API, usando fallback", 
-                    error=str(vision_error),
-                    document_id=document_id,
-                    task_id=self.request.id
-                )
-                # Fallback para OCR simulado
-                extracted_data, confidence_score = simulate_ocr(document_type, document_id)
+        if cached_result is not None:
+            extracted_data = cached_result.extracted_data
+            confidence_score = cached_result.confidence_score
+            # Texto bruto de outro documento com o mesmo conteúdo, para reextrações futuras
+            full_text, engine_name = ocr_cache.get_raw_text(document_hash)
+            logger.info(
+                "OCR dispensado por cache de conteúdo",
+                document_id=document_id,
+                document_hash=document_hash,
+                task_id=self.request.id
+            )
+        elif near_duplicate is not None:
+            extracted_data = near_duplicate.extracted_data
+            confidence_score = near_duplicate.confidence_score or 0.0
+            full_text, engine_name = near_duplicate.raw_text, near_duplicate.engine_name
+            logger.info(
+                "OCR dispensado por quase duplicata",
+                document_id=document_id,
+                source_document_id=near_duplicate.document_id,
+                distance=distance,
+                task_id=self.request.id
+            )
+        # Motor falso com latência simulada: continuações agendadas, sem ocupar o worker
+        elif engine_chain[:1] == ['fake'] and simulation.is_deferred():
+            return start_simulated_ocr(document_id, engines.FakeEngine.name, start_time, lanes.current_lane(self))
+        # Modo em lote: o documento é enviado junto com outros pendentes
+        # (arquivos grandes seguem sozinhos: o lote carrega o conteúdo de todos os documentos)
+        elif (allow_batch and engine_chain[:1] == ['vision'] and batching.is_batch_enabled()
+              and not pdf.is_pdf(file_path) and not lanes.is_large_file(document)):
+            batching.enqueue(document_id)
+            update_ocr_progress(document_id, 30)
+            logger.info(
+                "Documento aguardando envio em lote",
+                document_id=document_id,
+                task_id=self.request.id
+            )
+            return {
+                "document_id": document_id,
+                "ocr_complete": False,
+                "status": "batched"
+            }
+        # OCR com o motor configurado para o tipo de documento (e seus fallbacks):
+        # pipeline em etapas, cada uma retomável a partir do último checkpoint
+        elif engine_chain:
+            return start_ocr_pipeline(self, document_id, start_time, large=lanes.is_large_file(document))
         else:
             # Em desenvolvimento ou quando não configurado, simular o processamento
-            extracted_data, confidence_score = simulate_ocr(document_type, document_id)
+            if simulation.is_deferred():
+                return start_simulated_ocr(document_id, None, start_time, lanes.current_lane(self))
+            extracted_data, confidence_score = simulate_ocr(document_type)
         
-        # Atualizar progresso - salvando resultados
-        update_ocr_progress(document_id, 95)
-        
-        # Atualizar resultado do OCR
+        # Salvar resultados e notificar conclusão
         process_time = time.time() - start_time
-        ocr_result.ocr_complete = True
-        ocr_result.extracted_data = extracted_data
-        ocr_result.confidence_score = confidence_score
-        ocr_result.process_time = process_time
-        ocr_result.error_message = None  # Limpar mensagens de erro anteriores
-        ocr_result.save()
-        
-        logger.info(
-            "OCR concluído com sucesso", 
-            document_id=document_id,
-            process_time=f"{process_time:.2f}s",
-            confidence_score=confidence_score,
-            task_id=self.request.id
+        save_ocr_success(
+            document, ocr_result, extracted_data, confidence_score, process_time,
+            full_text=full_text, engine_name=engine_name
         )
-        
-        # Atualizar status de verificação do documento se confiança for alta
-        if confidence_score > 0.8:
-            document.verification_status = 'verified'
-            document.save(update_fields=['verification_status'])
-            
-        # Atualizar progresso - concluído
-        update_ocr_progress(document_id, 100, True)
             
         return {
             "document_id": document_id,
@@ -300,10 +397,7 @@ def process_document_ocr(self, document_id):
         )
         
         # Erro de arquivo - não tente novamente, é um erro permanente
-        update_ocr_progress(document_id, 0, True, error=error_message)
-        self.update_state(state='FAILURE', meta={'error': error_message})
-        
-        # Atualizar o resultado com o erro
+        # Atualizar o resultado com o erro (antes de notificar a conclusão)
         try:
             OcrResult.objects.filter(document_id=document_id).update(
                 ocr_complete=True,
@@ -313,6 +407,9 @@ def process_document_ocr(self, document_id):
             )
         except Exception:
             pass
+        
+        update_ocr_progress(document_id, 0, True, error=error_message)
+        self.update_state(state='FAILURE', meta={'error': error_message})
             
         return {"error": error_message, "status": "file_error"}
         
@@ -373,9 +470,674 @@ def process_document_ocr(self, document_id):
                 "retries": self.request.retries
             }
 
-def simulate_ocr(document_type, document_id=None):
+# Pipeline OCR em etapas: preprocess → recognize → extract → persist
+#
+# As etapas são encadeadas com um chain Celery e cada uma grava seu checkpoint
+# em OcrResult (pipeline_stage e o artefato da etapa: imagem derivada no
+# disco, texto bruto, campos extraídos). Cada etapa retenta sozinha: uma falha
+# ao gravar o resultado não chama o motor de OCR de novo, e uma nova execução
+# de process_document_ocr (tarefa travada, limite de taxa) retoma após a
+# última etapa concluída. As etapas podem ir para filas próprias
+# (OCR_STAGE_QUEUES), escalando separadamente o pré-processamento (CPU) e as
+# chamadas ao motor (rede); sem configuração, seguem na fila da faixa. Em
+# arquivos grandes, as etapas que carregam o conteúdo vão para a fila
+# lanes.LARGE_FILE_QUEUE, de baixa concorrência.
+PIPELINE_STAGES = ('preprocess', 'recognize', 'extract', 'persist')
+LARGE_FILE_STAGES = ('preprocess', 'recognize')
+
+def get_stage_queue(stage, lane, large=False):
+    """Fila da etapa: a de arquivos grandes, a configurada em OCR_STAGE_QUEUES ou a da faixa do documento"""
+    if large and stage in LARGE_FILE_STAGES:
+        return lanes.LARGE_FILE_QUEUE
+    return getattr(settings, 'OCR_STAGE_QUEUES', {}).get(stage) or lane
+
+def start_ocr_pipeline(task, document_id, start_time, resume_after=None, large=False):
+    """
+    Envia as etapas do pipeline OCR como um chain, a partir da etapa seguinte a resume_after
+    
+    resume_after não pode ser a última etapa (process_document_ocr apenas
+    conclui a execução nesse caso).
+    
+    O task_id da tarefa atual identifica a execução: etapas de execuções
+    substituídas (novo envio do documento) não gravam nada.
+    """
+    from celery import chain
+    
+    lane = lanes.current_lane(task)
+    stages = PIPELINE_STAGES
+    if resume_after:
+        stages = PIPELINE_STAGES[PIPELINE_STAGES.index(resume_after) + 1:]
+    
+    chain(
+        STAGE_TASKS[stage].signature(
+            args=[document_id, task.request.id, start_time, lane],
+            queue=get_stage_queue(stage, lane, large),
+            immutable=True
+        )
+        for stage in stages
+    ).apply_async()
+    
+    logger.info(
+        "Pipeline OCR enviado",
+        document_id=document_id,
+        stages=list(stages),
+        resumed=bool(resume_after),
+        large=large,
+        task_id=task.request.id
+    )
+    
+    return {
+        "document_id": document_id,
+        "ocr_complete": False,
+        "status": "staged",
+        "stages": list(stages)
+    }
+
+def save_stage_checkpoint(ocr_result, run_id, stage, **fields):
+    """
+    Grava o artefato e a conclusão de uma etapa, apenas se a execução ainda for a atual
+    """
+    from .models import OcrResult
+    
+    for field, value in fields.items():
+        setattr(ocr_result, field, value)
+    ocr_result.pipeline_stage = stage
+    return OcrResult.objects.filter(id=ocr_result.id, task_id=run_id).update(
+        pipeline_stage=stage,
+        updated_at=timezone.now(),
+        **fields
+    )
+
+def run_pipeline_stage(task, stage, document_id, run_id, start_time, run):
+    """
+    Executa uma etapa do pipeline OCR de forma idempotente
+    
+    A etapa é ignorada se a execução foi substituída, se já foi concluída ou
+    se a anterior não foi (ex.: o OCR simulado assumiu o documento), e o
+    pipeline é encerrado se o documento foi cancelado (excluído). Erros de
+    arquivo são permanentes; os demais retentam apenas esta etapa, com backoff
+    exponencial, e marcam o documento como falho ao esgotar as tentativas.
+    """
+    from celery.utils.time import get_exponential_backoff_interval
+    from .models import OcrResult
+    
+    ocr_result = OcrResult.objects.select_related('document').filter(document_id=document_id).first()
+    if ocr_result is None or ocr_result.task_id != run_id or ocr_result.ocr_complete:
+        logger.info("Etapa OCR ignorada: execução substituída", stage=stage, document_id=document_id, run_id=run_id)
+        return {"document_id": document_id, "stage": stage, "status": "superseded"}
+    
+    # Ponto de cancelamento entre as etapas (antes da chamada ao motor)
+    if cancellation.is_cancelled(document_id, ocr_result.document):
+        return cancel_ocr(document_id, task.request.id, stage=stage)
+    
+    position = PIPELINE_STAGES.index(stage)
+    done = PIPELINE_STAGES.index(ocr_result.pipeline_stage) if ocr_result.pipeline_stage in PIPELINE_STAGES else -1
+    if done != position - 1:
+        return {
+            "document_id": document_id,
+            "stage": stage,
+            "status": "already_done" if done >= position else "not_ready"
+        }
+    
+    try:
+        return run(ocr_result)
+        
+    except cancellation.OcrCancelled:
+        return cancel_ocr(document_id, task.request.id, stage=stage)
+        
+    except (IOError, FileNotFoundError) as file_error:
+        error_message = f"Erro ao acessar arquivo do documento: {str(file_error)}"
+        logger.error("Erro de arquivo", stage=stage, document_id=document_id, error=str(file_error), task_id=task.request.id)
+        
+        # Erro de arquivo - não tente novamente, é um erro permanente
+        OcrResult.objects.filter(document_id=document_id, task_id=run_id).update(
+            ocr_complete=True,
+            error_message=error_message,
+            process_time=time.time() - start_time
+        )
+        update_ocr_progress(document_id, 0, True, error=error_message)
+        lanes.release(document_id)
+        return {"error": error_message, "stage": stage, "status": "file_error"}
+        
+    except Exception as e:
+        error_message = str(e)
+        logger.error(
+            "Erro na etapa do pipeline OCR",
+            stage=stage,
+            document_id=document_id,
+            error=error_message,
+            traceback=traceback.format_exc(),
+            task_id=task.request.id,
+            retry=task.request.retries
+        )
+        
+        try:
+            OcrResult.objects.filter(document_id=document_id, task_id=run_id).update(error_message=error_message)
+            update_ocr_progress(document_id, task.request.retries * 20, False, error=error_message)
+        except Exception:
+            pass
+        
+        if task.request.retries < task.max_retries:
+            # Retentar apenas esta etapa; as anteriores continuam gravadas
+            raise task.retry(exc=e, countdown=get_exponential_backoff_interval(
+                factor=1, retries=task.request.retries, maximum=600, full_jitter=True
+            ))
+        
+        try:
+            OcrResult.objects.filter(document_id=document_id, task_id=run_id).update(
+                ocr_complete=True,
+                error_message=f"Falha após {task.max_retries} tentativas: {error_message}",
+                process_time=time.time() - start_time
+            )
+            update_ocr_progress(document_id, 100, True, error=f"Falha após {task.max_retries} tentativas")
+        except Exception:
+            pass
+        lanes.release(document_id)
+        
+        return {
+            "error": error_message,
+            "stage": stage,
+            "status": "failed_after_retries",
+            "retries": task.request.retries
+        }
+
+STAGE_TASK_OPTIONS = dict(
+    bind=True,
+    max_retries=5,
+    acks_late=True,
+    reject_on_worker_lost=True,
+    time_limit=300,
+    soft_time_limit=240,
+)
+
+@shared_task(**STAGE_TASK_OPTIONS)
+def preprocess_ocr_stage(self, document_id, run_id, start_time, lane=lanes.LANE_STANDARD):
+    """
+    Etapa 1: normaliza a imagem (CPU) e grava a derivada ao lado do original,
+    reaproveitada pelas etapas e tentativas seguintes
+    """
+    def run(ocr_result):
+        file_path = ocr_result.document.file.path
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"Arquivo não encontrado: {file_path}")
+        
+        # Atualizar progresso - carregando imagem
+        update_ocr_progress(document_id, 30)
+        
+        stats = None
+        if (preprocessing.is_preprocessing_enabled() and not pdf.is_pdf(file_path)
+                and file_path.lower().endswith(preprocessing.IMAGE_EXTENSIONS)):
+            _, stats = preprocessing.prepare_image(file_path)
+        
+        save_stage_checkpoint(ocr_result, run_id, 'preprocess')
+        return {
+            "document_id": document_id,
+            "stage": "preprocess",
+            "bytes_saved": stats['bytes_saved'] if stats else 0,
+            "status": "done"
+        }
+    
+    return run_pipeline_stage(self, 'preprocess', document_id, run_id, start_time, run)
+
+@shared_task(**STAGE_TASK_OPTIONS)
+def recognize_ocr_stage(self, document_id, run_id, start_time, lane=lanes.LANE_STANDARD):
+    """
+    Etapa 2: reconhecimento do texto pelo motor de OCR (rede), com o texto
+    bruto e a resposta completa gravados como checkpoint
+    """
+    def run(ocr_result):
+        document = ocr_result.document
+        file_path = document.file.path
+        engine_chain = engines.get_engine_chain(document.document_type)
+        
+        try:
+            if pdf.is_pdf(file_path):
+                # PDFs com várias páginas: rasterização sob demanda e OCR em paralelo
+                def report_page(page_number, pages_done, total_pages):
+                    # Ponto de cancelamento entre as páginas
+                    cancellation.check(document_id)
+                    update_ocr_progress(
+                        document_id,
+                        40 + int(20 * pages_done / total_pages),
+                        message=f"Página {pages_done} de {total_pages} processada"
+                    )
+                
+                full_text, engine_name, payload = pdf.recognize_pdf(
+                    file_path, document.document_type, engine_chain, on_page_done=report_page
+                )
+            else:
+                # Conteúdo já pré-processado (derivada gravada e contabilizada pela etapa anterior)
+                content, _ = preprocessing.prepare_image(file_path, report=False)
+                
+                # Atualizar progresso - enviando para o motor de OCR
+                update_ocr_progress(document_id, 40)
+                
+                full_text, engine_name, payload = engines.recognize_detailed(
+                    content, document.document_type, engine_chain
+                )
+                
+        except engines.OcrThrottledError as throttled:
+            # Limite de taxa compartilhado: reagendar sem consumir retentativas
+            # (a nova execução retoma nesta etapa)
+            lanes.release(document_id)
+            return reschedule_throttled_ocr(self, document_id, False, throttled.retry_after, lane=lane)
+        except engines.OcrEngineError as engine_error:
+            logger.warning(
+                "Erro nos motores de OCR, usando fallback",
+                error=str(engine_error),
+                document_id=document_id,
+                task_id=self.request.id
+            )
+            # Fallback para OCR simulado
+            if simulation.is_deferred():
+                lanes.release(document_id)
+                return start_simulated_ocr(document_id, None, start_time, lane)
+            extracted_data, confidence_score = simulate_ocr(document.document_type)
+            save_stage_checkpoint(
+                ocr_result, run_id, 'extract',
+                extracted_data=extracted_data,
+                confidence_score=confidence_score
+            )
+            return {"document_id": document_id, "stage": "recognize", "status": "simulated"}
+        
+        # Atualizar progresso - processando resultados
+        update_ocr_progress(document_id, 60)
+        
+        save_stage_checkpoint(
+            ocr_result, run_id, 'recognize',
+            raw_text=full_text,
+            engine_name=engine_name,
+            engine_version=engines.get_engine_version(engine_name) if engine_name else None
+        )
+        if payload is not None:
+            payloads.store_payload(document_id, engine_name, payload)
+        
+        logger.info(
+            "Texto reconhecido",
+            document_id=document_id,
+            engine=engine_name,
+            task_id=self.request.id
+        )
+        return {"document_id": document_id, "stage": "recognize", "engine": engine_name, "status": "done"}
+    
+    return run_pipeline_stage(self, 'recognize', document_id, run_id, start_time, run)
+
+@shared_task(**STAGE_TASK_OPTIONS)
+def extract_ocr_stage(self, document_id, run_id, start_time, lane=lanes.LANE_STANDARD):
+    """Etapa 3: extração dos campos a partir do texto bruto gravado"""
+    def run(ocr_result):
+        extracted_data = {}
+        confidence_score = 0.0
+        
+        if ocr_result.raw_text:
+            # Atualizar progresso - analisando texto
+            update_ocr_progress(document_id, 70)
+            
+            # Processamento específico por tipo de documento
+            extracted_data, confidence_score = extract_document_data(
+                ocr_result.document.document_type, ocr_result.raw_text
+            )
+        
+        save_stage_checkpoint(
+            ocr_result, run_id, 'extract',
+            extracted_data=extracted_data,
+            confidence_score=confidence_score
+        )
+        
+        # Atualizar progresso - finalizando análise
+        update_ocr_progress(document_id, 85)
+        return {"document_id": document_id, "stage": "extract", "status": "done"}
+    
+    return run_pipeline_stage(self, 'extract', document_id, run_id, start_time, run)
+
+@shared_task(**STAGE_TASK_OPTIONS)
+def persist_ocr_stage(self, document_id, run_id, start_time, lane=lanes.LANE_STANDARD):
+    """Etapa 4: grava o resultado final, alimenta o cache e notifica a conclusão"""
+    def run(ocr_result):
+        document = ocr_result.document
+        extracted_data = ocr_result.extracted_data or {}
+        confidence_score = ocr_result.confidence_score or 0.0
+        
+        # Guardar no cache apenas resultados vindos de um motor real
+        if extracted_data and ocr_result.engine_name and ocr_result.engine_name != 'fake':
+            ocr_cache.store_result(document.document_type, document.file_hash, extracted_data, confidence_score)
+        
+        process_time = time.time() - start_time
+        ocr_result.pipeline_stage = 'persist'
+        save_ocr_success(
+            document, ocr_result, extracted_data, confidence_score, process_time,
+            full_text=ocr_result.raw_text, engine_name=ocr_result.engine_name
+        )
+        lanes.release(document_id)
+        
+        return {
+            "document_id": document_id,
+            "ocr_complete": True,
+            "confidence_score": confidence_score,
+            "process_time": process_time,
+            "status": "success"
+        }
+    
+    return run_pipeline_stage(self, 'persist', document_id, run_id, start_time, run)
+
+STAGE_TASKS = {
+    'preprocess': preprocess_ocr_stage,
+    'recognize': recognize_ocr_stage,
+    'extract': extract_ocr_stage,
+    'persist': persist_ocr_stage,
+}
+
+def reschedule_throttled_ocr(task, document_id, allow_batch, retry_after, lane=None):
+    """
+    Reagenda o OCR de um documento barrado pelo governador de taxa
+    
+    Uma nova tarefa é enviada com countdown (com variação para não
+    sincronizar os workers), sem usar self.retry: o limite de taxa não é uma
+    falha e não deve consumir as retentativas do documento.
+    """
+    from celery import uuid
+    from .models import OcrResult
+    
+    countdown = retry_after * random.uniform(1.0, 1.5)
+    # task_id gravado antes do envio: a nova execução não pode ser tomada por substituída
+    new_task_id = uuid()
+    OcrResult.objects.filter(document_id=document_id).update(task_id=new_task_id, task_status='PENDING')
+    new_task = process_document_ocr.apply_async(
+        args=[document_id],
+        kwargs={'allow_batch': allow_batch},
+        countdown=countdown,
+        queue=lane or lanes.current_lane(task),
+        task_id=new_task_id
+    )
+    ocr_progress.publish(
+        document_id,
+        ocr_progress.get_current_progress(document_id),
+        task_status='PENDING',
+        message='Aguardando limite de taxa do provedor de OCR'
+    )
+    
+    logger.info(
+        "OCR reagendado por limite de taxa",
+        document_id=document_id,
+        countdown=f"{countdown:.1f}s",
+        task_id=task.request.id,
+        new_task_id=new_task.id
+    )
+    
+    return {
+        "document_id": document_id,
+        "ocr_complete": False,
+        "status": "throttled",
+        "retry_after": countdown
+    }
+
+def cancel_ocr(document_id, task_id, stage=None):
+    """
+    Encerra o OCR de um documento cancelado (ver cancellation.py)
+    
+    O resultado é marcado como concluído (a varredura de tarefas travadas não
+    o reenvia e etapas posteriores são ignoradas), o progresso no Redis é
+    removido e a vaga da faixa padrão é liberada.
+    """
+    from .models import OcrResult
+    
+    OcrResult.objects.filter(document_id=document_id, ocr_complete=False).update(
+        ocr_complete=True,
+        task_status='REVOKED',
+        error_message="Processamento cancelado: documento excluído",
+        updated_at=timezone.now()
+    )
+    ocr_progress.clear(document_id)
+    lanes.release(document_id)
+    
+    logger.info(
+        "OCR cancelado",
+        document_id=document_id,
+        stage=stage,
+        task_id=task_id
+    )
+    
+    return {
+        "document_id": document_id,
+        "ocr_complete": False,
+        "status": "cancelled"
+    }
+
+def save_ocr_success(document, ocr_result, extracted_data, confidence_score, process_time,
+                     full_text=None, engine_name=None, payload=None):
+    """
+    Persiste um resultado OCR bem-sucedido e notifica a conclusão
+    
+    O texto bruto é gravado com o motor e a versão das regras de extração,
+    permitindo reextrair os campos depois (comando reextract_ocr). A resposta
+    completa do motor, se houver, vai para a tabela separada OcrRawPayload.
+    """
+    # Atualizar progresso - salvando resultados
+    update_ocr_progress(document.id, 95)
+    
+    # Atualizar resultado do OCR (único registro do estado final no banco)
+    ocr_result.ocr_complete = True
+    ocr_result.current_progress = 100
+    ocr_result.task_status = 'SUCCESS'
+    ocr_result.extracted_data = extracted_data
+    ocr_result.confidence_score = confidence_score
+    ocr_result.process_time = process_time
+    ocr_result.error_message = None  # Limpar mensagens de erro anteriores
+    ocr_result.raw_text = full_text
+    ocr_result.engine_name = engine_name
+    ocr_result.engine_version = engines.get_engine_version(engine_name) if engine_name else None
+    ocr_result.extractor_version = extraction.get_version(document.document_type) if full_text is not None else None
+    ocr_result.save()
+    
+    if payload is not None:
+        payloads.store_payload(document.id, engine_name, payload)
+    
+    logger.info(
+        "OCR concluído com sucesso", 
+        document_id=document.id,
+        process_time=f"{process_time:.2f}s",
+        confidence_score=confidence_score,
+        task_id=ocr_result.task_id
+    )
+    
+    # Atualizar status de verificação do documento se confiança for alta
+    if confidence_score > 0.8:
+        document.verification_status = 'verified'
+        document.save(update_fields=['verification_status'])
+        
+    # Atualizar progresso - concluído (estado já persistido acima)
+    ocr_progress.publish(document.id, 100, complete=True, message='Processamento OCR concluído')
+    proposal_ocr.on_document_complete(document.id, document)
+
+@shared_task(
+    bind=True,
+    acks_late=True,
+    time_limit=300,
+    soft_time_limit=240,
+)
+def flush_ocr_batch(self):
+    """
+    Envia o lote de documentos pendentes ao Google Vision em uma única requisição
+    e distribui os resultados para cada OcrResult e grupo WebSocket.
+    
+    Documentos com erro individual no lote (ou todos, se a requisição falhar)
+    são reenviados para processamento individual. Os documentos ficam na lista
+    de processamento do envio (ver batching.py) até o resultado de cada um ser
+    gravado ou reenviado; uma reentrega desta tarefa retoma a mesma lista.
+    """
+    from .models import Document, OcrResult
+    
+    owner = self.request.id
+    batching.recover_abandoned()
+    document_ids, remaining = batching.pop_batch(owner)
+    
+    # Continuar drenando a fila se ainda houver documentos pendentes
+    if remaining:
+        flush_ocr_batch.apply_async(queue=lanes.LANE_STANDARD)
+    
+    if not document_ids:
+        return {"status": "empty", "batch_size": 0}
+    
+    start_time = time.time()
+    
+    documents = {
+        document.id: document
+        for document in Document.objects.select_related('ocr_result').filter(id__in=document_ids)
+    }
+    
+    batch = []
+    contents = []
+    for document_id in document_ids:
+        document = documents.get(document_id)
+        if document is None:
+            continue
+        if cancellation.is_cancelled(document_id, document):
+            cancel_ocr(document_id, self.request.id)
+            continue
+        try:
+            contents.append(batching.read_document_content(document))
+            batch.append(document)
+        except (IOError, FileNotFoundError):
+            # Deixar o processamento individual registrar o erro de arquivo
+            redispatch_from_batch(document)
+    
+    # Documentos fora do envio (removidos, cancelados ou reenviados) saem da lista de processamento
+    batching.ack(owner, set(document_ids) - {document.id for document in batch})
+    
+    if not batch:
+        batching.release(owner)
+        return {"status": "empty", "batch_size": 0}
+    
+    # Governador de taxa: o lote consome um token por imagem
+    if ratelimit.is_limited('vision'):
+        try:
+            ratelimit.acquire('vision', cost=len(batch))
+        except ratelimit.RateLimitExceeded as e:
+            return defer_ocr_batch(owner, len(batch), e.retry_after)
+    
+    for document in batch:
+        update_ocr_progress(document.id, 40)
+    
+    try:
+        results = batching.annotate_batch(get_vision_client(), contents)
+    except Exception as e:
+        if engines.is_quota_exception(e):
+            ratelimit.record_quota_error('vision')
+            return defer_ocr_batch(owner, len(batch), engines.QUOTA_RETRY_AFTER)
+        logger.warning(
+            "Erro no envio em lote ao Google Vision, reenviando individualmente",
+            error=str(e),
+            batch_size=len(batch),
+            task_id=self.request.id
+        )
+        for document in batch:
+            redispatch_from_batch(document)
+        batching.release(owner)
+        return {"status": "requeued", "batch_size": len(batch)}
+    
+    if ratelimit.is_limited('vision'):
+        ratelimit.record_success('vision')
+    
+    process_time = time.time() - start_time
+    succeeded = 0
+    failed = 0
+    
+    for document, (full_text, error, payload) in zip(batch, results):
+        if error:
+            failed += 1
+            logger.warning(
+                "Erro em imagem do lote Google Vision, reenviando individualmente",
+                api="Google Vision",
+                error=error,
+                document_id=document.id
+            )
+            redispatch_from_batch(document)
+            batching.ack(owner, [document.id])
+            continue
+        
+        try:
+            ocr_result, _ = OcrResult.objects.get_or_create(document=document)
+            extracted_data, confidence_score = {}, 0.0
+            if full_text:
+                extracted_data, confidence_score = extract_document_data(document.document_type, full_text)
+                ocr_cache.store_result(document.document_type, document.file_hash, extracted_data, confidence_score)
+            save_ocr_success(
+                document, ocr_result, extracted_data, confidence_score, process_time,
+                full_text=full_text, engine_name=engines.VisionEngine.name, payload=payload
+            )
+            succeeded += 1
+        except Exception as e:
+            failed += 1
+            logger.error(
+                "Erro ao salvar resultado do lote OCR",
+                error=str(e),
+                document_id=document.id
+            )
+            redispatch_from_batch(document)
+        batching.ack(owner, [document.id])
+    
+    batching.release(owner)
+    
+    logger.info(
+        "Lote OCR processado",
+        batch_size=len(batch),
+        succeeded=succeeded,
+        failed=failed,
+        process_time=f"{process_time:.2f}s",
+        task_id=self.request.id
+    )
+    
+    return {
+        "status": "success",
+        "batch_size": len(batch),
+        "succeeded": succeeded,
+        "failed": failed
+    }
+
+def redispatch_from_batch(document):
+    """
+    Reenvia um documento do lote para processamento individual
+    
+    A nova mensagem usa o task_id registrado em OcrResult (o da execução que
+    colocou o documento no lote), para não ser tomada por substituída.
+    """
+    ocr_result = getattr(document, 'ocr_result', None)
+    lanes.dispatch(
+        document.id, lanes.LANE_RETRY,
+        task_id=ocr_result.task_id if ocr_result else None,
+        allow_batch=False
+    )
+
+def defer_ocr_batch(owner, batch_size, retry_after):
+    """
+    Devolve um lote barrado pelo governador de taxa à fila pendente e agenda
+    um novo envio após retry_after segundos
+    """
+    batching.push_back(owner)
+    flush_ocr_batch.apply_async(countdown=retry_after, queue=lanes.LANE_STANDARD)
+    
+    logger.info(
+        "Lote OCR adiado por limite de taxa",
+        batch_size=batch_size,
+        retry_after=f"{retry_after:.1f}s"
+    )
+    return {"status": "throttled", "batch_size": batch_size}
+
+def extract_document_data(document_type, full_text):
+    """
+    Extrai os campos do texto reconhecido conforme o tipo de documento,
+    usando o conjunto de regras compilado do tipo (ver extraction.py)
+    
+    Retorna uma tupla (extracted_data, confidence_score).
+    """
+    return extraction.extract(document_type, full_text)
+
+def simulate_ocr(document_type):
     """
     Simula processamento OCR para desenvolvimento
+    
+    Retorna apenas os dados simulados; a latência é simulada por
+    start_simulated_ocr com continuações agendadas, sem bloquear o worker.
     """
     if document_type == 'rg':
         extracted_data = {
@@ -409,269 +1171,375 @@ def simulate_ocr(document_type, document_id=None):
         extracted_data = {"mensagem": "Tipo de documento não suportado para OCR"}
         confidence_score = 0.0
     
-    # Simular processamento com atualizações de progresso
-    if document_id:
-        update_ocr_progress(document_id, 30)
-        time.sleep(0.5)
-        update_ocr_progress(document_id, 45)
-        time.sleep(0.5)
-        update_ocr_progress(document_id, 60)
-        time.sleep(0.5)
-        update_ocr_progress(document_id, 75)
-        time.sleep(0.5)
-        update_ocr_progress(document_id, 90)
-    else:
-        # Sem document_id, apenas delay simples
-        time.sleep(2)
-    
     return extracted_data, confidence_score
 
-def extract_rg_data(text):
-    """Extrai informações de um RG"""
-    # Implementação simplificada - em produção usaria NLP mais avançado
-    lines = text.split('\n')
-    
-    # Dicionário para armazenar os dados extraídos
-    data = {
-        "nome": "",
-        "rg": "",
-        "data_nascimento": "",
-        "filiacao": ""
-    }
+def start_simulated_ocr(document_id, engine_name, start_time, lane=lanes.LANE_STANDARD):
+    """
+    Agenda o OCR simulado de um documento como uma sequência de continuações
     
-    # Tentar encontrar padrões comuns em RG
-    for line in lines:
-        line = line.strip()
-        
-        # Procurar nome
-        if "nome" in line.lower() and len(line) > 6:
-            data["nome"] = line.replace("Nome:", "").replace("NOME:", "").strip()
-        
-        # Procurar RG
-        elif any(x in line.lower() for x in ["registro", "identidade", "rg"]) and len(line) < 30:
-            # Extrair apenas números e pontuações
-            import re
-            rg_pattern = re.search(r'[\d\.\-]+', line)
-            if rg_pattern:
-                data["rg"] = rg_pattern.group()
-        
-        # Procurar data de nascimento
-        elif any(x in line.lower() for x in ["nasc", "nascimento", "data"]) and len(line) < 30:
-            # Extrair padrão de data DD/MM/AAAA
-            import re
-            date_pattern = re.search(r'\d{2}[/\.\-]\d{2}[/\.\-]\d{4}', line)
-            if date_pattern:
-                data["data_nascimento"] = date_pattern.group()
-        
-        # Procurar filiação
-        elif any(x in line.lower() for x in ["filiac", "filiação", "pai", "mae", "mãe"]) and len(line) > 10:
-            data["filiacao"] = line.replace("Filiação:", "").replace("FILIAÇÃO:", "").strip()
-    
-    return data
-
-def extract_cpf_data(text):
-    """Extrai informações de um CPF"""
-    # Implementação simplificada
-    lines = text.split('\n')
-    
-    data = {
-        "nome": "",
-        "cpf": ""
-    }
+    Cada etapa publica o progresso e agenda a próxima com countdown, liberando
+    o worker durante a latência simulada (ver simulation.py).
+    """
+    delay, progress_steps = simulation.plan()
+    
+    update_ocr_progress(document_id, simulation.PROGRESS_START)
+    continue_simulated_ocr.apply_async(
+        args=[document_id, progress_steps, delay, start_time, engine_name],
+        countdown=delay,
+        queue=lane
+    )
     
-    # Procurar padrões de CPF
-    for line in lines:
-        line = line.strip()
-        
-        # Procurar nome
-        if "nome" in line.lower() and len(line) > 6:
-            data["nome"] = line.replace("Nome:", "").replace("NOME:", "").strip()
-        
-        # Procurar CPF
-        elif any(x in line.lower() for x in ["cpf", "cadastro"]):
-            # Extrair apenas números e pontuações no formato de CPF
-            import re
-            cpf_pattern = re.search(r'\d{3}\.?\d{3}\.?\d{3}\-?\d{2}', line)
-            if cpf_pattern:
-                data["cpf"] = cpf_pattern.group()
-    
-    return data
-
-def extract_proof_income_data(text):
-    """Extrai informações de um comprovante de renda"""
-    # Implementação simplificada
-    lines = text.split('\n')
-    
-    data = {
-        "valor": "",
-        "data": "",
-        "orgao": ""
+    logger.info(
+        "OCR simulado agendado",
+        document_id=document_id,
+        engine=engine_name or 'simulated',
+        latency=f"{delay * len(progress_steps):.2f}s",
+        steps=len(progress_steps)
+    )
+    
+    return {
+        "document_id": document_id,
+        "ocr_complete": False,
+        "status": "simulating"
     }
+
+@shared_task(
+    bind=True,
+    acks_late=True,
+    time_limit=60,
+    soft_time_limit=50,
+)
+def continue_simulated_ocr(self, document_id, progress_steps, delay, start_time, engine_name=None):
+    """
+    Etapa do OCR simulado: publica o progresso e agenda a próxima etapa,
+    ou salva o resultado quando todas as etapas foram cumpridas
+    
+    Args:
+        progress_steps: percentuais das etapas restantes
+        delay: intervalo (s) entre as etapas
+        start_time: instante (time.time()) em que o processamento começou
+        engine_name: 'fake' para extrair os campos do texto do motor falso,
+            ou None para os dados fixos de simulate_ocr
+    """
+    from .models import Document, OcrResult
+    
+    try:
+        document = Document.objects.select_related('ocr_result').get(id=document_id)
+        ocr_result = document.ocr_result
+    except (Document.DoesNotExist, OcrResult.DoesNotExist):
+        logger.info("OCR simulado interrompido: documento removido", document_id=document_id)
+        return {"document_id": document_id, "status": "not_found"}
+    
+    if ocr_result.ocr_complete:
+        return {"document_id": document_id, "ocr_complete": True, "status": "already_processed"}
+    
+    if cancellation.is_cancelled(document_id, document):
+        return cancel_ocr(document_id, self.request.id)
+    
+    progress, remaining = progress_steps[0], progress_steps[1:]
+    update_ocr_progress(document_id, progress)
     
-    # Procurar valores e datas
-    for line in lines:
-        line = line.strip()
-        
-        # Procurar valores monetários
-        if "R$" in line or any(x in line.lower() for x in ["valor", "salario", "salário", "vencimentos"]):
-            # Extrair valor no formato R$ X.XXX,XX
-            import re
-            value_pattern = re.search(r'R\$\s*[\d\.\,]+', line)
-            if value_pattern:
-                data["valor"] = value_pattern.group()
-        
-        # Procurar datas
-        elif any(x in line.lower() for x in ["data", "emissão", "emissao", "pagamento"]):
-            # Extrair padrão de data DD/MM/AAAA
-            import re
-            date_pattern = re.search(r'\d{2}[/\.\-]\d{2}[/\.\-]\d{4}', line)
-            if date_pattern:
-                data["data"] = date_pattern.group()
-        
-        # Procurar órgão emissor
-        elif any(x in line.lower() for x in ["empresa", "órgão", "orgao", "emissor", "empregador"]):
-            data["orgao"] = line.strip()
-    
-    return data
-
-def extract_address_proof_data(text):
-    """Extrai informações de um comprovante de endereço"""
-    # Implementação simplificada
-    lines = text.split('\n')
-    
-    data = {
-        "endereco": "",
-        "cep": "",
-        "cidade_uf": ""
+    if remaining:
+        continue_simulated_ocr.apply_async(
+            args=[document_id, remaining, delay, start_time, engine_name],
+            countdown=delay,
+            queue=lanes.current_lane(self)
+        )
+        return {"document_id": document_id, "ocr_complete": False, "status": "simulating"}
+    
+    full_text = None
+    if engine_name == engines.FakeEngine.name:
+        full_text = engines.FakeEngine().recognize(None, document.document_type)
+        extracted_data, confidence_score = extract_document_data(document.document_type, full_text)
+    else:
+        extracted_data, confidence_score = simulate_ocr(document.document_type)
+    
+    process_time = time.time() - start_time
+    save_ocr_success(
+        document, ocr_result, extracted_data, confidence_score, process_time,
+        full_text=full_text, engine_name=engine_name
+    )
+    
+    return {
+        "document_id": document_id,
+        "ocr_complete": True,
+        "confidence_score": confidence_score,
+        "process_time": process_time,
+        "status": "success"
     }
+
+@shared_task(
+    bind=True,
+    acks_late=True,
+    max_retries=None,  # Limitado por OCR_PROPOSAL_MAX_WAIT_SECONDS (ver proposal_ocr.finalize)
+    time_limit=60,
+    soft_time_limit=50,
+)
+def finalize_proposal_ocr(self, results, proposal_id, started_at):
+    """
+    Callback do chord de OCR de uma proposta: validação agregada do conjunto
+    de documentos e evento único de documentos prontos
     
-    # Procurar padrões de endereço
-    for i, line in enumerate(lines):
-        line = line.strip()
-        
-        # Procurar padrões de rua e número
-        if any(x in line.lower() for x in ["rua", "avenida", "av.", "alameda", "praça", "travessa"]) and len(line) > 5:
-            data["endereco"] = line.strip()
-        
-        # Procurar CEP
-        elif "cep" in line.lower() or any(x in line for x in ["CEP", "-"]):
-            # Extrair padrão de CEP
-            import re
-            cep_pattern = re.search(r'\d{5}[\-]?\d{3}', line)
-            if cep_pattern:
-                data["cep"] = cep_pattern.group()
-        
-        # Procurar cidade e UF
-        elif any(x in line.lower() for x in ["cidade", "município", "municipio", "estado"]) or (len(line) < 30 and "-" in line):
-            # Verificar se é padrão "Cidade - UF"
-            import re
-            city_uf_pattern = re.search(r'[A-Za-zÀ-ÿ\s]+\s*-\s*[A-Z]{2}', line)
-            if city_uf_pattern:
-                data["cidade_uf"] = city_uf_pattern.group()
+    As tarefas do chord retornam assim que o OCR segue para o pipeline em
+    etapas (ou para um lote); nesse caso o resumo é publicado na conclusão do
+    último documento (ver proposal_ocr.on_document_complete) e o callback
+    volta a executar apenas ao fim da espera máxima, publicando o resumo com
+    tempo esgotado se algum documento não tiver concluído.
+    """
+    summary = proposal_ocr.finalize(proposal_id, started_at)
+    if summary is None:
+        if not proposal_ocr.is_running(proposal_id, started_at):
+            # Resumo já publicado na conclusão do último documento
+            return {"proposal_id": proposal_id, "status": "published_on_completion"}
+        raise self.retry(countdown=proposal_ocr.get_remaining_wait(started_at))
     
-    return data
+    return {
+        "proposal_id": proposal_id,
+        "ready": summary['ready'],
+        "is_consistent": summary['is_consistent'],
+        "issues": summary['issues'],
+        "elapsed": summary['elapsed']
+    }
 
 # Tarefas periódicas para manutenção do OCR
 
+# Máximo de reenfileiramentos de uma tarefa OCR travada antes de marcá-la como falha
+MAX_STUCK_RETRIES = 3
+
+# Tempo sem atualização a partir do qual uma tarefa OCR não concluída é considerada travada
+STUCK_TASK_MINUTES = 15
+
+def _resubmit_stuck_ocr(ocr_results):
+    # Reenvio pela admissão justa, na faixa de retentativas: um cliente com
+    # muitos documentos travados não ocupa a faixa à frente dos demais
+    for ocr_result in ocr_results:
+        try:
+            lanes.submit_ocr(ocr_result.document, lanes.LANE_RETRY, task_id=ocr_result.task_id, fair=True)
+        except Exception as e:
+            logger.error(
+                "Erro ao reenviar tarefa OCR travada",
+                error=str(e),
+                document_id=ocr_result.document_id
+            )
+
 @shared_task
 def monitor_pending_ocr_tasks():
     """
     Tarefa periódica que monitora as tarefas de OCR pendentes e verifica se alguma está travada.
     Retenta tarefas que parecem estar travadas há muito tempo.
+    
+    Percorre os resultados travados em blocos paginados por chave
+    (OCR_MONITOR_CHUNK_SIZE linhas), bloqueados com SKIP LOCKED: execuções
+    concorrentes da varredura nunca reenfileiram o mesmo documento. Cada bloco
+    é atualizado com um único bulk_update e reenviado após o commit pela
+    admissão justa (lanes.submit_ocr), na faixa de retentativas. Documentos
+    ainda aguardando vaga na admissão justa não estão travados e são ignorados.
     """
     try:
-        # Obter todos os resultados OCR não concluídos
         from django.utils import timezone
+        from django.db import transaction
         from datetime import timedelta
+        from celery import uuid
         from .models import OcrResult
         
-        # Pegar tarefas que estão pendentes há mais de 15 minutos
-        time_threshold = timezone.now() - timedelta(minutes=15)
-        stuck_tasks = OcrResult.objects.filter(
-            ocr_complete=False,
-            updated_at__lt=time_threshold
-        ).select_related('document')
+        chunk_size = max(1, getattr(settings, 'OCR_MONITOR_CHUNK_SIZE', 500))
+        
+        # Pegar tarefas que estão pendentes há mais de STUCK_TASK_MINUTES minutos
+        time_threshold = timezone.now() - timedelta(minutes=STUCK_TASK_MINUTES)
         
+        checked = 0
         count = 0
-        for ocr_result in stuck_tasks:
-            # Verificar se o documento ainda existe
-            if not ocr_result.document:
-                # Se o documento foi excluído, remover o resultado do OCR
-                ocr_result.delete()
-                continue
+        abandoned = 0
+        last_id = 0
+        
+        while True:
+            with transaction.atomic():
+                chunk = list(
+                    OcrResult.objects.select_for_update(skip_locked=True, of=('self',))
+                    .filter(ocr_complete=False, updated_at__lt=time_threshold, id__gt=last_id)
+                    .select_related('document')
+                    .order_by('id')
+                    .only('id', 'document_id', 'retry_count', 'document__id', 'document__user_id')[:chunk_size]
+                )
+                if not chunk:
+                    break
                 
-            if ocr_result.retry_count < 3:  # Limitar a 3 tentativas
-                # Registrar como uma nova tentativa
-                ocr_result.retry_count += 1
-                ocr_result.task_status = 'RETRY'
-                ocr_result.save(update_fields=['retry_count', 'task_status', 'updated_at'])
+                last_id = chunk[-1].id
+                checked += len(chunk)
+                now = timezone.now()
                 
-                # Iniciar novo processamento
-                task = process_document_ocr.apply_async(
-                    args=[ocr_result.document.id],
-                    queue='ocr',
-                    priority=3  # Prioridade baixa para tarefas retentativas
-                )
+                try:
+                    waiting = lanes.get_waiting_documents(ocr_result.document_id for ocr_result in chunk)
+                except Exception as e:
+                    logger.warning("Erro ao consultar documentos em espera na faixa OCR padrão", error=str(e))
+                    waiting = set()
                 
-                # Atualizar task_id
-                ocr_result.task_id = task.id
-                ocr_result.save(update_fields=['task_id'])
+                to_retry = []
+                to_abandon = []
+                for ocr_result in chunk:
+                    if ocr_result.document_id in waiting:
+                        # Aguardando vaga na admissão justa: ainda não foi enviado
+                        continue
+                    ocr_result.updated_at = now
+                    if ocr_result.retry_count < MAX_STUCK_RETRIES:
+                        # Registrar como uma nova tentativa (task_id gerado antes do envio)
+                        ocr_result.retry_count += 1
+                        ocr_result.task_status = 'RETRY'
+                        ocr_result.task_id = uuid()
+                        to_retry.append(ocr_result)
+                    else:
+                        # Se já chegou ao limite de tentativas, marcar como falha
+                        ocr_result.ocr_complete = True
+                        ocr_result.task_status = 'FAILURE'
+                        ocr_result.error_message = "Falha após múltiplas tentativas"
+                        to_abandon.append(ocr_result)
                 
-                logger.info(
-                    "Tarefa OCR travada reiniciada",
-                    document_id=ocr_result.document.id,
-                    task_id=task.id,
-                    retry_count=ocr_result.retry_count
-                )
-                count += 1
-            else:
-                # Se já chegou ao limite de tentativas, marcar como falha
-                ocr_result.ocr_complete = True
-                ocr_result.task_status = 'FAILURE'
-                ocr_result.error_message = "Falha após múltiplas tentativas"
-                ocr_result.save()
+                if to_retry:
+                    OcrResult.objects.bulk_update(
+                        to_retry, ['retry_count', 'task_status', 'task_id', 'updated_at']
+                    )
+                    # Status em cache reconstruído a partir do banco na próxima consulta
+                    transaction.on_commit(
+                        lambda ids=[ocr_result.document_id for ocr_result in to_retry]: ocr_progress.invalidate(ids)
+                    )
+                    
+                    # Iniciar novo processamento apenas após o commit do bloco
+                    transaction.on_commit(lambda results=to_retry: _resubmit_stuck_ocr(results))
                 
-                logger.warning(
-                    "Tarefa OCR abandonada após múltiplas tentativas",
-                    document_id=ocr_result.document.id,
-                    retry_count=ocr_result.retry_count
-                )
+                if to_abandon:
+                    OcrResult.objects.bulk_update(
+                        to_abandon, ['ocr_complete', 'task_status', 'error_message', 'updated_at']
+                    )
+                    transaction.on_commit(
+                        lambda ids=[ocr_result.document_id for ocr_result in to_abandon]: ocr_progress.invalidate(ids)
+                    )
+                    logger.warning(
+                        "Tarefas OCR abandonadas após múltiplas tentativas",
+                        document_ids=[ocr_result.document_id for ocr_result in to_abandon],
+                        retry_count=MAX_STUCK_RETRIES
+                    )
+                
+                count += len(to_retry)
+                abandoned += len(to_abandon)
+            
+            logger.info(
+                "Bloco de tarefas OCR travadas processado",
+                chunk_size=len(chunk),
+                restarted=len(to_retry),
+                abandoned=len(to_abandon),
+                last_id=last_id
+            )
+            
+            if len(chunk) < chunk_size:
+                break
         
-        return f"Verificado {len(stuck_tasks)} tarefas pendentes. Reiniciadas: {count}"
+        # Recuperar documentos em espera na faixa padrão cujas vagas expiraram
+        admitted = lanes.pump()
+        if admitted:
+            logger.info("Documentos em espera admitidos na faixa OCR padrão", admitted=admitted)
+        
+        return f"Verificado {checked} tarefas pendentes. Reiniciadas: {count}. Abandonadas: {abandoned}"
         
     except Exception as e:
         logger.error("Erro ao monitorar tarefas OCR pendentes", error=str(e))
         return f"Erro ao monitorar tarefas: {str(e)}"
 
+@shared_task
+def evict_ocr_result_cache():
+    """
+    Tarefa periódica que mantém o cache de resultados OCR dentro do orçamento
+    configurado (OCR_CACHE_MAX_ENTRIES), removendo as entradas usadas há mais tempo.
+    """
+    try:
+        removed = ocr_cache.evict_least_recently_used()
+        return f"Removidas {removed} entradas do cache OCR"
+        
+    except Exception as e:
+        logger.error("Erro ao limpar cache de resultados OCR", error=str(e))
+        return f"Erro ao limpar cache OCR: {str(e)}"
+
 @shared_task
 def cleanup_old_ocr_results():
     """
     Limpa resultados de OCR muito antigos para economizar espaço no banco de dados.
-    Mantém apenas os resultados dos últimos 90 dias.
+    Mantém apenas os resultados dos últimos OCR_RETENTION_DAYS dias (padrão 90).
+    
+    A exclusão é feita em lotes de OCR_RETENTION_BATCH_SIZE linhas, por faixas
+    de chave primária, com pausa de OCR_RETENTION_BATCH_SLEEP_MS entre lotes.
+    Cada lote, com as respostas completas dos motores (OcrRawPayload) dos mesmos
+    documentos, é gravado no arquivo frio (ver archive.py) antes de ser excluído.
+    Se o tempo de OCR_RETENTION_MAX_SECONDS se esgotar, a limpeza continua em
+    uma nova execução da tarefa.
     """
     try:
         from django.utils import timezone
+        from django.db import transaction
         from datetime import timedelta
-        from .models import OcrResult
+        from . import archive
+        from .models import OcrResult, OcrRawPayload
         
-        # Definir limite de 90 dias
-        time_threshold = timezone.now() - timedelta(days=90)
+        retention_days = getattr(settings, 'OCR_RETENTION_DAYS', 90)
+        batch_size = max(1, getattr(settings, 'OCR_RETENTION_BATCH_SIZE', 1000))
+        batch_sleep = max(0, getattr(settings, 'OCR_RETENTION_BATCH_SLEEP_MS', 200)) / 1000.0
+        max_seconds = getattr(settings, 'OCR_RETENTION_MAX_SECONDS', 240)
+        archive_enabled = archive.is_archive_enabled()
         
-        # Obter todos os resultados OCR concluídos antes do período
-        old_results = OcrResult.objects.filter(
-            ocr_complete=True,
-            updated_at__lt=time_threshold
-        )
+        time_threshold = timezone.now() - timedelta(days=retention_days)
+        old_results = OcrResult.objects.filter(ocr_complete=True, updated_at__lt=time_threshold)
         
-        # Registrar o número de itens que serão excluídos
-        count = old_results.count()
+        start = time.monotonic()
+        count = 0
+        archives = 0
+        last_id = 0
         
-        if count > 0:
-            logger.info(f"Removendo {count} resultados OCR antigos")
-            old_results.delete()
+        while True:
+            batch = list(old_results.filter(id__gt=last_id).order_by('id')[:batch_size])
+            if not batch:
+                break
+            
+            first_id, last_id = batch[0].id, batch[-1].id
+            
+            document_ids = [ocr_result.document_id for ocr_result in batch]
+            
+            # Gravar o lote no arquivo frio antes de excluir (falha interrompe a limpeza),
+            # com as respostas completas dos motores dos mesmos documentos
+            if archive_enabled:
+                payloads = list(OcrRawPayload.objects.filter(document_id__in=document_ids).order_by('document_id'))
+                archive.write_archive(batch, payloads)
+                archives += 1
+            
+            # Excluir apenas as linhas arquivadas, dentro da faixa de IDs do lote
+            with transaction.atomic():
+                deleted, _ = old_results.filter(
+                    id__gte=first_id,
+                    id__lte=last_id,
+                    id__in=[ocr_result.id for ocr_result in batch]
+                ).delete()
+                # Respostas completas dos motores seguem a mesma retenção
+                OcrRawPayload.objects.filter(document_id__in=document_ids).delete()
+            count += deleted
+            ocr_progress.invalidate(document_ids)
+            
+            logger.info(
+                "Lote de resultados OCR antigos removido",
+                first_id=first_id,
+                last_id=last_id,
+                deleted=deleted
+            )
+            
+            if len(batch) < batch_size:
+                break
+            
+            if time.monotonic() - start > max_seconds:
+                # Continuar em uma nova execução para não exceder o limite de tempo da tarefa
+                cleanup_old_ocr_results.apply_async(countdown=60)
+                logger.info("Limpeza de resultados OCR continuará em nova execução", removed=count)
+                break
+            
+            time.sleep(batch_sleep)
         
-        return f"Removidos {count} resultados OCR antigos"
+        return f"Removidos {count} resultados OCR antigos ({archives} arquivos gerados)"
         
     except Exception as e:
         logger.error("Erro ao limpar resultados OCR antigos", error=str(e))
-        return f"Erro ao limpar resultados: {str(e)}" 
\ No newline at end of file
+        return f"Erro ao limpar resultados: {str(e)}"
@@ -0,0 +1,173 @@
+"""
+Testes do envio em lote ao Google Vision (batching.py e flush_ocr_batch)
+
+O Google Vision é substituído pelo FakeVisionClient: arquivos de texto são
+"reconhecidos" como o próprio conteúdo, e o conteúdo FAIL simula a falha de
+uma imagem do lote. O Redis é o fakeredis com suporte a Lua, para exercitar
+os scripts da lista de processamento.
+"""
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+import fakeredis
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+
+from celebra_capital.api.documents import (
+    batching, cancellation, lanes, progress, proposal_ocr, ratelimit, tasks
+)
+from celebra_capital.api.documents.fake_vision import FakeVisionClient, FakeVisionError
+from celebra_capital.api.documents.models import Document, OcrResult
+
+FAILED_CONTENT = b'FAIL'
+
+
+def responder(content):
+    if content == FAILED_CONTENT:
+        raise FakeVisionError("Imagem ilegível")
+    return content.decode('utf-8')
+
+
+class BatchFlushTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root,
+            USE_GOOGLE_VISION=True,
+            OCR_BATCH_ENABLED=True,
+            OCR_RATE_LIMIT_ENABLED=False,
+            CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.redis = fakeredis.FakeRedis()
+        for module in (batching, cancellation, lanes, progress, proposal_ocr, ratelimit):
+            self.patch(module, 'get_redis', lambda: self.redis)
+
+        self.vision = FakeVisionClient(responder)
+        self.patch(tasks, 'get_vision_client', lambda: self.vision)
+        # Reenvios individuais e novos envios do lote são apenas registrados
+        self.dispatch = self.patch(lanes, 'dispatch', mock.Mock())
+        self.patch(tasks.flush_ocr_batch, 'apply_async', mock.Mock())
+
+        user = User.objects.create_user(username='cliente', password='x')
+        self.documents = []
+        for index, content in enumerate([
+            b'Nome: Joao da Silva\nCPF 123.456.789-00',
+            FAILED_CONTENT,
+            b'Nome: Maria Souza\nCPF: 987.654.321-00',
+        ]):
+            document = Document.objects.create(
+                user=user,
+                document_type='cpf',
+                file=ContentFile(content, name=f'cpf_{index}.txt'),
+                file_name=f'cpf_{index}.txt',
+                file_size=len(content),
+            )
+            OcrResult.objects.create(document=document, task_id=f'task-{index}')
+            self.documents.append(document)
+
+    def patch(self, target, attribute, value):
+        patcher = mock.patch.object(target, attribute, value)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def enqueue_all(self):
+        for document in self.documents:
+            self.redis.rpush(batching.PENDING_KEY, document.id)
+
+    def flush(self, task_id=None):
+        return tasks.flush_ocr_batch.apply(task_id=task_id).get()
+
+    def redispatched(self):
+        return [call.args[0] for call in self.dispatch.call_args_list]
+
+    def assert_no_processing_lists(self):
+        self.assertEqual(self.redis.keys(batching.PROCESSING_KEY_PREFIX + '*'), [])
+        self.assertEqual(self.redis.zcard(batching.PROCESSING_INDEX_KEY), 0)
+
+    def test_partial_failure_is_recorded_per_document(self):
+        self.enqueue_all()
+
+        result = self.flush()
+
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual((result['succeeded'], result['failed']), (2, 1))
+        # Uma única requisição para as três imagens
+        self.assertEqual((self.vision.request_count, self.vision.image_count), (1, 3))
+
+        first, failed, last = (OcrResult.objects.get(document=document) for document in self.documents)
+        self.assertTrue(first.ocr_complete)
+        self.assertEqual(first.task_status, 'SUCCESS')
+        self.assertEqual(first.extracted_data['cpf'], '123.456.789-00')
+        self.assertTrue(last.ocr_complete)
+        self.assertEqual(last.extracted_data['cpf'], '987.654.321-00')
+        # A imagem com erro volta ao processamento individual, com o mesmo task_id
+        self.assertFalse(failed.ocr_complete)
+        self.assertEqual(self.redispatched(), [self.documents[1].id])
+        self.assertEqual(self.dispatch.call_args.kwargs['task_id'], 'task-1')
+        self.assertFalse(self.dispatch.call_args.kwargs['allow_batch'])
+
+        self.assertEqual(self.redis.llen(batching.PENDING_KEY), 0)
+        self.assert_no_processing_lists()
+
+    def test_request_failure_redispatches_every_document(self):
+        self.vision.fail_requests = True
+        self.enqueue_all()
+
+        result = self.flush()
+
+        self.assertEqual(result, {'status': 'requeued', 'batch_size': 3})
+        self.assertEqual(self.redispatched(), [document.id for document in self.documents])
+        self.assertFalse(OcrResult.objects.filter(ocr_complete=True).exists())
+        self.assert_no_processing_lists()
+
+    def test_redelivered_flush_resumes_its_processing_list(self):
+        self.enqueue_all()
+        # Execução interrompida após retirar o lote
+        batching.pop_batch('flush-1')
+        self.assertEqual(self.redis.llen(batching.PENDING_KEY), 0)
+
+        result = self.flush(task_id='flush-1')
+
+        self.assertEqual((result['succeeded'], result['failed']), (2, 1))
+        self.assert_no_processing_lists()
+
+    def test_abandoned_processing_list_is_recovered(self):
+        self.enqueue_all()
+        batching.pop_batch('flush-dead')
+        self.redis.zadd(batching.PROCESSING_INDEX_KEY, {
+            'flush-dead': time.time() - batching.PROCESSING_TIMEOUT_SECONDS - 1
+        })
+
+        result = self.flush(task_id='flush-2')
+
+        self.assertEqual(result['batch_size'], 3)
+        self.assertEqual(OcrResult.objects.filter(ocr_complete=True).count(), 2)
+        self.assert_no_processing_lists()
+
+    def test_recent_processing_list_is_not_recovered(self):
+        self.enqueue_all()
+        batching.pop_batch('flush-running')
+
+        self.assertEqual(batching.recover_abandoned(), 0)
+        self.assertEqual(self.redis.llen(batching.PENDING_KEY), 0)
+        self.assertEqual(self.redis.llen(batching.PROCESSING_KEY_PREFIX + 'flush-running'), 3)
+
+    def test_push_back_returns_unacked_documents_in_order(self):
+        self.enqueue_all()
+        batching.pop_batch('flush-3')
+        # Documento enfileirado durante o envio
+        self.redis.rpush(batching.PENDING_KEY, 999)
+        batching.ack('flush-3', [self.documents[0].id])
+
+        self.assertEqual(batching.push_back('flush-3'), 2)
+
+        pending = [int(item) for item in self.redis.lrange(batching.PENDING_KEY, 0, -1)]
+        self.assertEqual(pending, [self.documents[1].id, self.documents[2].id, 999])
+        self.assert_no_processing_lists()
@@ -0,0 +1,197 @@
+"""
+Testes do upload direto ao S3 (direct_uploads.py)
+
+O bucket é simulado pelo moto (mock_s3): a URL pré-assinada é usada de fato
+em um PUT, e a conclusão confere o objeto gravado (tamanho, checksum e tipo
+real). Como o moto não guarda checksums, a conferência segue pelo cálculo
+do SHA-256 a partir do conteúdo, como em storages S3 sem checksum.
+"""
+import hashlib
+import io
+from unittest import mock
+
+import boto3
+import requests
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from moto import mock_s3
+from PIL import Image
+from rest_framework import status
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from celebra_capital.api.documents import direct_uploads, uploads
+from celebra_capital.api.documents.models import Document
+
+BUCKET = 'celebra-test-documents'
+
+
+class MemoryRedis:
+    """Subconjunto do cliente Redis usado pelas sessões de upload direto"""
+
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, ex=None, **kwargs):
+        self.data[key] = value.encode() if isinstance(value, str) else value
+        return True
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def delete(self, *keys):
+        return sum(1 for key in keys if self.data.pop(key, None) is not None)
+
+
+def jpeg_bytes():
+    output = io.BytesIO()
+    Image.new('RGB', (64, 48), color=(200, 180, 160)).save(output, format='JPEG')
+    return output.getvalue()
+
+
+@override_settings(
+    DOCUMENT_UPLOAD_MAX_SIZE_MB={'image': 1, 'application/pdf': 1},
+    DOCUMENT_DIRECT_UPLOAD_ENABLED=True,
+)
+class DirectUploadTests(TestCase):
+    def setUp(self):
+        self.s3 = mock_s3()
+        self.s3.start()
+        self.addCleanup(self.s3.stop)
+
+        client_kwargs = dict(
+            region_name='us-east-1',
+            aws_access_key_id='testing',
+            aws_secret_access_key='testing',
+        )
+        boto3.client('s3', **client_kwargs).create_bucket(Bucket=BUCKET)
+        self.storage = S3Boto3Storage(
+            bucket_name=BUCKET,
+            region_name='us-east-1',
+            access_key='testing',
+            secret_key='testing',
+            signature_version='s3v4',
+        )
+
+        self.redis = MemoryRedis()
+        for target, value in (('get_storage', lambda: self.storage), ('get_redis', lambda: self.redis)):
+            patcher = mock.patch.object(direct_uploads, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.user = User.objects.create_user(username='cliente', password='x')
+        self.content = jpeg_bytes()
+
+    def start_upload(self, content, **overrides):
+        params = dict(
+            document_type='rg',
+            file_name='rg frente.jpg',
+            file_size=len(content),
+            content_type='image/jpeg',
+            sha256=hashlib.sha256(content).hexdigest(),
+        )
+        params.update(overrides)
+        return direct_uploads.create_upload(self.user, **params)
+
+    def put(self, upload, content):
+        response = requests.put(upload['url'], data=content, headers=upload['headers'])
+        self.assertEqual(response.status_code, 200)
+
+    def object_exists(self, upload):
+        session = direct_uploads.get_session(upload['upload_id'])
+        return self.storage.exists(session['name'])
+
+    def test_presign_put_and_complete_creates_document(self):
+        upload = self.start_upload(self.content)
+        self.assertEqual(upload['method'], 'PUT')
+        self.assertEqual(upload['headers']['Content-Type'], 'image/jpeg')
+        self.put(upload, self.content)
+
+        document = direct_uploads.complete_upload(upload['upload_id'], self.user)
+
+        self.assertEqual(document.user, self.user)
+        self.assertEqual(document.document_type, 'rg')
+        self.assertEqual(document.mime_type, 'image/jpeg')
+        self.assertEqual(document.file_size, len(self.content))
+        self.assertEqual(document.file_hash, hashlib.sha256(self.content).hexdigest())
+        self.assertTrue(self.storage.exists(document.file.name))
+        # A sessão é consumida na conclusão
+        self.assertIsNone(direct_uploads.get_session(upload['upload_id']))
+
+    def test_complete_twice_creates_a_single_document(self):
+        upload = self.start_upload(self.content)
+        self.put(upload, self.content)
+        direct_uploads.complete_upload(upload['upload_id'], self.user)
+
+        with self.assertRaises(uploads.UploadRejected) as rejected:
+            direct_uploads.complete_upload(upload['upload_id'], self.user)
+        self.assertEqual(rejected.exception.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(Document.objects.filter(user=self.user).count(), 1)
+
+    def test_complete_before_put_is_a_conflict(self):
+        upload = self.start_upload(self.content)
+
+        with self.assertRaises(uploads.UploadRejected) as rejected:
+            direct_uploads.complete_upload(upload['upload_id'], self.user)
+        self.assertEqual(rejected.exception.status_code, status.HTTP_409_CONFLICT)
+        # A sessão continua válida para o envio
+        self.assertIsNotNone(direct_uploads.get_session(upload['upload_id']))
+
+    def test_complete_by_another_user_is_not_found(self):
+        upload = self.start_upload(self.content)
+        self.put(upload, self.content)
+        other = User.objects.create_user(username='outro', password='x')
+
+        with self.assertRaises(uploads.UploadRejected) as rejected:
+            direct_uploads.complete_upload(upload['upload_id'], other)
+        self.assertEqual(rejected.exception.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(Document.objects.exists())
+
+    def test_complete_rejects_size_mismatch_and_removes_object(self):
+        upload = self.start_upload(self.content)
+        self.put(upload, self.content + b'\x00' * 16)
+
+        with self.assertRaises(uploads.UploadRejected) as rejected:
+            direct_uploads.complete_upload(upload['upload_id'], self.user)
+        self.assertEqual(rejected.exception.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Tamanho', str(rejected.exception))
+        self.assertFalse(self.object_exists(upload))
+        self.assertFalse(Document.objects.exists())
+
+    def test_complete_rejects_checksum_mismatch_and_removes_object(self):
+        upload = self.start_upload(self.content)
+        tampered = self.content[:-1] + bytes([self.content[-1] ^ 0xFF])
+        self.put(upload, tampered)
+
+        with self.assertRaises(uploads.UploadRejected) as rejected:
+            direct_uploads.complete_upload(upload['upload_id'], self.user)
+        self.assertEqual(rejected.exception.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Checksum', str(rejected.exception))
+        self.assertFalse(self.object_exists(upload))
+
+    def test_complete_rejects_unsupported_real_type_and_removes_object(self):
+        # Declarado como imagem, mas o conteúdo é um arquivo ZIP
+        content = b'PK\x03\x04' + b'\x00' * 2048
+        upload = self.start_upload(content)
+        self.put(upload, content)
+
+        with self.assertRaises(uploads.UploadRejected) as rejected:
+            direct_uploads.complete_upload(upload['upload_id'], self.user)
+        self.assertEqual(rejected.exception.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Tipo de arquivo não suportado', str(rejected.exception))
+        self.assertFalse(self.object_exists(upload))
+        self.assertFalse(Document.objects.exists())
+
+    def test_presign_rejects_unsupported_type(self):
+        with self.assertRaises(uploads.UploadRejected) as rejected:
+            self.start_upload(self.content, content_type='application/zip')
+        self.assertEqual(rejected.exception.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+    def test_presign_rejects_size_above_limit(self):
+        with self.assertRaises(uploads.UploadRejected) as rejected:
+            self.start_upload(self.content, file_size=2 * 1024 * 1024)
+        self.assertEqual(rejected.exception.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    def test_presign_rejects_invalid_checksum(self):
+        with self.assertRaises(uploads.UploadRejected) as rejected:
+            self.start_upload(self.content, sha256='nao-e-hex')
+        self.assertEqual(rejected.exception.status_code, status.HTTP_400_BAD_REQUEST)
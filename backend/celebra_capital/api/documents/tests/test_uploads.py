@@ -0,0 +1,85 @@
+"""
+Testes do recebimento de uploads multipart (uploads.py e views de upload)
+
+A rota de selfie usa o mesmo recebimento em uma passagem do upload de
+documento: tipo real detectado pelo conteúdo, limite de tamanho do tipo e
+SHA-256 calculado durante a gravação.
+"""
+import hashlib
+import io
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from celebra_capital.api.documents import views
+from celebra_capital.api.documents.models import Document
+
+
+def jpeg_bytes(size=(64, 48)):
+    output = io.BytesIO()
+    Image.new('RGB', size, color=(120, 90, 60)).save(output, format='JPEG')
+    return output.getvalue()
+
+
+class SelfieUploadTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root,
+            DOCUMENT_UPLOAD_MAX_SIZE_MB={'image': 0.01, 'application/pdf': 1},
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        # O OCR não faz parte do recebimento
+        patcher = mock.patch.object(views, 'start_document_ocr')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = User.objects.create_user(username='cliente', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('documents:selfie-upload')
+
+    def upload(self, content, name='selfie.jpg', content_type='image/jpeg'):
+        return self.client.post(
+            self.url,
+            {'file': SimpleUploadedFile(name, content, content_type=content_type)},
+            format='multipart'
+        )
+
+    def test_selfie_is_received_in_a_single_pass(self):
+        content = jpeg_bytes()
+        # Tipo declarado pelo cliente diferente do conteúdo
+        response = self.upload(content, content_type='application/octet-stream')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        document = Document.objects.get()
+        self.assertEqual(document.document_type, 'selfie')
+        self.assertEqual(document.mime_type, 'image/jpeg')
+        self.assertEqual(document.file_hash, hashlib.sha256(content).hexdigest())
+
+    def test_oversized_selfie_is_rejected(self):
+        content = jpeg_bytes(size=(640, 480)) + b'\x00' * 16 * 1024
+
+        response = self.upload(content)
+
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertFalse(Document.objects.exists())
+
+    def test_selfie_with_unsupported_real_type_is_rejected(self):
+        # Declarado como imagem, mas o conteúdo é um arquivo ZIP
+        response = self.upload(b'PK\x03\x04' + b'\x00' * 2048)
+
+        self.assertEqual(response.status_code, status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        self.assertIn('Tipo de arquivo não suportado', response.data['error'])
+        self.assertFalse(Document.objects.exists())
@@ -0,0 +1,179 @@
+"""
+Recebimento de uploads de documentos em uma única passagem
+
+O StreamingUploadHandler substitui os handlers padrão do Django no upload de
+documentos. A cada bloco recebido ele:
+
+- atualiza o SHA-256 do conteúdo (usado na deduplicação do OCR, sem reler o
+  arquivo depois);
+- no primeiro bloco, detecta o tipo real do arquivo com python-magic (o
+  content-type informado pelo cliente é ignorado) e recusa tipos não aceitos;
+- aplica o limite de tamanho do tipo (DOCUMENT_UPLOAD_MAX_SIZE_MB),
+  interrompendo o recebimento assim que ele é ultrapassado;
+- grava o bloco em um arquivo temporário dentro do diretório do storage.
+
+Como o arquivo temporário já está no mesmo sistema de arquivos do storage,
+salvar o FileField apenas o move (rename), sem copiar o conteúdo. Em
+storages remotos (S3), o envio parte do arquivo temporário, em partes.
+"""
+import hashlib
+import os
+import tempfile
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from rest_framework import status
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+# Bytes do início do arquivo usados na detecção do tipo
+SNIFF_BYTES = 2048
+
+# Tamanho dos blocos lidos ao calcular hashes de arquivos já armazenados
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# Subdiretório do storage onde os uploads em andamento são gravados
+TEMP_SUBDIR = 'uploads_tmp'
+
+
+class UploadRejected(Exception):
+    """Arquivo recusado durante o recebimento (tipo não aceito ou tamanho acima do limite)"""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class StreamedUploadedFile(UploadedFile):
+    """
+    Arquivo recebido pelo StreamingUploadHandler
+
+    Expõe temporary_file_path(), como o TemporaryUploadedFile do Django, para
+    que o FileSystemStorage mova o arquivo em vez de copiá-lo.
+
+    Attributes:
+        sha256: hash SHA-256 (hexadecimal) do conteúdo, após o recebimento
+        declared_content_type: content-type informado pelo cliente
+    """
+
+    def __init__(self, name, content_type, charset, content_type_extra, temp_dir=None):
+        _, ext = os.path.splitext(name)
+        file = tempfile.NamedTemporaryFile(suffix='.upload' + ext, dir=temp_dir)
+        super().__init__(file, name, content_type, 0, charset, content_type_extra)
+        self.sha256 = None
+        self.declared_content_type = content_type
+
+    def temporary_file_path(self):
+        return self.file.name
+
+    def close(self):
+        try:
+            return self.file.close()
+        except FileNotFoundError:
+            # Arquivo já movido para o storage
+            pass
+
+
+def get_size_limits():
+    """Limites de tamanho em bytes por tipo MIME ('image/png') ou tipo principal ('image')"""
+    limits = getattr(settings, 'DOCUMENT_UPLOAD_MAX_SIZE_MB', {'image': 20, 'application/pdf': 50})
+    return {mime_type: int(float(size) * 1024 * 1024) for mime_type, size in limits.items()}
+
+
+def get_size_limit(mime_type):
+    """Limite de tamanho do tipo, ou None se o tipo não for aceito"""
+    limits = get_size_limits()
+    if mime_type in limits:
+        return limits[mime_type]
+    return limits.get(mime_type.split('/', 1)[0])
+
+
+def sniff_mime_type(header):
+    """Tipo MIME detectado pelo conteúdo (libmagic)"""
+    import magic
+
+    return magic.from_buffer(header, mime=True)
+
+
+def get_temp_dir(storage):
+    """
+    Diretório dos uploads em andamento
+
+    No FileSystemStorage, um subdiretório do próprio storage (mover para o
+    destino final é um rename); nos demais, o diretório temporário padrão.
+    """
+    temp_dir = getattr(settings, 'DOCUMENT_UPLOAD_TEMP_DIR', None)
+    if not temp_dir and isinstance(storage, FileSystemStorage):
+        temp_dir = os.path.join(storage.location, TEMP_SUBDIR)
+    if temp_dir:
+        os.makedirs(temp_dir, exist_ok=True)
+    return temp_dir or None
+
+
+class StreamingUploadHandler(FileUploadHandler):
+    """
+    Handler de upload que calcula o hash, detecta o tipo e grava no storage em uma passagem
+
+    Arquivos recusados são descartados (o restante do envio é lido e
+    ignorado) e registrados em errors, por nome de campo, para a view
+    responder com o erro adequado.
+    """
+
+    def __init__(self, request=None, storage=None):
+        super().__init__(request)
+        self.storage = storage
+        self.errors = {}
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+        self.size_limit = None
+        self.file = StreamedUploadedFile(
+            self.file_name, self.content_type, self.charset, self.content_type_extra,
+            temp_dir=get_temp_dir(self.storage)
+        )
+
+    def _reject(self, message, status_code):
+        self.errors[self.field_name] = UploadRejected(message, status_code)
+        logger.warning(
+            "Upload recusado",
+            field_name=self.field_name,
+            file_name=self.file_name,
+            reason=message
+        )
+        raise SkipFile(message)
+
+    def receive_data_chunk(self, raw_data, start):
+        if start == 0:
+            mime_type = sniff_mime_type(raw_data[:SNIFF_BYTES])
+            self.size_limit = get_size_limit(mime_type)
+            if self.size_limit is None:
+                self._reject(
+                    f"Tipo de arquivo não suportado: {mime_type}",
+                    status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+                )
+            self.file.content_type = mime_type
+
+        if start + len(raw_data) > self.size_limit:
+            self._reject(
+                f"Arquivo excede o tamanho máximo de {self.size_limit / (1024 * 1024):g} MB "
+                f"para o tipo {self.file.content_type}",
+                status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+
+        self.sha256.update(raw_data)
+        self.file.write(raw_data)
+        # Bloco consumido: não repassar a outros handlers
+        return None
+
+    def file_complete(self, file_size):
+        if not file_size:
+            self.errors[self.field_name] = UploadRejected("Arquivo vazio", status.HTTP_400_BAD_REQUEST)
+            self.file.close()
+            return None
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.sha256.hexdigest()
+        return self.file
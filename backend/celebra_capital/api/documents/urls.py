@@ -1,13 +1,18 @@
 from django.urls import path
 from .views import (
     DocumentUploadView, 
+    DirectUploadView,
+    DirectUploadCompleteView,
     DocumentListView, 
     DocumentDetailView, 
     OcrResultView,
     OcrStatusView,
+    OcrRawPayloadView,
+    DocumentDuplicatesView,
     DocumentValidationView,
     SelfieUploadView,
-    RequiredDocumentsView
+    RequiredDocumentsView,
+    ProposalOcrView
 )
 
 app_name = 'documents'
@@ -19,12 +24,19 @@ urlpatterns = [
     # Upload de documentos
     path('upload/', DocumentUploadView.as_view(), name='document-upload'),
     
+    # Upload direto para o storage de objetos (URL pré-assinada) e conclusão
+    path('upload/direct/', DirectUploadView.as_view(), name='direct-upload'),
+    path('upload/direct/<str:upload_id>/complete/', DirectUploadCompleteView.as_view(), name='direct-upload-complete'),
+    
     # Upload de selfie
     path('selfie/', SelfieUploadView.as_view(), name='selfie-upload'),
     
     # Documentos necessários para proposta
     path('required/<int:proposal_id>/', RequiredDocumentsView.as_view(), name='required-documents'),
     
+    # OCR do conjunto de documentos da proposta (chord)
+    path('proposal/<int:proposal_id>/ocr/', ProposalOcrView.as_view(), name='proposal-ocr'),
+    
     # Detalhes, atualização e exclusão de documento
     path('<int:pk>/', DocumentDetailView.as_view(), name='document-detail'),
     
@@ -34,6 +46,12 @@ urlpatterns = [
     # Status de OCR
     path('<int:document_id>/ocr/status/', OcrStatusView.as_view(), name='ocr-status'),
     
+    # Resposta completa do motor de OCR (auditoria, apenas equipe)
+    path('<int:document_id>/ocr/raw/', OcrRawPayloadView.as_view(), name='ocr-raw-payload'),
+    
+    # Possíveis duplicatas por hash perceptual (revisão de fraude, apenas equipe)
+    path('<int:document_id>/duplicates/', DocumentDuplicatesView.as_view(), name='document-duplicates'),
+    
     # Validação de documento
     path('<int:document_id>/validate/', DocumentValidationView.as_view(), name='document-validate'),
 ] 
\ No newline at end of file
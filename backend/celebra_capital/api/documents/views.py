@@ -5,11 +5,11 @@ from rest_framework.parsers import MultiPartParser, FormParser
 from .models import Document, OcrResult
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.models import User
-from django.utils import timezone
+from django.utils.http import parse_etags
 from celebra_capital.api.proposals.models import Proposal
 from .serializers import DocumentSerializer, OcrResultSerializer
-from .tasks import process_document_ocr
-from celery.result import AsyncResult
+from . import ocr_cache, lanes, payloads, proposal_ocr, similarity, cancellation, uploads, direct_uploads
+from . import progress as ocr_progress
 import structlog
 
 # Configurar o logger estruturado
@@ -17,101 +17,205 @@ logger = structlog.get_logger(__name__)
 
 # Implementações de views serão adicionadas posteriormente
 
+def start_document_ocr(document):
+    """Envia o OCR de um documento recém-enviado, se o tipo for processado por OCR"""
+    if document.document_type not in proposal_ocr.OCR_DOCUMENT_TYPES:
+        return
+    
+    # Documento que completa o conjunto da proposta: OCR de todos em paralelo (chord)
+    if proposal_ocr.start_if_complete(document):
+        logger.info(
+            "Processamento OCR da proposta iniciado",
+            document_id=document.id,
+            proposal_id=document.proposal_id
+        )
+        return
+    
+    # Criar OcrResult e enviar tarefa para a faixa OCR padrão (admissão justa por usuário)
+    ocr_result = lanes.start_ocr(document, lanes.LANE_STANDARD)
+    
+    logger.info(
+        "Processamento OCR iniciado",
+        document_id=document.id,
+        task_id=ocr_result.task_id,
+        document_type=document.document_type
+    )
+
+def _handle_upload(request, document_type=None):
+    """
+    Recebe o arquivo de um upload multipart e cria o documento
+    
+    document_type fixa o tipo (rota de selfie); sem ele, o tipo vem do
+    formulário. O corpo só é lido depois de instalado o StreamingUploadHandler.
+    """
+    try:
+        # Obter usuário
+        user = request.user
+        
+        # Recebimento em uma passagem: hash, tipo real e limite de tamanho
+        # verificados enquanto o arquivo é gravado (ver uploads.py)
+        upload_handler = uploads.StreamingUploadHandler(request, storage=Document._meta.get_field('file').storage)
+        request.upload_handlers = [upload_handler]
+        
+        # Ler o corpo agora: os erros do recebimento só existem após o parse
+        data = request.data
+        
+        # Verificar dados
+        document_type = document_type or data.get('document_type')
+        if not document_type:
+            return Response(
+                {"error": "Tipo de documento é obrigatório"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        # Arquivo recusado durante o recebimento
+        rejected = upload_handler.errors.get('file')
+        if rejected is not None:
+            return Response({"error": str(rejected)}, status=rejected.status_code)
+        
+        # Verificar se o arquivo foi enviado
+        if 'file' not in request.FILES:
+            return Response(
+                {"error": "Nenhum arquivo enviado"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        file = request.FILES['file']
+        
+        # Verificar proposta (opcional)
+        proposal_id = data.get('proposal_id')
+        proposal = None
+        if proposal_id:
+            try:
+                proposal = Proposal.objects.get(id=proposal_id, user=user)
+            except Proposal.DoesNotExist:
+                return Response(
+                    {"error": "Proposta não encontrada"},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+        
+        # Hash do conteúdo para deduplicação do OCR, calculado durante o recebimento
+        file_hash = getattr(file, 'sha256', None) or ocr_cache.compute_document_hash(file)
+        
+        # Hash perceptual de imagens, para detectar fotos novas do mesmo documento
+        perceptual_fields = similarity.hash_fields(file, file.name)
+        
+        # Criar documento
+        document = Document.objects.create(
+            user=user,
+            proposal=proposal,
+            document_type=document_type,
+            file=file,
+            file_name=file.name,
+            mime_type=file.content_type,  # Tipo detectado pelo conteúdo
+            file_size=file.size,
+            file_hash=file_hash,
+            **perceptual_fields
+        )
+        
+        logger.info(
+            "Documento criado com sucesso",
+            document_id=document.id,
+            document_type=document_type,
+            user_id=user.id,
+            file_size=file.size
+        )
+        
+        # Iniciar processamento OCR em background para tipos específicos
+        start_document_ocr(document)
+        
+        # Retornar resposta
+        serializer = DocumentSerializer(document)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        
+    except Exception as e:
+        logger.error(
+            "Erro ao fazer upload de documento",
+            error=str(e),
+            user_id=request.user.id if hasattr(request, 'user') else None
+        )
+        return Response(
+            {"error": str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
 class DocumentUploadView(APIView):
     parser_classes = [MultiPartParser, FormParser]
     
     def post(self, request):
+        return _handle_upload(request)
+
+class DirectUploadView(APIView):
+    """
+    Inicia um upload direto para o storage de objetos (ver direct_uploads.py)
+    
+    Recebe document_type, file_name, file_size, content_type, sha256 (hex) e,
+    opcionalmente, proposal_id; retorna a URL PUT pré-assinada.
+    """
+    
+    def post(self, request):
+        if not direct_uploads.is_enabled():
+            return Response(
+                {"error": "Upload direto indisponível: o storage de mídia não é S3"},
+                status=status.HTTP_501_NOT_IMPLEMENTED
+            )
+        
+        document_type = request.data.get('document_type')
+        file_name = request.data.get('file_name')
+        content_type = request.data.get('content_type')
+        sha256 = request.data.get('sha256')
         try:
-            # Obter usuário
-            user = request.user
-            
-            # Verificar dados
-            document_type = request.data.get('document_type')
-            if not document_type:
-                return Response(
-                    {"error": "Tipo de documento é obrigatório"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            # Verificar se o arquivo foi enviado
-            if 'file' not in request.FILES:
-                return Response(
-                    {"error": "Nenhum arquivo enviado"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            file = request.FILES['file']
-            
-            # Verificar proposta (opcional)
-            proposal_id = request.data.get('proposal_id')
-            proposal = None
-            if proposal_id:
-                try:
-                    proposal = Proposal.objects.get(id=proposal_id, user=user)
-                except Proposal.DoesNotExist:
-                    return Response(
-                        {"error": "Proposta não encontrada"},
-                        status=status.HTTP_404_NOT_FOUND
-                    )
-            
-            # Criar documento
-            document = Document.objects.create(
-                user=user,
-                proposal=proposal,
-                document_type=document_type,
-                file=file,
-                file_name=file.name,
-                mime_type=file.content_type,
-                file_size=file.size
+            file_size = int(request.data.get('file_size'))
+        except (TypeError, ValueError):
+            file_size = None
+        if not (document_type and file_name and content_type and sha256 and file_size is not None):
+            return Response(
+                {"error": "document_type, file_name, file_size, content_type e sha256 são obrigatórios"},
+                status=status.HTTP_400_BAD_REQUEST
             )
-            
-            logger.info(
-                "Documento criado com sucesso",
-                document_id=document.id,
-                document_type=document_type,
-                user_id=user.id,
-                file_size=file.size
-            )
-            
-            # Iniciar processamento OCR em background para tipos específicos
-            if document_type in ['rg', 'cpf', 'proof_income', 'address_proof']:
-                # Enviar tarefa para a fila OCR
-                task = process_document_ocr.apply_async(
-                    args=[document.id],
-                    queue='ocr',
-                    priority=2  # Prioridade normal (valores mais baixos têm prioridade maior)
-                )
-                
-                # Criar objeto OcrResult com o task_id para rastreamento
-                OcrResult.objects.create(
-                    document=document,
-                    ocr_complete=False,
-                    task_id=task.id,
-                    task_status='PENDING',
-                    current_progress=0
-                )
-                
-                logger.info(
-                    "Processamento OCR iniciado",
-                    document_id=document.id,
-                    task_id=task.id,
-                    document_type=document_type
-                )
-            
-            # Retornar resposta
-            serializer = DocumentSerializer(document)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-            
+        
+        proposal_id = request.data.get('proposal_id')
+        if proposal_id and not Proposal.objects.filter(id=proposal_id, user=request.user).exists():
+            return Response(
+                {"error": "Proposta não encontrada"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        try:
+            upload = direct_uploads.create_upload(
+                request.user, document_type, file_name, file_size, content_type, sha256,
+                proposal_id=int(proposal_id) if proposal_id else None
+            )
+        except uploads.UploadRejected as e:
+            return Response({"error": str(e)}, status=e.status_code)
         except Exception as e:
-            logger.error(
-                "Erro ao fazer upload de documento",
-                error=str(e),
-                user_id=request.user.id if hasattr(request, 'user') else None
+            logger.error("Erro ao iniciar upload direto", error=str(e), user_id=request.user.id)
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+        
+        return Response(upload, status=status.HTTP_201_CREATED)
+
+class DirectUploadCompleteView(APIView):
+    """Conclui um upload direto: confere o objeto, cria o documento e envia o OCR"""
+    
+    def post(self, request, upload_id):
+        try:
+            document = direct_uploads.complete_upload(upload_id, request.user)
+        except uploads.UploadRejected as e:
+            return Response({"error": str(e)}, status=e.status_code)
+        except Exception as e:
+            logger.error("Erro ao concluir upload direto", error=str(e), upload_id=upload_id, user_id=request.user.id)
             return Response(
                 {"error": str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+        
+        start_document_ocr(document)
+        
+        serializer = DocumentSerializer(document)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 class DocumentListView(APIView):
     def get(self, request):
@@ -158,30 +262,19 @@ class DocumentDetailView(APIView):
         try:
             document = get_object_or_404(Document, id=pk, user=request.user)
             
-            # Verificar se há uma tarefa OCR em andamento
-            try:
-                ocr_result = OcrResult.objects.get(document=document)
-                if ocr_result.task_id and not ocr_result.ocr_complete:
-                    # Revogar tarefa Celery se estiver em andamento
-                    try:
-                        AsyncResult(ocr_result.task_id).revoke(terminate=True)
-                        logger.info(
-                            "Tarefa OCR revogada",
-                            document_id=document.id,
-                            task_id=ocr_result.task_id
-                        )
-                    except Exception as e:
-                        logger.warning(
-                            "Erro ao revogar tarefa OCR",
-                            error=str(e),
-                            document_id=document.id,
-                            task_id=ocr_result.task_id
-                        )
-            except OcrResult.DoesNotExist:
-                pass
-                
+            # OCR em andamento: cancelamento cooperativo, verificado pelas
+            # tarefas entre as etapas (ver cancellation.py), sem revogar a tarefa
+            ocr_result = OcrResult.objects.filter(document=document).only('task_id', 'ocr_complete').first()
+            if ocr_result is not None and ocr_result.task_id and not ocr_result.ocr_complete:
+                cancellation.request_cancel(document.id)
+                logger.info(
+                    "Cancelamento do OCR solicitado",
+                    document_id=document.id,
+                    task_id=ocr_result.task_id
+                )
+            
             document.is_deleted = True
-            document.save()
+            document.save(update_fields=['is_deleted', 'updated_at'])
             
             logger.info(
                 "Documento marcado como excluído",
@@ -203,80 +296,61 @@ class DocumentDetailView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+def _not_modified(request, etag):
+    """Indica se o cliente já possui a versão identificada por etag (If-None-Match)"""
+    etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    return '*' in etags or etag in etags
+
+def _with_etag(response, etag):
+    # O cliente deve sempre revalidar, mas pode reutilizar o corpo em um 304
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
 class OcrResultView(APIView):
+    """
+    Resultado OCR do documento
+    
+    O ETag vem do status em cache (ver progress.py), gravado a cada alteração
+    do resultado: consultas repetidas sem alteração recebem 304 sem acessar
+    o banco.
+    """
     def get(self, request, document_id):
         try:
-            document = get_object_or_404(Document, id=document_id, user=request.user)
+            state = ocr_progress.get_status(document_id, request.user.id)
             
-            try:
-                ocr_result = OcrResult.objects.get(document=document)
+            if state is not None:
+                etag = ocr_progress.get_etag(state)
+                if _not_modified(request, etag):
+                    return _with_etag(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
                 
-                # Verificar estado atual da tarefa Celery se não estiver completa
-                if not ocr_result.ocr_complete and ocr_result.task_id:
-                    task_result = AsyncResult(ocr_result.task_id)
-                    
-                    # Atualizar status da tarefa no banco de dados
-                    if task_result.state != ocr_result.task_status:
-                        ocr_result.update_task_status(task_result.state)
-                        
-                        # Se a tarefa foi concluída com sucesso, mas o status no banco ainda não foi atualizado
-                        if task_result.state == 'SUCCESS' and not ocr_result.ocr_complete:
-                            # Tarefa concluída, mas o callback não atualizou o status
-                            # Isso pode acontecer se o worker for interrompido antes de salvar o resultado no banco
-                            ocr_result.refresh_from_db()
-                            if not ocr_result.ocr_complete:
-                                logger.warning(
-                                    "Tarefa OCR concluída, mas o status não foi atualizado",
-                                    document_id=document_id,
-                                    task_id=ocr_result.task_id
-                                )
-                                
-                                # Programar nova tarefa para processar o documento
-                                if ocr_result.retry_count < 3:  # Limite de retentativas
-                                    ocr_result.increment_retry()
-                                    task = process_document_ocr.apply_async(
-                                        args=[document.id],
-                                        queue='ocr',
-                                        priority=3  # Prioridade menor para reprocessamento
-                                    )
-                                    ocr_result.task_id = task.id
-                                    ocr_result.task_status = 'PENDING'
-                                    ocr_result.save()
-                
-                serializer = OcrResultSerializer(ocr_result)
-                return Response(serializer.data)
-                
-            except OcrResult.DoesNotExist:
-                # Iniciar processamento OCR automaticamente se ainda não existir
-                task = process_document_ocr.apply_async(
-                    args=[document.id],
-                    queue='ocr'
-                )
-                
-                # Criar objeto para rastreamento
-                ocr_result = OcrResult.objects.create(
-                    document=document,
-                    ocr_complete=False,
-                    task_id=task.id,
-                    task_status='PENDING',
-                    current_progress=0
-                )
-                
-                logger.info(
-                    "Processamento OCR iniciado automaticamente",
-                    document_id=document.id,
-                    task_id=task.id
+                ocr_result = get_object_or_404(
+                    OcrResult.objects.defer('raw_text'), document_id=document_id, document__user=request.user
                 )
-                
-                return Response({
-                    "id": ocr_result.id,
-                    "document": document.id,
-                    "ocr_complete": False,
-                    "task_id": task.id,
-                    "task_status": "PENDING",
-                    "current_progress": 0,
-                    "message": "Processamento OCR iniciado"
-                })
+                serializer = OcrResultSerializer(ocr_result)
+                return _with_etag(Response(serializer.data), etag)
+            
+            # Sem status: o documento ainda não tem OcrResult (ou não pertence ao usuário)
+            document = get_object_or_404(Document, id=document_id, user=request.user)
+            
+            # Iniciar processamento OCR automaticamente
+            ocr_result = lanes.start_ocr(document, lanes.LANE_INTERACTIVE)
+            
+            logger.info(
+                "Processamento OCR iniciado automaticamente",
+                document_id=document.id,
+                task_id=ocr_result.task_id
+            )
+            
+            return Response({
+                "id": ocr_result.id,
+                "document": document.id,
+                "ocr_complete": False,
+                "task_id": ocr_result.task_id,
+                "task_status": "PENDING",
+                "current_progress": 0,
+                "message": "Processamento OCR iniciado"
+            })
             
         except Exception as e:
             logger.error(
@@ -291,129 +365,169 @@ class OcrResultView(APIView):
             )
 
 class OcrStatusView(APIView):
+    """
+    Status do OCR para polling
+    
+    Servido a partir do status em cache (ver progress.py), sem consultar o
+    banco nem o estado da tarefa no Celery; tarefas travadas são reenviadas
+    pela varredura periódica (monitor_pending_ocr_tasks). Respostas levam
+    ETag e consultas sem alteração recebem 304.
+    """
     def get(self, request, document_id):
         try:
-            document = get_object_or_404(Document, id=document_id, user=request.user)
+            state = ocr_progress.get_status(document_id, request.user.id)
             
-            try:
-                ocr_result = OcrResult.objects.get(document=document)
+            if state is not None:
+                etag = ocr_progress.get_etag(state)
+                if _not_modified(request, etag):
+                    return _with_etag(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
                 
-                if ocr_result.ocr_complete:
-                    return Response({
-                        "complete": True,
-                        "progress": 100,
-                        "task_status": ocr_result.task_status or "SUCCESS"
-                    })
-                elif ocr_result.task_id:
-                    # Verificar estado atual da tarefa
-                    task_result = AsyncResult(ocr_result.task_id)
-                    
-                    # Atualizar status da tarefa no banco de dados
-                    if task_result.state != ocr_result.task_status:
-                        ocr_result.update_task_status(task_result.state)
-                    
-                    # Retornar progresso com base no estado da tarefa e progresso atual
-                    progress = ocr_result.current_progress
-                    
-                    # Se a tarefa estiver em um estado terminal e não marcada como completa
-                    if task_result.state in ['SUCCESS', 'FAILURE'] and not ocr_result.ocr_complete:
-                        # Verificar se precisa reagendar a tarefa (caso de falha não detectada)
-                        if task_result.state == 'FAILURE' and ocr_result.retry_count < 3:
-                            ocr_result.increment_retry()
-                            new_task = process_document_ocr.apply_async(
-                                args=[document.id],
-                                queue='ocr',
-                                priority=3
-                            )
-                            ocr_result.task_id = new_task.id
-                            ocr_result.task_status = 'PENDING'
-                            ocr_result.save()
-                            
-                            logger.info(
-                                "Tarefa OCR reagendada após falha",
-                                document_id=document.id,
-                                old_task_id=task_result.id,
-                                new_task_id=new_task.id,
-                                retry_count=ocr_result.retry_count
-                            )
-                            
-                            return Response({
-                                "complete": False,
-                                "progress": 10,  # Reiniciar progresso
-                                "task_status": "PENDING",
-                                "retry_count": ocr_result.retry_count,
-                                "message": "Processamento reiniciado após falha"
-                            })
-                    
-                    return Response({
-                        "complete": False,
-                        "progress": progress,
-                        "task_status": task_result.state,
-                        "retry_count": ocr_result.retry_count
-                    })
-                else:
-                    # Não há task_id, mas o registro existe - caso raro
-                    current_time = timezone.now()
-                    time_since_created = (current_time - ocr_result.created_at).total_seconds()
-                    
-                    # Se foi criado há mais de 1 minuto e ainda não tem task_id, iniciar nova tarefa
-                    if time_since_created > 60:
-                        task = process_document_ocr.apply_async(
-                            args=[document.id],
-                            queue='ocr'
-                        )
-                        
-                        ocr_result.task_id = task.id
-                        ocr_result.task_status = 'PENDING'
-                        ocr_result.save()
-                        
-                        logger.info(
-                            "Nova tarefa OCR iniciada para resultado sem task_id",
-                            document_id=document.id,
-                            task_id=task.id,
-                            ocr_result_id=ocr_result.id
-                        )
-                    
-                    progress = min(int(time_since_created / 20 * 100), 90)
-                    
-                    return Response({
-                        "complete": False,
-                        "progress": progress,
-                        "message": "Processamento em andamento"
-                    })
-                    
-            except OcrResult.DoesNotExist:
-                # Se o resultado ainda não existe, inicie o processamento
-                task = process_document_ocr.apply_async(
-                    args=[document.id],
-                    queue='ocr'
+                data = {
+                    "complete": state['complete'],
+                    "progress": state['progress'],
+                    "task_status": state['task_status'],
+                    "retry_count": state['retry_count']
+                }
+                if state['message']:
+                    data["message"] = state['message']
+                return _with_etag(Response(data), etag)
+            
+            # Sem status: o documento ainda não tem OcrResult (ou não pertence ao usuário)
+            document = get_object_or_404(Document, id=document_id, user=request.user)
+            
+            # Se o resultado ainda não existe, inicie o processamento
+            ocr_result = lanes.start_ocr(document, lanes.LANE_INTERACTIVE)
+            
+            logger.info(
+                "Processamento OCR iniciado via endpoint de status",
+                document_id=document.id,
+                task_id=ocr_result.task_id
+            )
+            
+            return Response({
+                "complete": False,
+                "progress": 5,
+                "task_status": "PENDING",
+                "message": "Processamento OCR iniciado"
+            })
+            
+        except Exception as e:
+            logger.error(
+                "Erro ao verificar status OCR",
+                error=str(e),
+                document_id=document_id,
+                user_id=request.user.id
+            )
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+class OcrRawPayloadView(APIView):
+    """
+    Resposta completa do motor de OCR de um documento, para auditoria
+    
+    Restrita à equipe; o payload comprimido só é lido e descomprimido aqui
+    (ver payloads.py).
+    """
+    permission_classes = [permissions.IsAdminUser]
+    
+    def get(self, request, document_id):
+        try:
+            stored, payload = payloads.load_payload(document_id)
+            if stored is None:
+                return Response(
+                    {"error": "Resposta completa do motor não encontrada"},
+                    status=status.HTTP_404_NOT_FOUND
                 )
-                
-                # Criar objeto para rastreamento
-                OcrResult.objects.create(
-                    document=document,
-                    ocr_complete=False,
-                    task_id=task.id,
-                    task_status='PENDING',
-                    current_progress=0
+            
+            logger.info(
+                "Resposta completa do OCR consultada",
+                document_id=document_id,
+                user_id=request.user.id
+            )
+            
+            return Response({
+                "document": document_id,
+                "engine_name": stored.engine_name,
+                "raw_size": stored.raw_size,
+                "compressed_size": stored.compressed_size,
+                "updated_at": stored.updated_at,
+                "payload": payload
+            })
+            
+        except Exception as e:
+            logger.error(
+                "Erro ao obter resposta completa do OCR",
+                error=str(e),
+                document_id=document_id,
+                user_id=request.user.id
+            )
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+class DocumentDuplicatesView(APIView):
+    """
+    Possíveis duplicatas de um documento por hash perceptual, para revisão de fraude
+    
+    Restrita à equipe. Por padrão lista apenas documentos de outros usuários;
+    ?all=1 inclui os do próprio usuário e ?max_distance= ajusta a tolerância
+    (em bits, ver similarity.py).
+    """
+    permission_classes = [permissions.IsAdminUser]
+    
+    def get(self, request, document_id):
+        document = get_object_or_404(Document, id=document_id)
+        try:
+            if not similarity.ensure_hash(document):
+                return Response(
+                    {"error": "Documento sem imagem para comparação"},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
-                
-                logger.info(
-                    "Processamento OCR iniciado via endpoint de status",
-                    document_id=document.id,
-                    task_id=task.id
+            
+            try:
+                max_distance = int(request.query_params.get('max_distance', similarity.get_max_distance()))
+            except ValueError:
+                return Response(
+                    {"error": "max_distance inválido"},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
-                
-                return Response({
-                    "complete": False,
-                    "progress": 5,
-                    "task_status": "PENDING",
-                    "message": "Processamento OCR iniciado"
-                })
+            
+            queryset = Document.objects.select_related('user').filter(is_deleted=False)
+            if request.query_params.get('all') != '1':
+                queryset = queryset.exclude(user_id=document.user_id)
+            
+            duplicates = similarity.find_near_duplicates(document, max_distance, queryset)
+            
+            logger.info(
+                "Possíveis duplicatas consultadas",
+                document_id=document_id,
+                found=len(duplicates),
+                user_id=request.user.id
+            )
+            
+            return Response({
+                "document": document_id,
+                "max_distance": max_distance,
+                "duplicates": [
+                    {
+                        "document": candidate.id,
+                        "user": candidate.user_id,
+                        "username": candidate.user.username,
+                        "document_type": candidate.document_type,
+                        "verification_status": candidate.verification_status,
+                        "created_at": candidate.created_at,
+                        "distance": distance
+                    }
+                    for candidate, distance in duplicates
+                ]
+            })
             
         except Exception as e:
             logger.error(
-                "Erro ao verificar status OCR",
+                "Erro ao buscar possíveis duplicatas",
                 error=str(e),
                 document_id=document_id,
                 user_id=request.user.id
@@ -445,31 +559,23 @@ class DocumentValidationView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # Verificar se o OCR está completo
+            # Verificar se o OCR está completo (status em cache, ver progress.py)
+            state = ocr_progress.get_status(document.id, request.user.id)
+            
+            if state is not None and not state['complete']:
+                return Response(
+                    {
+                        "is_valid": False,
+                        "validation_errors": ["Processamento OCR em andamento"],
+                        "task_status": state['task_status'],
+                        "progress": state['progress']
+                    },
+                    status=status.HTTP_202_ACCEPTED
+                )
+            
             try:
                 ocr_result = OcrResult.objects.get(document=document)
                 
-                if not ocr_result.ocr_complete:
-                    # Verificar status da tarefa
-                    if ocr_result.task_id:
-                        task_result = AsyncResult(ocr_result.task_id)
-                        
-                        # Se a tarefa já terminou, mas o status não foi atualizado
-                        if task_result.state == 'SUCCESS':
-                            ocr_result.refresh_from_db()
-                            
-                        # Se ainda não está completo após verificação
-                        if not ocr_result.ocr_complete:
-                            return Response(
-                                {
-                                    "is_valid": False,
-                                    "validation_errors": ["Processamento OCR em andamento"],
-                                    "task_status": task_result.state,
-                                    "progress": ocr_result.current_progress
-                                },
-                                status=status.HTTP_202_ACCEPTED
-                            )
-                
                 # Validar documento com base nos dados extraídos pelo OCR
                 extracted_data = ocr_result.extracted_data or {}
                 confidence_score = ocr_result.confidence_score or 0
@@ -511,32 +617,20 @@ class DocumentValidationView(APIView):
                 
             except OcrResult.DoesNotExist:
                 # Iniciar processamento OCR
-                task = process_document_ocr.apply_async(
-                    args=[document.id],
-                    queue='ocr',
-                    priority=1  # Alta prioridade por ser solicitação explícita
-                )
-                
-                # Criar objeto para rastreamento
-                OcrResult.objects.create(
-                    document=document,
-                    ocr_complete=False,
-                    task_id=task.id,
-                    task_status='PENDING',
-                    current_progress=0
-                )
+                # Faixa interativa: o usuário aguarda a validação
+                ocr_result = lanes.start_ocr(document, lanes.LANE_INTERACTIVE)
                 
                 logger.info(
                     "Processamento OCR iniciado via validação",
                     document_id=document.id,
-                    task_id=task.id
+                    task_id=ocr_result.task_id
                 )
                 
                 return Response(
                     {
                         "is_valid": False,
                         "validation_errors": ["Processamento OCR iniciado"],
-                        "task_id": task.id,
+                        "task_id": ocr_result.task_id,
                         "progress": 0
                     },
                     status=status.HTTP_202_ACCEPTED
@@ -558,9 +652,8 @@ class SelfieUploadView(APIView):
     parser_classes = [MultiPartParser, FormParser]
     
     def post(self, request):
-        # Redirecionar para o upload de documento com tipo 'selfie'
-        request.data['document_type'] = 'selfie'
-        return DocumentUploadView().post(request)
+        # Mesmo recebimento do upload de documento, com o tipo fixado
+        return _handle_upload(request, document_type='selfie')
 
 class RequiredDocumentsView(APIView):
     def get(self, request, proposal_id):
@@ -626,4 +719,76 @@ class RequiredDocumentsView(APIView):
             return Response(
                 {"error": str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            ) 
\ No newline at end of file
+            ) 
+class ProposalOcrView(APIView):
+    """
+    OCR do conjunto de documentos de uma proposta (ver proposal_ocr.py)
+    
+    GET retorna o estado e, quando concluído, a validação agregada (nome e
+    CPF conferidos entre os documentos); POST envia o OCR de todos os
+    documentos em paralelo.
+    """
+    
+    def _get_proposal(self, request, proposal_id):
+        if request.user.is_staff:
+            return get_object_or_404(Proposal, id=proposal_id)
+        return get_object_or_404(Proposal, id=proposal_id, user=request.user)
+    
+    def get(self, request, proposal_id):
+        proposal = self._get_proposal(request, proposal_id)
+        try:
+            state = proposal_ocr.get_summary(proposal.id)
+            if state is None:
+                return Response(
+                    {"error": "OCR da proposta não iniciado"},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            return Response(state)
+            
+        except Exception as e:
+            logger.error(
+                "Erro ao obter OCR da proposta",
+                error=str(e),
+                proposal_id=proposal_id,
+                user_id=request.user.id
+            )
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+    
+    def post(self, request, proposal_id):
+        proposal = self._get_proposal(request, proposal_id)
+        try:
+            result = proposal_ocr.start(proposal.id)
+            
+            if result['status'] == 'incomplete':
+                return Response(
+                    {
+                        "error": "Conjunto de documentos incompleto",
+                        "missing_types": result['missing_types']
+                    },
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if result['status'] == 'running':
+                return Response(proposal_ocr.get_summary(proposal.id) or result)
+            
+            logger.info(
+                "Processamento OCR da proposta iniciado manualmente",
+                proposal_id=proposal.id,
+                task_id=result['task_id'],
+                user_id=request.user.id
+            )
+            return Response(result, status=status.HTTP_202_ACCEPTED)
+            
+        except Exception as e:
+            logger.error(
+                "Erro ao iniciar OCR da proposta",
+                error=str(e),
+                proposal_id=proposal_id,
+                user_id=request.user.id
+            )
+            return Response(
+                {"error": str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
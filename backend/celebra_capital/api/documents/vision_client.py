@@ -0,0 +1,173 @@
+"""
+Registro de clientes Google Vision por processo de worker
+
+Cada processo do worker Celery mantém um único ImageAnnotatorClient aquecido,
+criado em worker_process_init, evitando um novo canal gRPC e handshake TLS
+a cada documento processado.
+"""
+import os
+import threading
+import time
+from celery.signals import worker_process_init, worker_process_shutdown
+from django.conf import settings
+import structlog
+
+from .metrics import (
+    VISION_CLIENT_CONNECT_SECONDS,
+    VISION_CLIENT_CONNECT_SAVED_SECONDS,
+    VISION_CLIENT_REUSED,
+)
+
+logger = structlog.get_logger(__name__)
+
+# Tempo máximo aguardando o canal gRPC ficar pronto durante o aquecimento
+WARMUP_TIMEOUT = 10
+
+
+class VisionClientRegistry:
+    """
+    Mantém o cliente Google Vision do processo atual
+
+    O cliente é recriado apenas quando o arquivo de credenciais é alterado
+    (rotação da service account) ou quando o processo foi bifurcado. A renovação
+    do token de acesso é feita sob demanda pelo próprio google-auth.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._client = None
+        self._pid = None
+        self._credentials_mtime = None
+        self._connect_time = 0.0
+
+    def _credentials_path(self):
+        return getattr(settings, 'GOOGLE_CREDENTIALS_JSON', None)
+
+    def _read_credentials_mtime(self):
+        path = self._credentials_path()
+        if not path:
+            return None
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return None
+
+    def _is_stale(self):
+        if self._client is None:
+            return True
+        # Clientes gRPC não sobrevivem a um fork
+        if self._pid != os.getpid():
+            return True
+        return self._read_credentials_mtime() != self._credentials_mtime
+
+    def _connect(self, wait_ready=False):
+        from google.cloud import vision
+        from google.oauth2 import service_account
+
+        start = time.monotonic()
+
+        if getattr(settings, 'GOOGLE_VISION_USE_FAKE', False):
+            from .fake_vision import FakeVisionClient
+            self._client = FakeVisionClient()
+            self._pid = os.getpid()
+            self._credentials_mtime = self._read_credentials_mtime()
+            self._connect_time = 0.0
+            return self._client
+
+        path = self._credentials_path()
+        credentials = None
+        if path:
+            credentials = service_account.Credentials.from_service_account_file(path)
+
+        client = vision.ImageAnnotatorClient(credentials=credentials)
+
+        if wait_ready:
+            # O canal gRPC é preguiçoso: aguardar o handshake TLS para aquecê-lo
+            import grpc
+            try:
+                grpc.channel_ready_future(client.transport.grpc_channel).result(timeout=WARMUP_TIMEOUT)
+            except Exception as e:
+                logger.warning(
+                    "Canal Google Vision não ficou pronto no aquecimento",
+                    error=str(e),
+                    pid=os.getpid()
+                )
+
+        self._client = client
+        self._pid = os.getpid()
+        self._credentials_mtime = self._read_credentials_mtime()
+        self._connect_time = time.monotonic() - start
+        VISION_CLIENT_CONNECT_SECONDS.observe(self._connect_time)
+
+        logger.info(
+            "Cliente Google Vision criado",
+            pid=self._pid,
+            connect_time=f"{self._connect_time:.3f}s"
+        )
+        return client
+
+    def get_client(self):
+        """
+        Retorna o cliente do processo, criando-o se necessário
+        """
+        with self._lock:
+            if self._is_stale():
+                self._close_client()
+                return self._connect()
+
+            VISION_CLIENT_REUSED.inc()
+            VISION_CLIENT_CONNECT_SAVED_SECONDS.inc(self._connect_time)
+            return self._client
+
+    def warm(self):
+        """
+        Cria o cliente e aguarda o canal gRPC ficar pronto (inclui o handshake TLS)
+        """
+        with self._lock:
+            self._close_client()
+            return self._connect(wait_ready=True)
+
+    def _close_client(self):
+        client, self._client = self._client, None
+        if client is None:
+            return
+        # Não fechar canais herdados de outro processo
+        if self._pid != os.getpid():
+            return
+        try:
+            client.transport.close()
+        except Exception as e:
+            logger.warning("Erro ao fechar cliente Google Vision", error=str(e))
+
+    def close(self):
+        """
+        Fecha o canal do cliente do processo atual
+        """
+        with self._lock:
+            self._close_client()
+
+
+registry = VisionClientRegistry()
+
+
+def get_vision_client():
+    """Atalho para o cliente Google Vision do processo atual"""
+    return registry.get_client()
+
+
+@worker_process_init.connect
+def init_vision_client(**kwargs):
+    """Aquece o cliente Google Vision ao iniciar cada processo do worker"""
+    if not getattr(settings, 'USE_GOOGLE_VISION', False):
+        return
+    try:
+        registry.warm()
+    except Exception as e:
+        # O cliente será criado sob demanda na primeira tarefa
+        logger.warning("Erro ao aquecer cliente Google Vision", error=str(e))
+
+
+@worker_process_shutdown.connect
+def shutdown_vision_client(**kwargs):
+    """Fecha o canal gRPC ao encerrar o processo do worker"""
+    registry.close()
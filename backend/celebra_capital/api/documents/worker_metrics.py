@@ -0,0 +1,75 @@
+"""
+Exportação das métricas Prometheus dos workers Celery
+
+Parte das métricas do OCR (reuso do cliente Google Vision, bytes economizados
+no pré-processamento, pico de memória das tarefas) é incrementada dentro das
+tarefas, nos processos filhos dos workers prefork, que não servem /metrics.
+
+Com PROMETHEUS_MULTIPROC_DIR definido no ambiente do worker (antes de
+qualquer importação do prometheus_client), cada processo grava suas métricas
+em arquivos desse diretório. O processo principal do worker soma os arquivos
+de todos os filhos e expõe o resultado por HTTP na porta
+OCR_WORKER_METRICS_PORT, coletada pelo Prometheus em cada worker. Sem as duas
+configurações, nada é exportado.
+"""
+import os
+from django.conf import settings
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+
+def get_multiproc_dir():
+    return os.environ.get('PROMETHEUS_MULTIPROC_DIR') or os.environ.get('prometheus_multiproc_dir')
+
+
+def get_port():
+    return getattr(settings, 'OCR_WORKER_METRICS_PORT', 0)
+
+
+def prepare_multiproc_dir():
+    """
+    Cria o diretório das métricas e remove os arquivos de uma execução anterior
+
+    Deve rodar no processo principal do worker antes de as métricas serem
+    criadas (sinal celeryd_init).
+    """
+    multiproc_dir = get_multiproc_dir()
+    if not multiproc_dir:
+        return False
+
+    os.makedirs(multiproc_dir, exist_ok=True)
+    for name in os.listdir(multiproc_dir):
+        if name.endswith('.db'):
+            os.remove(os.path.join(multiproc_dir, name))
+    return True
+
+
+def start_exporter():
+    """
+    Expõe as métricas somadas dos processos do worker em HTTP
+
+    Returns:
+        Porta do exportador, ou None se desabilitado.
+    """
+    from prometheus_client import CollectorRegistry, start_http_server
+    from prometheus_client.multiprocess import MultiProcessCollector
+
+    port = get_port()
+    if not port or not get_multiproc_dir():
+        return None
+
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry)
+    start_http_server(port, registry=registry)
+
+    logger.info("Exportador de métricas do worker iniciado", port=port, multiproc_dir=get_multiproc_dir())
+    return port
+
+
+def mark_process_dead(pid):
+    """Descarta as métricas de processos filhos encerrados que não devem ser somadas (gauges)"""
+    from prometheus_client import multiprocess
+
+    if get_multiproc_dir():
+        multiprocess.mark_process_dead(pid)
@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 
 import os
 from django.core.asgi import get_asgi_application
+from django.urls import re_path
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 import celebra_capital.api.documents.routing
@@ -16,8 +17,14 @@ import celebra_capital.api.notifications.routing
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'celebra_capital.settings')
 
+django_asgi_app = get_asgi_application()
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    # Acompanhamento do OCR por SSE/long-poll no ASGI; demais rotas vão para o Django
+    "http": URLRouter(
+        celebra_capital.api.documents.routing.http_urlpatterns +
+        [re_path(r'', django_asgi_app)]
+    ),
     "websocket": AuthMiddlewareStack(
         URLRouter(
             celebra_capital.api.documents.routing.websocket_urlpatterns +
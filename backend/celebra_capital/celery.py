@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import celeryd_init, worker_init, worker_process_shutdown
 from django.conf import settings
 import structlog
 
@@ -39,22 +40,7 @@ app.conf.update(
     task_time_limit=600,  # 10 minutos no máximo para qualquer tarefa
     task_soft_time_limit=300,  # Aviso em 5 minutos
     
-    # Configurações de rate limiting para não sobrecarregar serviços externos
-    # Exemplo: 'celebra_capital.api.documents.tasks.process_document_ocr': {'rate_limit': '10/m'},
-    task_routes={
-        'celebra_capital.api.documents.tasks.process_document_ocr': {'queue': 'ocr'},
-        'celebra_capital.api.documents.tasks.*': {'queue': 'documents'},
-        'celebra_capital.api.signatures.tasks.*': {'queue': 'signatures'},
-    },
-    
-    # Configurações de fila
-    task_default_queue='default',
-    task_queues={
-        'default': {'exchange': 'default', 'routing_key': 'default'},
-        'ocr': {'exchange': 'ocr', 'routing_key': 'ocr'},
-        'documents': {'exchange': 'documents', 'routing_key': 'documents'},
-        'signatures': {'exchange': 'signatures', 'routing_key': 'signatures'},
-    },
+    # Filas e rotas (incluindo as faixas de OCR) são definidas apenas em celery_config.py
     
     # Configuração de retries para tarefas
     task_default_retry_delay=30,  # 30 segundos entre tentativas
@@ -75,6 +61,31 @@ def debug_task(self):
     """Tarefa para debug do Celery"""
     logger.info("Celery is working!", task_id=self.request.id)
 
+# Métricas Prometheus dos workers (ver api/documents/worker_metrics.py)
+@celeryd_init.connect
+def prepare_worker_metrics(sender=None, **kwargs):
+    """Prepara o diretório das métricas multiprocesso antes de os processos filhos serem criados"""
+    from celebra_capital.api.documents import worker_metrics
+    
+    worker_metrics.prepare_multiproc_dir()
+
+@worker_init.connect
+def start_worker_metrics(sender=None, **kwargs):
+    """Expõe em HTTP as métricas somadas dos processos do worker"""
+    from celebra_capital.api.documents import worker_metrics
+    
+    try:
+        worker_metrics.start_exporter()
+    except OSError as e:
+        logger.error("Erro ao iniciar exportador de métricas do worker", error=str(e))
+
+@worker_process_shutdown.connect
+def release_worker_metrics(sender=None, pid=None, **kwargs):
+    """Descarta as métricas de processo de um filho encerrado"""
+    from celebra_capital.api.documents import worker_metrics
+    
+    worker_metrics.mark_process_dead(pid)
+
 # Configuração de sinais
 @app.on_after_configure.connect
 def setup_periodic_tasks(sender, **kwargs):
@@ -100,6 +111,13 @@ def setup_periodic_tasks(sender, **kwargs):
         name='cleanup_old_ocr_results',
     )
     
+    # Adicionar uma tarefa para manter o cache de OCR dentro do orçamento
+    sender.add_periodic_task(
+        3600.0,  # A cada hora
+        'celebra_capital.api.documents.tasks.evict_ocr_result_cache',
+        name='evict_ocr_result_cache',
+    )
+    
     # Adicionar uma tarefa para verificar status de assinaturas
     sender.add_periodic_task(
         600.0,  # A cada 10 minutos
@@ -3,6 +3,7 @@ Configurações avançadas do Celery para o processamento de OCR
 """
 import os
 from celery.schedules import crontab
+from kombu import Queue
 from django.conf import settings
 
 # Configurações de broker e backend
@@ -23,43 +24,33 @@ task_time_limit = 600  # 10 minutos no máximo para qualquer tarefa
 task_soft_time_limit = 300  # Aviso em 5 minutos
 
 # Configurações de rotas para direcionar tarefas para filas específicas
+# (única definição de filas e rotas do projeto; celery.py não as redefine)
 task_routes = {
-    'process_document_ocr': {
-        'queue': 'ocr',
-        'exchange': 'ocr',
-        'routing_key': 'ocr',
-    },
-    'update_document_status': {
-        'queue': 'documents',
-        'exchange': 'documents',
-        'routing_key': 'documents',
-    },
-    'run_database_backup': {
-        'queue': 'default',
-        'exchange': 'default',
-        'routing_key': 'default',
-    },
+    # OCR: faixa padrão por padrão; as faixas interativa e de retentativa são
+    # escolhidas explicitamente no envio (ver api/documents/lanes.py)
+    'celebra_capital.api.documents.tasks.process_document_ocr': {'queue': 'ocr_standard'},
+    'celebra_capital.api.documents.tasks.continue_simulated_ocr': {'queue': 'ocr_standard'},
+    'celebra_capital.api.documents.tasks.flush_ocr_batch': {'queue': 'ocr_standard'},
+    'celebra_capital.api.documents.tasks.*': {'queue': 'documents'},
+    'celebra_capital.api.signatures.tasks.*': {'queue': 'signatures'},
+    'update_document_status': {'queue': 'documents'},
+    'run_database_backup': {'queue': 'default'},
 }
 
-# Configurações de fila e prioridades
+# Configurações de fila
+# No broker Redis a prioridade por mensagem é praticamente ignorada: a
+# prioridade do OCR é dada por filas separadas, cada uma com seu pool de workers
 task_default_queue = 'default'
-task_queues = {
-    'default': {
-        'exchange': 'default',
-        'routing_key': 'default',
-        'queue_arguments': {'x-max-priority': 10}
-    },
-    'ocr': {
-        'exchange': 'ocr',
-        'routing_key': 'ocr',
-        'queue_arguments': {'x-max-priority': 10}
-    },
-    'documents': {
-        'exchange': 'documents',
-        'routing_key': 'documents',
-        'queue_arguments': {'x-max-priority': 10}
-    },
-}
+task_queues = (
+    Queue('default', routing_key='default'),
+    Queue('documents', routing_key='documents'),
+    Queue('signatures', routing_key='signatures'),
+    Queue('ocr_interactive', routing_key='ocr_interactive'),  # Usuário aguardando o resultado
+    Queue('ocr_standard', routing_key='ocr_standard'),  # Uploads e lotes (admissão justa por usuário)
+    Queue('ocr_retry', routing_key='ocr_retry'),  # Reprocessamentos
+    Queue('ocr_large', routing_key='ocr_large'),  # Etapas de OCR de arquivos grandes (baixa concorrência)
+    Queue('ocr', routing_key='ocr'),  # Fila antiga, mantida para drenar mensagens já enviadas
+)
 
 # Configuração de retries para tarefas
 task_default_retry_delay = 30  # 30 segundos entre tentativas
@@ -166,6 +166,8 @@ if USE_S3:
     AWS_SECRET_ACCESS_KEY = os.environ.get('AWS_SECRET_ACCESS_KEY')
     AWS_STORAGE_BUCKET_NAME = os.environ.get('AWS_STORAGE_BUCKET_NAME')
     AWS_S3_REGION_NAME = os.environ.get('AWS_S3_REGION_NAME', 'us-east-1')
+    AWS_S3_ENDPOINT_URL = os.environ.get('AWS_S3_ENDPOINT_URL')  # S3 local (ex.: MinIO) em desenvolvimento
+    AWS_S3_SIGNATURE_VERSION = 's3v4'  # URLs pré-assinadas com os cabeçalhos (content-type, checksum) assinados
     AWS_DEFAULT_ACL = None
     AWS_S3_CUSTOM_DOMAIN = f'{AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com'
     AWS_S3_OBJECT_PARAMETERS = {'CacheControl': 'max-age=86400'}
@@ -239,6 +241,118 @@ CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
 # Configurações do OCR
 USE_GOOGLE_VISION = os.environ.get('USE_GOOGLE_VISION', 'False') == 'True'
 GOOGLE_CREDENTIALS_JSON = os.environ.get('GOOGLE_CREDENTIALS_JSON', None)
+GOOGLE_VISION_USE_FAKE = os.environ.get('GOOGLE_VISION_USE_FAKE', 'False') == 'True'  # Cliente local, sem rede
+
+# Envio em lote para o Google Vision (batch annotate)
+OCR_BATCH_ENABLED = os.environ.get('OCR_BATCH_ENABLED', 'False') == 'True'
+OCR_BATCH_MAX_SIZE = int(os.environ.get('OCR_BATCH_MAX_SIZE', '16'))  # Máximo de imagens por requisição
+OCR_BATCH_WINDOW_MS = int(os.environ.get('OCR_BATCH_WINDOW_MS', '500'))  # Janela de coleta
+
+# Motores de OCR (vision, tesseract, fake). Sem motor configurado o OCR é simulado
+OCR_ENGINE_DEFAULT = os.environ.get('OCR_ENGINE_DEFAULT', 'vision' if USE_GOOGLE_VISION else '')
+# Motor por tipo de documento, ex.: "work_card:tesseract,fgts:tesseract"
+OCR_ENGINES_BY_DOCUMENT_TYPE = dict(
+    item.split(':', 1) for item in os.environ.get('OCR_ENGINES_BY_DOCUMENT_TYPE', '').split(',') if ':' in item
+)
+# Motores tentados em ordem quando o principal falha, ex.: "tesseract"
+OCR_ENGINE_FALLBACKS = [item for item in os.environ.get('OCR_ENGINE_FALLBACKS', '').split(',') if item]
+OCR_TESSERACT_MAX_WORKERS = int(os.environ.get('OCR_TESSERACT_MAX_WORKERS', os.cpu_count() or 1))
+OCR_TESSERACT_LANG = os.environ.get('OCR_TESSERACT_LANG', 'por')
+
+# Latência do OCR simulado e do motor fake, cumprida com tarefas agendadas (0 = imediato)
+OCR_FAKE_LATENCY_MS = int(os.environ.get('OCR_FAKE_LATENCY_MS', '2000'))
+OCR_FAKE_LATENCY_DISTRIBUTION = os.environ.get('OCR_FAKE_LATENCY_DISTRIBUTION', 'fixed')  # fixed, uniform, exponential, lognormal
+OCR_FAKE_LATENCY_JITTER = float(os.environ.get('OCR_FAKE_LATENCY_JITTER', '0.5'))
+OCR_FAKE_LATENCY_MAX_MS = int(os.environ.get('OCR_FAKE_LATENCY_MAX_MS', '60000'))
+OCR_FAKE_PROGRESS_STEPS = int(os.environ.get('OCR_FAKE_PROGRESS_STEPS', '4'))
+
+# Governador de taxa compartilhado (token bucket no Redis com ajuste AIMD) para motores remotos
+OCR_RATE_LIMIT_ENABLED = os.environ.get('OCR_RATE_LIMIT_ENABLED', 'True') == 'True'
+OCR_RATE_LIMITED_ENGINES = [item for item in os.environ.get('OCR_RATE_LIMITED_ENGINES', 'vision').split(',') if item]
+OCR_RATE_LIMIT_INITIAL_RATE = float(os.environ.get('OCR_RATE_LIMIT_INITIAL_RATE', '10'))  # Requisições/s
+OCR_RATE_LIMIT_MIN_RATE = float(os.environ.get('OCR_RATE_LIMIT_MIN_RATE', '1'))
+OCR_RATE_LIMIT_MAX_RATE = float(os.environ.get('OCR_RATE_LIMIT_MAX_RATE', '30'))  # Quota padrão do Vision: 1800/min
+OCR_RATE_LIMIT_BURST = int(os.environ.get('OCR_RATE_LIMIT_BURST', '10'))  # Capacidade do bucket
+OCR_RATE_LIMIT_INCREASE = float(os.environ.get('OCR_RATE_LIMIT_INCREASE', '0.5'))  # Aumento aditivo (req/s por segundo)
+OCR_RATE_LIMIT_DECREASE = float(os.environ.get('OCR_RATE_LIMIT_DECREASE', '0.5'))  # Fator multiplicativo em erro de quota
+OCR_RATE_LIMIT_COOLDOWN_MS = int(os.environ.get('OCR_RATE_LIMIT_COOLDOWN_MS', '2000'))
+OCR_RATE_LIMIT_MAX_WAIT_MS = int(os.environ.get('OCR_RATE_LIMIT_MAX_WAIT_MS', '2000'))  # Espera máxima no worker
+# Filas Celery cuja profundidade é exportada em /metrics (ocr_queue_depth)
+OCR_BACKLOG_QUEUES = [item for item in os.environ.get('OCR_BACKLOG_QUEUES', 'ocr_interactive,ocr_standard,ocr_retry,ocr_large,documents').split(',') if item]
+
+# Faixa OCR padrão: documentos de um mesmo usuário na fila do broker ao mesmo tempo
+OCR_FAIR_MAX_IN_FLIGHT_PER_USER = int(os.environ.get('OCR_FAIR_MAX_IN_FLIGHT_PER_USER', '2'))
+OCR_FAIR_SLOT_TIMEOUT = int(os.environ.get('OCR_FAIR_SLOT_TIMEOUT', '900'))  # Segundos até uma vaga não liberada expirar
+
+# Pipeline OCR em etapas: fila de cada etapa (preprocess, recognize, extract, persist), ex.: "preprocess:ocr_cpu,recognize:ocr_io"
+# Etapas sem fila configurada seguem na fila da faixa do documento
+OCR_STAGE_QUEUES = dict(
+    item.split(':', 1) for item in os.environ.get('OCR_STAGE_QUEUES', '').split(',') if ':' in item
+)
+
+# Arquivos grandes: acima do limite, o pré-processamento e o reconhecimento vão para a fila ocr_large (pouca concorrência)
+OCR_LARGE_FILE_THRESHOLD_MB = float(os.environ.get('OCR_LARGE_FILE_THRESHOLD_MB', '10'))
+# Porta HTTP das métricas Prometheus dos workers OCR (requer PROMETHEUS_MULTIPROC_DIR; 0 desabilita)
+OCR_WORKER_METRICS_PORT = int(os.environ.get('OCR_WORKER_METRICS_PORT', '0'))
+# Tamanho máximo de um arquivo enviado inteiro ao motor de OCR (o Google Vision aceita imagens de até 20 MB)
+OCR_MAX_IN_MEMORY_MB = float(os.environ.get('OCR_MAX_IN_MEMORY_MB', '20'))
+
+# OCR do conjunto de documentos de uma proposta (chord): espera máxima pelos documentos
+OCR_PROPOSAL_MAX_WAIT_SECONDS = int(os.environ.get('OCR_PROPOSAL_MAX_WAIT_SECONDS', '900'))
+
+# Pré-processamento das imagens antes do OCR (tons de cinza, resolução, bordas)
+OCR_PREPROCESS_ENABLED = os.environ.get('OCR_PREPROCESS_ENABLED', 'True') == 'True'
+OCR_PREPROCESS_MAX_DIMENSION = int(os.environ.get('OCR_PREPROCESS_MAX_DIMENSION', '3500'))  # Em pixels
+OCR_PREPROCESS_JPEG_QUALITY = int(os.environ.get('OCR_PREPROCESS_JPEG_QUALITY', '90'))
+
+# PDFs com várias páginas: páginas reconhecidas em paralelo (e mantidas em memória)
+OCR_PDF_MAX_CONCURRENCY = int(os.environ.get('OCR_PDF_MAX_CONCURRENCY', '4'))
+
+# Progresso do OCR: mantido no Redis e publicado no WebSocket no máximo a cada intervalo
+OCR_PROGRESS_PUBLISH_INTERVAL_MS = int(os.environ.get('OCR_PROGRESS_PUBLISH_INTERVAL_MS', '500'))
+
+# Acompanhamento do OCR por SSE (ocr/stream/) e long-poll (ocr/wait/) no ASGI
+OCR_STATUS_STREAM_MAX_SECONDS = int(os.environ.get('OCR_STATUS_STREAM_MAX_SECONDS', '300'))
+OCR_STATUS_STREAM_KEEPALIVE_SECONDS = int(os.environ.get('OCR_STATUS_STREAM_KEEPALIVE_SECONDS', '15'))
+OCR_STATUS_LONGPOLL_TIMEOUT = int(os.environ.get('OCR_STATUS_LONGPOLL_TIMEOUT', '25'))
+
+# Varredura de tarefas OCR travadas: linhas bloqueadas e reenfileiradas por bloco
+OCR_MONITOR_CHUNK_SIZE = int(os.environ.get('OCR_MONITOR_CHUNK_SIZE', '500'))
+
+# Retenção de resultados OCR: exclusão em lotes, com arquivamento gzip/JSONL no storage
+OCR_RETENTION_DAYS = int(os.environ.get('OCR_RETENTION_DAYS', '90'))
+OCR_RETENTION_BATCH_SIZE = int(os.environ.get('OCR_RETENTION_BATCH_SIZE', '1000'))
+OCR_RETENTION_BATCH_SLEEP_MS = int(os.environ.get('OCR_RETENTION_BATCH_SLEEP_MS', '200'))  # Pausa entre lotes
+OCR_RETENTION_MAX_SECONDS = int(os.environ.get('OCR_RETENTION_MAX_SECONDS', '240'))  # Tempo máximo por execução
+OCR_ARCHIVE_ENABLED = os.environ.get('OCR_ARCHIVE_ENABLED', 'True') == 'True'
+OCR_ARCHIVE_PREFIX = os.environ.get('OCR_ARCHIVE_PREFIX', 'ocr_archive')
+
+# Cache de resultados OCR por hash de conteúdo (deduplicação de reenvios)
+OCR_CACHE_ENABLED = os.environ.get('OCR_CACHE_ENABLED', 'True') == 'True'
+OCR_CACHE_MAX_ENTRIES = int(os.environ.get('OCR_CACHE_MAX_ENTRIES', '50000'))  # Orçamento de entradas (LRU)
+
+# Quase duplicatas por hash perceptual (dHash): distância máxima em bits e tolerância da confirmação (fração de 256 bits)
+OCR_NEAR_DUPLICATE_ENABLED = os.environ.get('OCR_NEAR_DUPLICATE_ENABLED', 'True') == 'True'
+OCR_NEAR_DUPLICATE_MAX_DISTANCE = int(os.environ.get('OCR_NEAR_DUPLICATE_MAX_DISTANCE', '6'))
+OCR_NEAR_DUPLICATE_CONFIRM_RATIO = float(os.environ.get('OCR_NEAR_DUPLICATE_CONFIRM_RATIO', '0.25'))
+# Reaproveitamento do OCR de quase duplicatas apenas em documentos de identidade (o hash não distingue valores e datas)
+OCR_NEAR_DUPLICATE_REUSE_TYPES = [item for item in os.environ.get('OCR_NEAR_DUPLICATE_REUSE_TYPES', 'rg,cpf').split(',') if item]
+
+# Respostas completas dos motores (caixas de palavras, confiança) comprimidas em tabela separada, para auditoria
+OCR_STORE_RAW_PAYLOAD = os.environ.get('OCR_STORE_RAW_PAYLOAD', 'True') == 'True'
+
+# Upload de documentos: tamanho máximo (MB) por tipo detectado no conteúdo, ex.: "image:20,application/pdf:50"
+# Chaves podem ser o tipo MIME completo ou o principal; tipos sem limite configurado são recusados
+DOCUMENT_UPLOAD_MAX_SIZE_MB = {
+    mime_type: float(size) for mime_type, size in (
+        item.split(':', 1) for item in os.environ.get('DOCUMENT_UPLOAD_MAX_SIZE_MB', 'image:20,application/pdf:50').split(',')
+        if ':' in item
+    )
+}
+DOCUMENT_UPLOAD_TEMP_DIR = os.environ.get('DOCUMENT_UPLOAD_TEMP_DIR')  # Padrão: subdiretório do storage de mídia
+# Upload direto ao S3 por URL pré-assinada (requer USE_S3 e CORS no bucket liberando PUT do frontend)
+DOCUMENT_DIRECT_UPLOAD_ENABLED = os.environ.get('DOCUMENT_DIRECT_UPLOAD_ENABLED', 'True') == 'True'
+DOCUMENT_DIRECT_UPLOAD_EXPIRES_SECONDS = int(os.environ.get('DOCUMENT_DIRECT_UPLOAD_EXPIRES_SECONDS', '900'))
 
 # Sentry Integration
 SENTRY_DSN = os.environ.get('SENTRY_DSN')